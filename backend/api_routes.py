@@ -1,11 +1,19 @@
-from flask import request, jsonify, send_file
+from flask import request, jsonify, Response, stream_with_context
 from pathlib import Path
 from gemini_service import gemini_service
 from elevenlabs_service import eleven_labs_service
-from manim_service import manim_service
-import threading
-import os
+from manim_service import manim_service, VIDEO_ID_PATTERN
+from job_service import job_service, JobQueueFullError
+from video_pipeline import video_pipeline
+from metrics_service import metrics
+from artifact_server import artifact_server
+from hls_service import hls_service
+from thumbnail_service import thumbnail_service
+from manifest_store import manifest_store
+from quiz_service import quiz_service, check_answer, grade_answers, QuizAnswerError
+from settings import settings
 import re
+import uuid
 from werkzeug.utils import secure_filename
 import json
 
@@ -13,224 +21,161 @@ import json
 def register_routes(app):
     """Register all API routes with the Flask app."""
 
+    # Legacy community store, imported into the manifest once at startup
     COMMUNITY_FILE = Path('community_videos.json')
 
-    def load_community_videos():
-        """Load the list of community videos from JSON file."""
-        if not COMMUNITY_FILE.exists():
-            return {}
-        try:
-            with open(COMMUNITY_FILE, 'r') as f:
-                data = json.load(f)
-                # Handle old format (list of IDs) and convert to new format (dict)
-                if isinstance(data, list):
-                    # Migrate old format to new format
-                    return {video_id: {'tags': []} for video_id in data}
-                return data
-        except:
-            return {}
-
-    def save_community_videos(videos_dict):
-        """Save the community videos dictionary to JSON file."""
-        try:
-            with open(COMMUNITY_FILE, 'w') as f:
-                json.dump(videos_dict, f, indent=2)
-            return True
-        except Exception as e:
-            print(f"Error saving community videos: {e}")
-            return False
+    def parse_generate_request():
+        """Read the prompt and optional PDF upload from a generate-video request.
 
-    @app.route('/api/generate-video', methods=['POST'])
-    def generate_video():
-        """Generate a Manim video with synchronized narration.
-        
-        New flow:
-        1. Generate narration script from user prompt (with optional PDF)
-        2. Generate audio with character-level timing data
-        3. Use script + timing to generate synchronized Manim code
-        4. Render video
+        Returns:
+            Tuple of (prompt, pdf_path, long_form); pdf_path is None when no PDF was uploaded
         """
         # Handle both JSON and FormData
         if request.content_type and 'multipart/form-data' in request.content_type:
             prompt = request.form.get('prompt', '')
             pdf_file = request.files.get('pdf', None)
+            long_form = request.form.get('long_form', '').lower() in ('true', '1')
         else:
             data = request.json or {}
             prompt = data.get('prompt', '')
             pdf_file = None
-        
-        if not prompt:
-            return jsonify({'error': 'Prompt is required'}), 400
-        
+            long_form = bool(data.get('long_form', False))
+
         # Handle PDF file if provided
         pdf_path = None
-        if pdf_file and pdf_file.filename:
+        if prompt and pdf_file and pdf_file.filename:
             try:
                 from settings import settings
                 # Create temporary upload directory if needed
                 upload_dir = Path(settings.CODE_DIR).parent / 'temp_uploads'
                 upload_dir.mkdir(exist_ok=True)
-                
-                # Save PDF with secure filename
-                filename = secure_filename(pdf_file.filename)
+
+                # Save PDF with a per-upload prefix so concurrent jobs never share a file
+                filename = f"{uuid.uuid4().hex[:8]}_{secure_filename(pdf_file.filename)}"
                 pdf_path = upload_dir / filename
                 pdf_file.save(str(pdf_path))
                 print(f"[API] PDF uploaded: {pdf_path}")
             except Exception as e:
                 print(f"[API] Error saving PDF: {str(e)}")
                 pdf_path = None
-        
+
+        return prompt, pdf_path, long_form
+
+    def submit_video_job(prompt, pdf_path, long_form=False):
+        """Queue a video pipeline job, returning (job_id, error_response)."""
         try:
-            print(f"\n{'='*60}")
-            print(f"[API] Starting video generation for prompt: {prompt[:50]}...")
-            if pdf_path:
-                print(f"[API] With PDF file: {pdf_path.name}")
-            print(f"{'='*60}\n")
-            
-            # Step 1: Generate narration script first (with PDF if provided)
-            print("[API] Step 1: Generating narration script...")
-            narration_script = eleven_labs_service.generate_script(prompt, pdf_path=pdf_path)
-            print(f"[API] Script generated: {narration_script[:100]}...\n")
-            
-            # Prepare storage for parallel results
-            audio_result = {'path': None, 'script_path': None, 'timing_data': None, 'error': None}
-            video_result = {'path': None, 'manim_code_path': None, 'manim_code': None, 'error': None}
-            
-            # Create an event to signal when audio (and timing data) is ready
-            audio_ready = threading.Event()
-            
-            # Thread 1: Generate audio with timing data
-            def generate_audio():
-                try:
-                    print("[API-AudioThread] Starting audio generation...")
-                    audio_path, script_path, timing_data = eleven_labs_service.generate_audio_with_timestamps(narration_script)
-                    audio_result['path'] = audio_path
-                    audio_result['script_path'] = script_path
-                    audio_result['timing_data'] = timing_data
-                    print(f"[API-AudioThread] Audio generation complete: {audio_path}")
-                    # Signal that audio and timing data are ready
-                    audio_ready.set()
-                except Exception as e:
-                    error_msg = f"{type(e).__name__}: {str(e)}"
-                    print(f"[API-AudioThread ERROR] {error_msg}")
-                    import traceback
-                    traceback.print_exc()
-                    audio_result['error'] = error_msg
-                    audio_ready.set()  # Signal even on error so video thread doesn't hang
-            
-            # Thread 2: Generate Manim code and render video (waits for timing data)
-            def generate_and_render_video():
-                try:
-                    print("[API-VideoThread] Waiting for audio/timing data...")
-                    # Wait for audio thread to complete and provide timing data
-                    audio_ready.wait()
-                    
-                    # Check if audio generation succeeded
-                    if audio_result['error']:
-                        video_result['error'] = f"Cannot generate video: audio generation failed - {audio_result['error']}"
-                        print(f"[API-VideoThread ERROR] {video_result['error']}")
-                        return
-                    
-                    print("[API-VideoThread] Audio ready, generating Manim code...")
-                    # Generate Manim code using script and timing data
-                    manim_code = gemini_service.generate_manim_code_from_script(
-                        prompt, 
-                        narration_script, 
-                        audio_result['timing_data']
-                    )
-                    video_result['manim_code'] = manim_code
-                    
-                    print("[API-VideoThread] Rendering video...")
-                    # Render the video
-                    video_path, manim_code_path = manim_service.render_manim_video(manim_code)
-                    video_result['path'] = video_path
-                    video_result['manim_code_path'] = manim_code_path
-                    print(f"[API-VideoThread] Video rendering complete: {video_path}")
-                except Exception as e:
-                    error_msg = f"{type(e).__name__}: {str(e)}"
-                    print(f"[API-VideoThread ERROR] {error_msg}")
-                    import traceback
-                    traceback.print_exc()
-                    video_result['error'] = error_msg
-            
-            # Start both threads in parallel (after script generation)
-            print("[API] Step 2: Starting parallel audio and video generation threads...")
-            audio_thread = threading.Thread(target=generate_audio)
-            video_thread = threading.Thread(target=generate_and_render_video)
-            
-            audio_thread.start()
-            video_thread.start()
-            
-            # Wait for both to complete
-            audio_thread.join()
-            video_thread.join()
-            print("[API] Both threads completed\n")
-            
-            # Build response
-            response = {
-                'success': True,
-                'script_text': narration_script
-            }
-            
-            # Track if generation succeeded (need both audio and video for final output)
-            if not audio_result['path']:
-                response['audio_error'] = audio_result['error'] or 'Failed to generate audio'
-                response['success'] = False
-            
-            if not video_result['path']:
-                response['video_error'] = video_result['error'] or 'Failed to render video'
-                response['success'] = False
-            
-            # Combine video and audio if both succeeded
-            if video_result['path'] and audio_result['path']:
-                print("[API] Step 3: Combining video and audio...")
-                final_video_path = manim_service.combine_video_audio(
-                    video_result['path'],
-                    audio_result['path']
-                )
-                
-                if final_video_path:
-                    final_video_filename = Path(final_video_path).name
-                    response['final_video_url'] = f'/api/final-video/{final_video_filename}'
-                    response['script_url'] = f'/api/elevenlabs-script/{Path(audio_result["script_path"]).name}'
-                    response['manim_code_url'] = f'/api/manim-code/{Path(video_result["manim_code_path"]).name}'
-                    response['manim_code'] = video_result['manim_code']
-                    
-                    # Extract video ID from filename (e.g., "20251018_195826.mp4" -> "20251018_195826")
-                    video_id_match = re.match(r'(\d{8}_\d{6})\.mp4', final_video_filename)
-                    if video_id_match:
-                        response['video_id'] = video_id_match.group(1)
-                    
-                    print(f"[API] Final video created: {final_video_filename}")
-                else:
-                    print("[API] Warning: Failed to combine video and audio")
-                    response['combine_error'] = 'Failed to combine video and audio'
-                    response['success'] = False
-            
-            # Return error if both failed or combining failed
-            if not response.get('final_video_url'):
-                return jsonify(response), 500
-            
-            # Clean up temporary PDF file if it exists
+            return job_service.submit(video_pipeline.run, prompt, pdf_path=pdf_path, long_form=long_form), None
+        except JobQueueFullError as e:
             if pdf_path and pdf_path.exists():
-                try:
-                    pdf_path.unlink()
-                    print(f"[API] Cleaned up temporary PDF: {pdf_path}")
-                except Exception as e:
-                    print(f"[API] Failed to clean up PDF: {str(e)}")
-            
-            return jsonify(response)
-            
-        except Exception as e:
-            error_msg = f"{type(e).__name__}: {str(e)}"
-            print(f"\n[API ERROR] Video generation failed: {error_msg}")
-            import traceback
-            traceback.print_exc()
-            print(f"{'='*60}\n")
+                pdf_path.unlink()
+            print(f"[API] Rejecting video job: {str(e)}")
+            return None, (jsonify({
+                'error': str(e),
+                'error_type': type(e).__name__,
+                'success': False
+            }), 503)
+
+    @app.route('/api/generate-video', methods=['POST'])
+    def generate_video():
+        """Generate a Manim video with synchronized narration and wait for it.
+
+        Kept for clients that expect the finished video in the response. The
+        work still runs on the bounded job pool; prefer /api/generate-video/jobs
+        so the request thread is released immediately.
+        """
+        prompt, pdf_path, long_form = parse_generate_request()
+        if not prompt:
+            return jsonify({'error': 'Prompt is required'}), 400
+
+        job_id, error_response = submit_video_job(prompt, pdf_path, long_form)
+        if error_response:
+            return error_response
+
+        job = job_service.wait(job_id)
+        if job['error']:
             return jsonify({
-                'error': error_msg,
-                'error_type': type(e).__name__
+                'error': job['error'],
+                'error_type': job['error_type']
             }), 500
+
+        response = job['result']
+        # Return error if any stage failed
+        if not response.get('final_video_url'):
+            return jsonify(response), 500
+        return jsonify(response)
+
+
+    @app.route('/api/generate-video/jobs', methods=['POST'])
+    def submit_generate_video_job():
+        """Queue a video generation job and return its id immediately.
+
+        Accepts the same JSON or multipart body as /api/generate-video.
+        """
+        prompt, pdf_path, long_form = parse_generate_request()
+        if not prompt:
+            return jsonify({'error': 'Prompt is required'}), 400
+
+        job_id, error_response = submit_video_job(prompt, pdf_path, long_form)
+        if error_response:
+            return error_response
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/generate-video/jobs/{job_id}'
+        }), 202
+
+
+    @app.route('/api/generate-video/jobs/<job_id>', methods=['GET'])
+    def get_generate_video_job(job_id):
+        """Poll a video generation job for its stage and, once done, its result."""
+        job = job_service.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+
+
+    @app.route('/api/generate-video/jobs/<job_id>/events', methods=['GET'])
+    def stream_generate_video_job(job_id):
+        """Stream a job's progress as Server-Sent Events.
+
+        Each stage transition is sent as an event named after the stage, with
+        elapsed times and any data that became available (script text, audio
+        URL, final video URL). The stream ends with a 'done' event carrying the
+        full result. Reconnecting clients can send Last-Event-ID to resume.
+        """
+        if job_service.get(job_id) is None:
+            return jsonify({'error': 'Job not found'}), 404
+
+        try:
+            after = int(request.headers.get('Last-Event-ID', -1))
+        except ValueError:
+            after = -1
+
+        def generate():
+            yield 'retry: 3000\n\n'
+            for item in job_service.iter_events(job_id, after=after):
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                index, event = item
+                payload = {
+                    'stage': event['stage'],
+                    'elapsed': round(event['elapsed'], 3),
+                    'stage_seconds': round(event['stage_seconds'], 3),
+                    **event['data'],
+                }
+                if event['stage'] == 'done':
+                    job = job_service.get(job_id) or {}
+                    payload['result'] = job.get('result')
+                    payload['error'] = job.get('error')
+                yield f"id: {index}\nevent: {event['stage']}\ndata: {json.dumps(payload)}\n\n"
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
     
     
     @app.route('/api/generate-narration', methods=['POST'])
@@ -280,148 +225,135 @@ def register_routes(app):
     
 
 
+    def video_entry(row):
+        """Build a gallery entry from a manifest row."""
+        final_video_url = f"/api/final-video/{row['final_video']}"
+        if row['final_video_hash']:
+            final_video_url += f"?v={row['final_video_hash']}"
+        else:
+            final_video_url = artifact_server.versioned_url(
+                final_video_url, manim_service.get_final_video_path(row['final_video'])
+            )
+        entry = {
+            'id': row['video_id'],
+            'final_video_url': final_video_url,
+            'created_at': row['created_at'],
+        }
+        if row['script_file']:
+            entry['script_url'] = f"/api/elevenlabs-script/{row['script_file']}"
+            if row['script_text']:
+                entry['script_text'] = row['script_text']
+        if row['manim_code_file']:
+            entry['manim_code_url'] = f"/api/manim-code/{row['manim_code_file']}"
+        if row['prompt']:
+            entry['prompt'] = row['prompt']
+        if row['duration']:
+            entry['duration'] = row['duration']
+        if row['chapters']:
+            entry['chapters'] = json.loads(row['chapters'])
+        if hls_service.status(row['video_id']) == 'ready':
+            entry['hls_url'] = hls_service.master_url(row['video_id'])
+        # Poster and sprite let the gallery preview a video without fetching the MP4
+        entry.update(thumbnail_service.urls(row['video_id']))
+        if row['tags']:
+            entry['tags'] = row['tags']
+        return entry
+
+    # Videos finished before the manifest existed, then the old JSON community list (first start only)
+    manifest_store.backfill(
+        manim_service.final_videos_dir, manim_service.base_dir / settings.SCRIPTS_DIR, manim_service.code_dir
+    )
+    manifest_store.migrate_community_json(COMMUNITY_FILE)
+
     @app.route('/api/videos', methods=['GET'])
     def get_all_videos():
-        """Get a list of community videos with their associated files.
+        """Get a page of community videos with their associated files, newest first.
 
-        This endpoint scans the filesystem for videos marked as community
-        and matches them with their corresponding audio, script, and code files.
+        Query parameters:
+            limit: Page size (default VIDEO_PAGE_SIZE, at most VIDEO_PAGE_MAX)
+            cursor: 'next_cursor' from the previous page
+            tag: Only videos with at least one of the given tags (repeatable)
 
-        Note: This is a file-based implementation. Can be easily replaced with
-        a database query in the future without changing the API response format.
+        Served from the manifest database with indexed keyset queries, so the
+        cost of a page does not depend on the size of the archive.
         """
         try:
-            from settings import settings
-
-            print("[API-Videos] Fetching community videos...")
-
-            # Load community videos
-            community_videos_dict = load_community_videos()
-            community_video_ids = list(community_videos_dict.keys())
-            print(f"[API-Videos] Found {len(community_video_ids)} community videos")
-
-            # Get all final video files (combined video + audio)
-            final_videos_dir = Path(settings.FINAL_VIDEOS_DIR)
-            if not final_videos_dir.exists():
-                return jsonify({'success': True, 'videos': []})
+            try:
+                limit = int(request.args.get('limit', settings.VIDEO_PAGE_SIZE))
+            except ValueError:
+                return jsonify({'error': 'limit must be an integer'}), 400
+            limit = max(1, min(limit, settings.VIDEO_PAGE_MAX))
+            cursor = request.args.get('cursor') or None
+            if cursor and not re.fullmatch(VIDEO_ID_PATTERN, cursor):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            tags = [tag.strip().lower() for tag in request.args.getlist('tag') if tag.strip()]
+
+            rows, next_cursor = manifest_store.list_shared(limit, cursor=cursor, tags=tags)
+            videos = [video_entry(row) for row in rows]
+            print(f"[API-Videos] Returning {len(videos)} community videos")
 
-            video_files = sorted(final_videos_dir.glob('*.mp4'), key=os.path.getmtime, reverse=True)
+            response = {
+                'success': True,
+                'videos': videos,
+                'next_cursor': next_cursor,
+            }
+            if not cursor:
+                # Tag facets for the filter bar, sent with the first page only
+                response['tags'] = manifest_store.shared_tag_counts()
+            return jsonify(response)
 
-            # Get all audio and script files upfront
-            audio_dir = Path(settings.AUDIO_DIR)
-            script_dir = Path(settings.SCRIPTS_DIR)
-            code_dir = Path(settings.CODE_DIR)
+        except Exception as e:
+            error_msg = f"{type(e).__name__}: {str(e)}"
+            print(f"[API-Videos ERROR] {error_msg}")
+            import traceback
+            traceback.print_exc()
+            return jsonify({
+                'error': error_msg,
+                'error_type': type(e).__name__
+            }), 500
 
-            all_audio_files = {af: af.stat().st_mtime for af in audio_dir.glob('audio_*.mp3')}
-            all_script_files = {sf: sf.stat().st_mtime for sf in script_dir.glob('script_*.txt')}
 
-            # Track which files have been matched to avoid duplicates
-            matched_audio = set()
-            matched_scripts = set()
+    @app.route('/api/videos/search', methods=['GET'])
+    def search_videos():
+        """Search community videos by tag, prompt and narration text, best match first.
 
+        Query parameters:
+            q: Search text; every word must match, the last one as a prefix
+            limit: Page size (default VIDEO_PAGE_SIZE, at most VIDEO_PAGE_MAX)
+            offset: 'next_offset' from the previous page
+            tag: Only videos with at least one of the given tags (repeatable)
+        """
+        try:
+            query = request.args.get('q', '').strip()
+            if not query:
+                return jsonify({'error': 'q is required'}), 400
+            if not manifest_store.search_enabled:
+                return jsonify({'error': 'Search is not available on this server'}), 503
+            try:
+                limit = int(request.args.get('limit', settings.VIDEO_PAGE_SIZE))
+                offset = max(0, int(request.args.get('offset', 0)))
+            except ValueError:
+                return jsonify({'error': 'limit and offset must be integers'}), 400
+            limit = max(1, min(limit, settings.VIDEO_PAGE_MAX))
+            tags = [tag.strip().lower() for tag in request.args.getlist('tag') if tag.strip()]
+
+            rows, next_offset = manifest_store.search_shared(query, limit, offset=offset, tags=tags)
             videos = []
-            for video_path in video_files:
-                # Extract timestamp from filename (e.g., "20251018_195826.mp4")
-                video_filename = video_path.name
-                timestamp_match = re.match(r'(\d{8}_\d{6})\.mp4', video_filename)
-
-                if not timestamp_match:
-                    continue
-
-                timestamp = timestamp_match.group(1)
-
-                # Only include videos marked as community
-                if timestamp not in community_video_ids:
-                    continue
-                video_mtime = video_path.stat().st_mtime
-
-                # Try to find matching audio file
-                # First try exact timestamp match
-                exact_audio = audio_dir / f'audio_{timestamp}.mp3'
-                audio_path = None
-
-                if exact_audio.exists() and exact_audio not in matched_audio:
-                    audio_path = exact_audio
-                    matched_audio.add(exact_audio)
-                else:
-                    # Find closest unmatched audio file by modification time
-                    unmatched_audio = {af: mtime for af, mtime in all_audio_files.items()
-                                      if af not in matched_audio}
-                    if unmatched_audio:
-                        closest_audio = min(
-                            unmatched_audio.keys(),
-                            key=lambda af: abs(unmatched_audio[af] - video_mtime)
-                        )
-                        # Only use if within 2 minutes (120 seconds)
-                        if abs(unmatched_audio[closest_audio] - video_mtime) < 120:
-                            audio_path = closest_audio
-                            matched_audio.add(closest_audio)
-
-                # Try to find matching script file
-                # First try exact timestamp match
-                exact_script = script_dir / f'script_{timestamp}.txt'
-                script_path = None
-                script_text = None
-
-                if exact_script.exists() and exact_script not in matched_scripts:
-                    script_path = exact_script
-                    matched_scripts.add(exact_script)
-                else:
-                    # Find closest unmatched script file by modification time
-                    unmatched_scripts = {sf: mtime for sf, mtime in all_script_files.items()
-                                        if sf not in matched_scripts}
-                    if unmatched_scripts:
-                        closest_script = min(
-                            unmatched_scripts.keys(),
-                            key=lambda sf: abs(unmatched_scripts[sf] - video_mtime)
-                        )
-                        # Only use if within 2 minutes (120 seconds)
-                        if abs(unmatched_scripts[closest_script] - video_mtime) < 120:
-                            script_path = closest_script
-                            matched_scripts.add(closest_script)
-
-                # Read script text if found
-                if script_path:
-                    try:
-                        script_text = script_path.read_text(encoding='utf-8')
-                    except:
-                        script_text = None
-
-                # Try to find matching code file
-                code_files = list(code_dir.glob(f'{timestamp}.py'))
-                code_path = code_files[0] if code_files else None
-
-                # Build video entry with final_video_url
-                video_entry = {
-                    'id': timestamp,
-                    'final_video_url': f'/api/final-video/{video_filename}',
-                    'created_at': os.path.getmtime(video_path)
-                }
-
-                if script_path:
-                    video_entry['script_url'] = f'/api/elevenlabs-script/{script_path.name}'
-                    if script_text:
-                        video_entry['script_text'] = script_text
-
-                if code_path:
-                    video_entry['manim_code_url'] = f'/api/manim-code/{code_path.name}'
-
-                # Add tags if available
-                if timestamp in community_videos_dict:
-                    video_entry['tags'] = community_videos_dict[timestamp].get('tags', [])
-
-                videos.append(video_entry)
-
-            print(f"[API-Videos] Found {len(videos)} videos")
+            for row in rows:
+                entry = video_entry(row)
+                entry['score'] = row['score']
+                videos.append(entry)
+            print(f"[API-Search] '{query[:50]}' matched {len(videos)} videos (offset {offset})")
 
             return jsonify({
                 'success': True,
-                'videos': videos
+                'videos': videos,
+                'next_offset': next_offset,
             })
 
         except Exception as e:
             error_msg = f"{type(e).__name__}: {str(e)}"
-            print(f"[API-Videos ERROR] {error_msg}")
+            print(f"[API-Search ERROR] {error_msg}")
             import traceback
             traceback.print_exc()
             return jsonify({
@@ -446,6 +378,9 @@ def register_routes(app):
                     'success': False
                 }), 404
 
+            # Publishing is when the gallery needs a preview; a no-op if one already exists
+            thumbnail_service.schedule(video_id, video_path)
+
             # Get tags from request body
             data = request.json or {}
             tags = data.get('tags', [])
@@ -455,14 +390,20 @@ def register_routes(app):
                 tags = []
             tags = [str(tag).strip().lower() for tag in tags if tag][:5]
 
-            # Load current community videos
-            community_videos = load_community_videos()
+            # Videos muxed outside the pipeline (e.g. by download-video) enter the manifest here
+            result = manifest_store.share(video_id, tags)
+            if result is None:
+                manifest_store.backfill(
+                    manim_service.final_videos_dir, manim_service.base_dir / settings.SCRIPTS_DIR, manim_service.code_dir
+                )
+                result = manifest_store.share(video_id, tags)
+            if result is None:
+                return jsonify({
+                    'error': 'Video not found',
+                    'success': False
+                }), 404
 
-            # Check if already shared
-            if video_id in community_videos:
-                # Update tags if provided
-                community_videos[video_id]['tags'] = tags
-                save_community_videos(community_videos)
+            if result == 'updated':
                 return jsonify({
                     'success': True,
                     'message': 'Video already shared to community, tags updated',
@@ -470,24 +411,13 @@ def register_routes(app):
                     'tags': tags
                 })
 
-            # Add to community with tags
-            community_videos[video_id] = {
+            print(f"[API-Community] Video {video_id} shared to community with tags: {tags}")
+            return jsonify({
+                'success': True,
+                'message': 'Video shared to community',
+                'video_id': video_id,
                 'tags': tags
-            }
-
-            if save_community_videos(community_videos):
-                print(f"[API-Community] Video {video_id} shared to community with tags: {tags}")
-                return jsonify({
-                    'success': True,
-                    'message': 'Video shared to community',
-                    'video_id': video_id,
-                    'tags': tags
-                })
-            else:
-                return jsonify({
-                    'error': 'Failed to save community data',
-                    'success': False
-                }), 500
+            })
 
         except Exception as e:
             error_msg = f"{type(e).__name__}: {str(e)}"
@@ -505,31 +435,18 @@ def register_routes(app):
     def remove_from_community(video_id):
         """Remove a video from the community."""
         try:
-            # Load current community videos
-            community_videos = load_community_videos()
-
-            # Check if video is in community
-            if video_id not in community_videos:
+            if not manifest_store.unshare(video_id):
                 return jsonify({
                     'success': True,
                     'message': 'Video not in community'
                 })
 
-            # Remove from community
-            del community_videos[video_id]
-
-            if save_community_videos(community_videos):
-                print(f"[API-Community] Video {video_id} removed from community")
-                return jsonify({
-                    'success': True,
-                    'message': 'Video removed from community',
-                    'video_id': video_id
-                })
-            else:
-                return jsonify({
-                    'error': 'Failed to save community data',
-                    'success': False
-                }), 500
+            print(f"[API-Community] Video {video_id} removed from community")
+            return jsonify({
+                'success': True,
+                'message': 'Video removed from community',
+                'video_id': video_id
+            })
 
         except Exception as e:
             error_msg = f"{type(e).__name__}: {str(e)}"
@@ -543,25 +460,43 @@ def register_routes(app):
             }), 500
 
 
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Expose pipeline stage latencies, cache counters and queue gauges for Prometheus."""
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
     # ==================== Resource Endpoints ====================
 
     @app.route('/api/manim-video/<filename>', methods=['GET'])
     def get_manim_video(filename):
         """Serve Manim video files."""
-        video_path = manim_service.get_video_path(filename)
-        if video_path.exists():
-            return send_file(video_path, mimetype='video/mp4')
+        video_path = artifact_server.resolve(manim_service.video_dir, filename)
+        if video_path:
+            return artifact_server.serve(video_path, mimetype='video/mp4', kind='manim_video')
         return jsonify({'error': 'Video not found'}), 404
 
 
     @app.route('/api/download-video/<video_id>', methods=['GET'])
     def download_video_with_audio(video_id):
-        """Download video merged with audio."""
+        """Download video merged with audio.
+
+        Serves the final video the pipeline already muxed. Only renders that
+        were never muxed are combined here, through the same mux as the
+        pipeline, and the result is kept as the final video.
+        """
         from settings import settings
-        import subprocess
-        import tempfile
+
+        if not re.fullmatch(VIDEO_ID_PATTERN, video_id):
+            return jsonify({'error': 'Video not found'}), 404
+        download_name = f'animation_{video_id}.mp4'
 
         try:
+            final_video_path = manim_service.get_final_video_path(f'{video_id}.mp4')
+            if final_video_path.exists():
+                return artifact_server.serve(final_video_path, mimetype='video/mp4', download_name=download_name,
+                                             kind='download')
+
             # Get video path
             video_path = Path(settings.OUTPUT_DIR) / f'{video_id}.mp4'
             if not video_path.exists():
@@ -573,72 +508,46 @@ def register_routes(app):
             # If no audio, just serve the video
             if not audio_path.exists():
                 print(f"[API-Download] No audio found for {video_id}, serving video only")
-                return send_file(video_path, mimetype='video/mp4', as_attachment=True, download_name=f'animation_{video_id}.mp4')
-
-            # Create temporary file for merged output
-            merged_output = Path(settings.OUTPUT_DIR) / f'{video_id}_merged.mp4'
-
-            # Check if merged file already exists
-            if merged_output.exists():
-                print(f"[API-Download] Using cached merged video: {merged_output}")
-                return send_file(merged_output, mimetype='video/mp4', as_attachment=True, download_name=f'animation_{video_id}.mp4')
+                return artifact_server.serve(video_path, mimetype='video/mp4', download_name=download_name, kind='download')
 
             print(f"[API-Download] Merging video and audio for {video_id}...")
-
-            # Use ffmpeg to merge video and audio
-            # -i: input file
-            # -map 0:v: take video from first input
-            # -map 1:a: take audio from second input
-            # -c:v copy: don't re-encode video (faster)
-            # -c:a aac: encode audio as AAC (compatible)
-            # -shortest: end when shortest stream ends
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-i', str(video_path),
-                '-i', str(audio_path),
-                '-map', '0:v',
-                '-map', '1:a',
-                '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-shortest',
-                '-y',  # Overwrite output file if exists
-                str(merged_output)
-            ]
-
-            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-
-            if result.returncode != 0:
-                print(f"[API-Download ERROR] ffmpeg failed: {result.stderr}")
+            merged_path = manim_service.combine_video_audio(
+                str(video_path), manim_service.prepare_mux_audio(str(audio_path))
+            )
+            if not merged_path:
                 # Fallback to video only
-                return send_file(video_path, mimetype='video/mp4', as_attachment=True, download_name=f'animation_{video_id}.mp4')
-
-            print(f"[API-Download] Successfully merged video and audio")
+                return artifact_server.serve(video_path, mimetype='video/mp4', download_name=download_name, kind='download')
 
-            # Serve the merged file
-            return send_file(merged_output, mimetype='video/mp4', as_attachment=True, download_name=f'animation_{video_id}.mp4')
+            return artifact_server.serve(merged_path, mimetype='video/mp4', download_name=download_name, kind='download')
 
         except Exception as e:
             error_msg = f"{type(e).__name__}: {str(e)}"
             print(f"[API-Download ERROR] {error_msg}")
             import traceback
             traceback.print_exc()
-
-            # Fallback to video only on error
-            if video_path.exists():
-                return send_file(video_path, mimetype='video/mp4', as_attachment=True, download_name=f'animation_{video_id}.mp4')
-
             return jsonify({
                 'error': error_msg,
                 'error_type': type(e).__name__
             }), 500
     
     
+    @app.route('/api/elevenlabs-audio/<filename>', methods=['GET'])
+    def get_elevenlabs_audio(filename):
+        """Serve ElevenLabs narration audio files."""
+        from settings import settings
+        audio_path = artifact_server.resolve(settings.AUDIO_DIR, filename)
+        if audio_path:
+            mimetype = 'audio/mp4' if audio_path.suffix == '.m4a' else 'audio/mpeg'
+            return artifact_server.serve(audio_path, mimetype=mimetype, kind='audio')
+        return jsonify({'error': 'Audio not found'}), 404
+    
+    
     @app.route('/api/manim-code/<filename>', methods=['GET'])
     def get_manim_code(filename):
         """Serve Manim code/script files."""
-        script_path = manim_service.get_script_path(filename)
-        if script_path.exists():
-            return send_file(script_path, mimetype='text/plain')
+        script_path = artifact_server.resolve(manim_service.code_dir, filename)
+        if script_path:
+            return artifact_server.serve(script_path, mimetype='text/plain', kind='manim_code')
         return jsonify({'error': 'Script not found'}), 404
     
     
@@ -646,149 +555,140 @@ def register_routes(app):
     def get_elevenlabs_script(filename):
         """Serve ElevenLabs narration script files."""
         from settings import settings
-        script_path = Path(settings.SCRIPTS_DIR) / filename
-        if script_path.exists():
-            return send_file(script_path, mimetype='text/plain')
+        script_path = artifact_server.resolve(settings.SCRIPTS_DIR, filename)
+        if script_path:
+            return artifact_server.serve(script_path, mimetype='text/plain', kind='script')
         return jsonify({'error': 'Narration script not found'}), 404
     
     
     @app.route('/api/final-video/<filename>', methods=['GET'])
     def get_final_video(filename):
-        """Serve final combined video files (video + audio)."""
-        final_video_path = manim_service.get_final_video_path(filename)
-        if final_video_path.exists():
-            return send_file(final_video_path, mimetype='video/mp4')
+        """Serve final combined video files (video + audio) and their poster and sprite images.
+
+        Only <id>.mp4 and the preview names thumbnail_service publishes are
+        served, never in-flight temporary files or anything else in the folder.
+        """
+        match = re.match(VIDEO_ID_PATTERN, filename)
+        video_id = match.group(0) if match else None
+        if video_id and filename == f"{video_id}.mp4":
+            kind = 'final_video'
+        elif video_id and filename in (thumbnail_service.poster_path(video_id).name,
+                                       thumbnail_service.sprite_path(video_id).name):
+            kind = 'thumbnail'
+        else:
+            return jsonify({'error': 'Final video not found'}), 404
+
+        final_video_path = artifact_server.resolve(manim_service.final_videos_dir, filename)
+        if final_video_path:
+            if kind == 'thumbnail':
+                return artifact_server.serve(final_video_path, kind=kind)
+            return artifact_server.serve(final_video_path, mimetype='video/mp4', kind=kind)
         return jsonify({'error': 'Final video not found'}), 404
 
 
+    @app.route('/api/hls/<video_id>/<path:filename>', methods=['GET'])
+    def get_hls_file(video_id, filename):
+        """Serve HLS playlists and fMP4 segments of a packaged final video.
+
+        Packaging runs in the background after the mux; a video that has not
+        been packaged yet is queued on first request and answers 404 with
+        status 'pending' until it is ready. If packaging failed, requests get
+        503 with status 'failed' until the retry backoff has passed.
+        """
+        if not re.fullmatch(VIDEO_ID_PATTERN, video_id):
+            return jsonify({'error': 'Video not found'}), 404
+
+        hls_path = artifact_server.resolve(hls_service.package_dir(video_id), filename)
+        if hls_path:
+            if hls_path.suffix == '.m3u8':
+                return artifact_server.serve(hls_path, mimetype='application/vnd.apple.mpegurl', kind='hls_playlist')
+            # Published packages are never rewritten in place, so their segments can be cached forever
+            mimetype = 'video/iso.segment' if hls_path.suffix == '.m4s' else 'video/mp4'
+            return artifact_server.serve(hls_path, mimetype=mimetype, kind='hls_segment', immutable=True)
+
+        failure = hls_service.failure(video_id)
+        if failure:
+            response = jsonify({'error': 'HLS packaging failed', 'status': 'failed'})
+            response.headers['Retry-After'] = str(failure['retry_after'])
+            return response, 503
+        final_video_path = manim_service.get_final_video_path(f'{video_id}.mp4')
+        if final_video_path.exists() and hls_service.schedule(video_id, final_video_path):
+            return jsonify({'error': 'HLS package not ready', 'status': 'pending'}), 404
+        return jsonify({'error': 'HLS package not found'}), 404
+
+
     @app.route('/api/generate-quiz', methods=['POST'])
     def generate_quiz():
-        """Generate quiz questions based on a topic using Gemini."""
+        """Return the quiz for a video, or generate one for a topic using Gemini.
+
+        With a video_id, the quiz stored for that video (normally generated by
+        the pipeline from its narration) is returned without calling the model;
+        if there is none yet it is generated from the video's narration once and
+        stored. A video_id that is not in the manifest gets a 404, so quiz ids
+        cannot be claimed ahead of their videos. Without a video_id a new quiz
+        is generated from the prompt alone.
+        """
         data = request.json or {}
         prompt = data.get('prompt', '')
         video_id = data.get('video_id', None)
 
-        if not prompt:
-            return jsonify({'error': 'Prompt is required'}), 400
+        if video_id is not None and not re.fullmatch(VIDEO_ID_PATTERN, str(video_id)):
+            return jsonify({'error': 'Invalid video_id'}), 400
 
         try:
-            print(f"\n[API-Quiz] Generating quiz for prompt: {prompt[:50]}...")
-
-            # Call Gemini to generate quiz questions
-            quiz_prompt = f"""Generate a quiz with 4-5 questions about the following topic: {prompt}
-
-Requirements:
-1. Include a mix of question types:
-   - At least 1 step-by-step problem (for procedural topics like math/science)
-   - 1-2 multiple choice questions
-   - 1 fill-in-blank question
-
-2. For step-by-step questions:
-   - Break down the problem into 2-4 sequential stages
-   - Each stage should have:
-     * Clear prompt asking what to do
-     * Single correct answer
-     * Helpful hint
-     * Brief explanation
-
-3. For multiple choice questions:
-   - Provide 4 options
-   - Only one correct answer
-   - Include explanation
-
-4. For fill-in-blank questions:
-   - Can have multiple acceptable answers (synonyms)
-   - Include explanation
-
-5. Return ONLY valid JSON in this exact format (no markdown, no code blocks):
-{{
-  "questions": [
-    {{
-      "id": 1,
-      "type": "step-by-step",
-      "question_text": "Solve for x: 2x + 5 = 13",
-      "stages": [
-        {{
-          "stage_number": 1,
-          "prompt": "Subtract 5 from both sides. What is the result?",
-          "correct_answer": "2x = 8",
-          "hint": "Remember: what you do to one side, do to the other",
-          "explanation": "13 - 5 = 8, so we get 2x = 8"
-        }}
-      ]
-    }},
-    {{
-      "id": 2,
-      "type": "multiple-choice",
-      "question_text": "Which property was used in the first step?",
-      "options": ["Addition", "Subtraction", "Multiplication", "Division"],
-      "correct_answer": "Subtraction",
-      "explanation": "We subtracted 5 from both sides"
-    }},
-    {{
-      "id": 3,
-      "type": "fill-in-blank",
-      "question_text": "The equation 2x + 5 = 13 is called a _____ equation.",
-      "correct_answers": ["linear", "first-degree"],
-      "case_sensitive": false,
-      "explanation": "This is a linear equation because x has a degree of 1"
-    }}
-  ]
-}}
-
-Topic: {prompt}
-Difficulty: intermediate
-
-Remember: Return ONLY the JSON object, no other text or formatting."""
-
-            response = gemini_service.client.models.generate_content(
-                model='gemini-2.0-flash-exp',
-                contents=quiz_prompt
-            )
-
-            quiz_text = response.text.strip()
-
-            # Clean up the response - remove markdown code blocks if present
-            if quiz_text.startswith('```'):
-                # Remove markdown code blocks
-                quiz_text = re.sub(r'^```(?:json)?\n', '', quiz_text)
-                quiz_text = re.sub(r'\n```$', '', quiz_text)
-                quiz_text = quiz_text.strip()
+            if video_id:
+                quiz_record = quiz_service.get_video_quiz(video_id)
+                generated = False
+                if quiz_record is None:
+                    video = manifest_store.get_video(video_id)
+                    if video is None:
+                        return jsonify({'error': 'Video not found'}), 404
+                    prompt = video['prompt'] or prompt
+                    if not prompt:
+                        return jsonify({'error': 'Prompt is required'}), 400
+                    print(f"\n[API-Quiz] Generating quiz for video {video_id}...")
+                    quiz_record, generated = quiz_service.video_quiz(
+                        video_id, prompt, video['script_text']
+                    )
+                else:
+                    print(f"[API-Quiz] Serving stored quiz for video {video_id}")
 
-            # Parse JSON
-            quiz_data = json.loads(quiz_text)
+                return jsonify({
+                    'success': True,
+                    'quiz_id': quiz_record['quiz_id'],
+                    'questions': quiz_record['questions'],
+                    'cached': not generated
+                })
 
-            print(f"[API-Quiz] Generated {len(quiz_data.get('questions', []))} questions")
+            if not prompt:
+                return jsonify({'error': 'Prompt is required'}), 400
 
-            # Store quiz in JSON file (simple storage for now)
-            quiz_storage_dir = Path('quiz_data')
-            quiz_storage_dir.mkdir(exist_ok=True)
+            print(f"\n[API-Quiz] Generating quiz for prompt: {prompt[:50]}...")
+            questions = gemini_service.generate_quiz(prompt)
 
-            # Generate quiz ID
+            # Generate quiz ID; the prefix keeps it apart from video ids, which name video quizzes
             from datetime import datetime
-            quiz_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+            quiz_id = f"prompt_{manim_service.generate_video_id()}"
 
-            quiz_file = quiz_storage_dir / f'quiz_{quiz_id}.json'
-            with open(quiz_file, 'w') as f:
-                json.dump({
-                    'quiz_id': quiz_id,
-                    'video_id': video_id,
-                    'prompt': prompt,
-                    'questions': quiz_data.get('questions', []),
-                    'created_at': quiz_id
-                }, f, indent=2)
+            # Store quiz in JSON file; answer checks read the compiled copy this also caches
+            quiz_file = quiz_service.save_quiz(quiz_id, {
+                'quiz_id': quiz_id,
+                'video_id': None,
+                'prompt': prompt,
+                'questions': questions,
+                'created_at': datetime.now().strftime('%Y%m%d_%H%M%S')
+            })
 
             print(f"[API-Quiz] Quiz saved: {quiz_file}")
 
             return jsonify({
                 'success': True,
                 'quiz_id': quiz_id,
-                'questions': quiz_data.get('questions', [])
+                'questions': questions
             })
 
-        except json.JSONDecodeError as e:
-            print(f"[API-Quiz ERROR] Failed to parse JSON: {str(e)}")
-            print(f"[API-Quiz ERROR] Response text: {quiz_text}")
+        except ValueError as e:
+            print(f"[API-Quiz ERROR] {str(e)}")
             return jsonify({
                 'error': 'Failed to parse quiz data',
                 'details': str(e)
@@ -817,73 +717,51 @@ Remember: Return ONLY the JSON object, no other text or formatting."""
             return jsonify({'error': 'Missing required fields'}), 400
 
         try:
-            # Load quiz data
-            quiz_file = Path('quiz_data') / f'quiz_{quiz_id}.json'
-            if not quiz_file.exists():
+            # Compiled quizzes are cached, so a check is dictionary lookups with no file read
+            quiz = quiz_service.get_compiled(quiz_id)
+            if quiz is None:
                 return jsonify({'error': 'Quiz not found'}), 404
 
-            with open(quiz_file, 'r') as f:
-                quiz_data = json.load(f)
-
-            # Find the question
-            questions = quiz_data.get('questions', [])
-            question = next((q for q in questions if q['id'] == question_id), None)
-
-            if not question:
-                return jsonify({'error': 'Question not found'}), 404
-
-            # Validate based on question type
-            question_type = question.get('type')
-            is_correct = False
-            explanation = ''
-
-            # Helper function to normalize answer (remove extra spaces, lowercase)
-            def normalize_answer(ans):
-                import re
-                # Remove extra whitespace and convert to lowercase
-                return re.sub(r'\s+', ' ', ans.strip().lower())
-
-            if question_type == 'step-by-step':
-                if stage_number is None:
-                    return jsonify({'error': 'stage_number required for step-by-step questions'}), 400
-
-                stages = question.get('stages', [])
-                stage = next((s for s in stages if s['stage_number'] == stage_number), None)
+            try:
+                result = check_answer(quiz, question_id, stage_number, user_answer)
+            except QuizAnswerError as e:
+                return jsonify({'error': str(e)}), e.status
 
-                if not stage:
-                    return jsonify({'error': 'Stage not found'}), 404
+            return jsonify(result)
 
-                correct_answer = normalize_answer(stage.get('correct_answer', ''))
-                user_normalized = normalize_answer(user_answer)
-                is_correct = user_normalized == correct_answer
-                explanation = stage.get('explanation', '')
+        except Exception as e:
+            error_msg = f"{type(e).__name__}: {str(e)}"
+            print(f"[API-Validate ERROR] Validation failed: {error_msg}")
+            return jsonify({
+                'error': error_msg
+            }), 500
 
-            elif question_type == 'multiple-choice':
-                correct_answer = normalize_answer(question.get('correct_answer', ''))
-                user_normalized = normalize_answer(user_answer)
-                is_correct = user_normalized == correct_answer
-                explanation = question.get('explanation', '')
 
-            elif question_type == 'fill-in-blank':
-                correct_answers = question.get('correct_answers', [])
-                case_sensitive = question.get('case_sensitive', False)
+    @app.route('/api/quiz/validate-batch', methods=['POST'])
+    def validate_quiz_answers():
+        """Grade every answer of a quiz submission in one request."""
+        data = request.json or {}
+        quiz_id = data.get('quiz_id')
+        answers = data.get('answers')
 
-                if case_sensitive:
-                    is_correct = user_answer.strip() in [ans.strip() for ans in correct_answers]
-                else:
-                    user_normalized = normalize_answer(user_answer)
-                    is_correct = user_normalized in [normalize_answer(ans) for ans in correct_answers]
+        if not quiz_id or not isinstance(answers, list):
+            return jsonify({'error': 'quiz_id and an answers list are required'}), 400
+        if len(answers) > settings.QUIZ_BATCH_MAX_ANSWERS:
+            return jsonify({'error': f'At most {settings.QUIZ_BATCH_MAX_ANSWERS} answers per request'}), 400
 
-                explanation = question.get('explanation', '')
+        try:
+            quiz = quiz_service.get_compiled(quiz_id)
+            if quiz is None:
+                return jsonify({'error': 'Quiz not found'}), 404
 
-            return jsonify({
-                'correct': is_correct,
-                'explanation': explanation
-            })
+            grade = grade_answers(quiz, answers)
+            print(f"[API-Validate] Graded {len(answers)} answers for quiz {quiz_id}: "
+                  f"{grade['score']['correct']}/{grade['score']['total']}")
+            return jsonify({'success': True, 'quiz_id': quiz_id, **grade})
 
         except Exception as e:
             error_msg = f"{type(e).__name__}: {str(e)}"
-            print(f"[API-Validate ERROR] Validation failed: {error_msg}")
+            print(f"[API-Validate ERROR] Batch validation failed: {error_msg}")
             return jsonify({
                 'error': error_msg
-            }), 500
\ No newline at end of file
+            }), 500
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from pathlib import Path
+from flask import request, send_file, Response
+from werkzeug.security import safe_join
+from settings import settings
+from cache_service import hash_file
+from metrics_service import metrics
+import mimetypes
+import threading
+
+# Artifacts never change after they are written, so a URL carrying their content hash can be cached forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Unversioned URLs may be served before the pipeline has finished writing the artifact; revalidate them
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class ArtifactServer:
+    """Serves generated files with strong ETags, byte ranges and long-lived caching.
+
+    ETags are a hash of the file's contents (memoized per path, size and
+    mtime), so every replica and every restart agrees on them. A request whose
+    `v` query parameter matches that hash is for a content-addressed URL and is
+    marked immutable; other requests revalidate cheaply with If-None-Match.
+
+    With ARTIFACT_SENDFILE_MODE set to 'x-accel' (nginx) or 'x-sendfile'
+    (Apache, lighttpd) the body, Range requests included, is left to the
+    fronting server and the app worker only sends headers.
+    """
+
+    def __init__(self, base_dir, mode: str = None, accel_prefix: str = None, max_hashes: int = 4096):
+        self.base_dir = Path(base_dir).resolve()
+        self.mode = (mode or '').lower()
+        self.accel_prefix = (accel_prefix or '').rstrip('/')
+        self.max_hashes = max_hashes
+        self._hashes = OrderedDict()  # (path, size, mtime_ns) -> content hash
+        self._lock = threading.Lock()
+
+    def resolve(self, directory, filename: str):
+        """Return the file under directory named filename, or None (rejects path traversal)."""
+        joined = safe_join(str(Path(directory).resolve()), filename)
+        if joined is None:
+            return None
+        path = Path(joined)
+        return path if path.is_file() else None
+
+    def content_hash(self, path) -> str:
+        """Short content hash of a file, recomputed only when its size or mtime changes."""
+        path = Path(path)
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._hashes:
+                self._hashes.move_to_end(key)
+                return self._hashes[key]
+
+        digest = hash_file(path)[:32]
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > self.max_hashes:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def versioned_url(self, url: str, path) -> str:
+        """Append the content hash to an artifact URL so it can be cached as immutable."""
+        try:
+            return f"{url}?v={self.content_hash(path)}"
+        except OSError:
+            return url
+
+    def serve(self, path, mimetype: str = None, download_name: str = None, kind: str = 'artifact',
+              immutable: bool = False):
+        """
+        Build the response for one artifact.
+
+        Args:
+            path: File to serve (already resolved and checked to exist)
+            mimetype: Content type (default: guessed from the file name)
+            download_name: Serve as an attachment with this file name
+            kind: Label for the artifact_requests_total metric
+            immutable: The file behind this URL never changes (e.g. a published HLS segment)
+
+        Returns:
+            A Flask response: 200/206 with the body or an offload header, or 304
+        """
+        path = Path(path)
+        mimetype = mimetype or mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        etag = self.content_hash(path)
+        immutable = immutable or request.args.get('v') == etag
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+
+        offload_header = None
+        if self.mode == 'x-accel' and path.resolve().is_relative_to(self.base_dir):
+            relative = path.resolve().relative_to(self.base_dir).as_posix()
+            offload_header = ('X-Accel-Redirect', f"{self.accel_prefix}/{relative}")
+        elif self.mode == 'x-sendfile':
+            offload_header = ('X-Sendfile', str(path.resolve()))
+
+        if offload_header:
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = Response(mimetype=mimetype)
+                response.headers[offload_header[0]] = offload_header[1]
+                if download_name:
+                    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+            response.set_etag(etag)
+        else:
+            # Werkzeug handles Range, If-Range, If-None-Match and If-Modified-Since here
+            response = send_file(
+                path,
+                mimetype=mimetype,
+                as_attachment=bool(download_name),
+                download_name=download_name,
+                conditional=True,
+                etag=etag,
+            )
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Accept-Ranges'] = 'bytes'
+
+        metrics.inc(
+            'artifact_requests_total', 'Artifact responses by kind and status code',
+            kind=kind, status=str(response.status_code)
+        )
+        return response
+
+
+artifact_server = ArtifactServer(
+    Path(__file__).resolve().parent,
+    mode=settings.ARTIFACT_SENDFILE_MODE,
+    accel_prefix=settings.ARTIFACT_ACCEL_PREFIX,
+)
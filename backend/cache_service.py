@@ -0,0 +1,227 @@
+from pathlib import Path
+from metrics_service import metrics
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+def make_cache_key(*parts) -> str:
+    """Build a stable content-addressed key from any JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def hash_file(path) -> str:
+    """Return the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst, falling back to a copy across filesystems."""
+    src, dst = Path(src), Path(dst)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+class ArtifactCache:
+    """On-disk cache of content-addressed entries with TTL and LRU eviction.
+
+    Each entry is a directory named after its key that holds one or more files
+    and a meta.json. Entries are published with an atomic rename, so readers
+    never see a half-written entry. The directory mtime is bumped on every hit
+    and is used as the LRU clock when the cache grows past max_entries or
+    max_bytes.
+
+    The entry count and total size are tracked as entries come and go, so a
+    put only walks the cache when it is over a bound, or when expired entries
+    are due to be swept.
+    """
+
+    META_FILE = 'meta.json'
+    # Longest gap between sweeps for expired entries (never longer than the TTL)
+    SWEEP_SECONDS = 600
+
+    def __init__(self, name: str, root, max_entries=None, max_bytes=None, ttl_seconds=None):
+        self.name = name
+        self.root = Path(root)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entry_count = 0
+        self._total_bytes = 0
+        self._next_sweep = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._evict(force=True)
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def _is_expired(self, entry: Path) -> bool:
+        if not self.ttl_seconds:
+            return False
+        try:
+            meta = json.loads((entry / self.META_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return True
+        return time.time() - meta.get('created_at', 0) > self.ttl_seconds
+
+    def get(self, key: str):
+        """
+        Look up an entry.
+
+        Returns:
+            Tuple of (entry_dir, metadata) on a hit, or (None, None) on a miss
+        """
+        entry = self._entry_dir(key)
+        meta_path = entry / self.META_FILE
+        if meta_path.exists() and not self._is_expired(entry):
+            try:
+                meta = json.loads(meta_path.read_text(encoding='utf-8'))
+                os.utime(entry)
+                metrics.inc('cache_requests_total', 'Artifact cache lookups by result', cache=self.name, result='hit')
+                return entry, meta.get('metadata', {})
+            except (OSError, ValueError):
+                pass
+
+        if entry.exists():
+            self._discard(entry)
+        metrics.inc('cache_requests_total', 'Artifact cache lookups by result', cache=self.name, result='miss')
+        return None, None
+
+    def put(self, key: str, files: dict, metadata: dict = None) -> Path:
+        """
+        Store an entry, replacing any existing entry with the same key.
+
+        Args:
+            key: Cache key (see make_cache_key)
+            files: Mapping of file name to bytes, str, or a Path to link/copy in
+            metadata: Optional JSON-serializable data returned by get()
+
+        Returns:
+            Path to the published entry directory
+        """
+        staging = self.root / f".tmp-{uuid.uuid4().hex}"
+        staging.mkdir()
+        try:
+            for file_name, content in files.items():
+                target = staging / file_name
+                if isinstance(content, bytes):
+                    target.write_bytes(content)
+                elif isinstance(content, str):
+                    target.write_text(content, encoding='utf-8')
+                else:
+                    link_or_copy(content, target)
+            (staging / self.META_FILE).write_text(
+                json.dumps({'created_at': time.time(), 'metadata': metadata or {}}),
+                encoding='utf-8'
+            )
+            size = self._entry_size(staging)
+
+            entry = self._entry_dir(key)
+            if entry.exists():
+                self._discard(entry)
+            try:
+                staging.rename(entry)
+                self._account(1, size)
+            except OSError:
+                # Another writer published the same key first; its entry is equivalent
+                self._remove(staging)
+        except Exception:
+            self._remove(staging)
+            raise
+
+        self._evict()
+        return entry
+
+    def _remove(self, entry: Path):
+        """Delete an entry by renaming it aside first so lookups never see it half-removed."""
+        trash = self.root / f".trash-{uuid.uuid4().hex}"
+        try:
+            entry.rename(trash)
+        except OSError:
+            return False
+        shutil.rmtree(trash, ignore_errors=True)
+        return True
+
+    def _entry_size(self, entry: Path) -> int:
+        return sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+
+    def _account(self, entries: int, size: int):
+        with self._lock:
+            self._entry_count += entries
+            self._total_bytes += size
+
+    def _discard(self, entry: Path):
+        """Remove an entry outside eviction and take it off the running totals."""
+        try:
+            size = self._entry_size(entry)
+        except OSError:
+            size = 0
+        if self._remove(entry):
+            self._account(-1, -size)
+
+    def _over_bounds(self) -> bool:
+        return bool(
+            (self.max_entries and self._entry_count > self.max_entries)
+            or (self.max_bytes and self._total_bytes > self.max_bytes)
+        )
+
+    def _evict(self, force: bool = False):
+        """
+        Drop expired entries, then least recently used ones until within bounds.
+
+        Cheap unless there is work to do: the cache is only walked when the
+        running totals are over a bound, a TTL sweep is due, or force is set
+        (which also recounts the totals from disk).
+        """
+        now = time.monotonic()
+        with self._lock:
+            sweep_due = bool(self.ttl_seconds) and now >= self._next_sweep
+            if not (force or sweep_due or self._over_bounds()):
+                return
+            if self.ttl_seconds:
+                self._next_sweep = now + min(self.ttl_seconds, self.SWEEP_SECONDS)
+
+        evicted = 0
+        entries = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            if self._is_expired(entry):
+                evicted += self._remove(entry)
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, self._entry_size(entry), entry))
+            except OSError:
+                continue
+
+        entries.sort(key=lambda item: item[0])
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (
+            (self.max_entries and len(entries) > self.max_entries)
+            or (self.max_bytes and total_bytes > self.max_bytes)
+        ):
+            _, size, entry = entries.pop(0)
+            evicted += self._remove(entry)
+            total_bytes -= size
+
+        with self._lock:
+            self._entry_count = len(entries)
+            self._total_bytes = total_bytes
+        if evicted:
+            metrics.inc('cache_evictions_total', 'Artifact cache entries evicted (expired or LRU)',
+                        amount=evicted, cache=self.name)
@@ -1,13 +1,67 @@
 from google import genai
 from elevenlabs import ElevenLabs
 from pathlib import Path
-from datetime import datetime
 from settings import settings
+from cache_service import ArtifactCache, make_cache_key, hash_file, link_or_copy
+from metrics_service import metrics
+from manim_service import manim_service
 import os
 import base64
+import json
 import re
 import time
-                    
+
+# Bump whenever the script prompts below change so cached scripts are not reused
+SCRIPT_PROMPT_VERSION = "2"
+
+SHORT_SCRIPT_INSTRUCTIONS = (
+    "Target length: 10-15 seconds of spoken content (about 30-45 words).\n\n"
+    "Return ONLY the script text, nothing else. Do not include timestamps or labels."
+)
+
+# Marks the start of each chapter in a long-form script
+CHAPTER_MARKER = "CHAPTER:"
+
+LONG_FORM_SCRIPT_INSTRUCTIONS = (
+    f"This is a longer lesson. Split it into {settings.LONG_FORM_CHAPTERS} chapters that build on each other, "
+    "each 15-30 seconds of spoken content (about 40-80 words) and focused on one idea that can be "
+    "visualized on its own.\n\n"
+    f"Start each chapter with a line of the form '{CHAPTER_MARKER} <short title>' followed by its narration. "
+    "Return ONLY the chapters, nothing else. Do not include timestamps or other labels."
+)
+
+
+def split_chapters(script: str, max_chapters: int = None) -> list:
+    """
+    Split a long-form script into chapters at its CHAPTER: marker lines.
+
+    Text before the first marker (or a script without markers) becomes an
+    untitled chapter, and chapters beyond max_chapters are merged into the last.
+
+    Args:
+        script: Narration script written with LONG_FORM_SCRIPT_INSTRUCTIONS
+        max_chapters: Maximum number of chapters (default: settings.LONG_FORM_MAX_CHAPTERS)
+
+    Returns:
+        List of dictionaries with 'title' and 'script'
+    """
+    chapters = []
+    for line in script.splitlines():
+        text = line.strip().strip('#*').strip()
+        if text.upper().startswith(CHAPTER_MARKER):
+            chapters.append({'title': text[len(CHAPTER_MARKER):].strip(' *#'), 'script': ''})
+        elif text:
+            if not chapters:
+                chapters.append({'title': '', 'script': ''})
+            chapters[-1]['script'] = f"{chapters[-1]['script']} {text}".strip()
+
+    chapters = [chapter for chapter in chapters if chapter['script']]
+    max_chapters = max_chapters or settings.LONG_FORM_MAX_CHAPTERS
+    while len(chapters) > max_chapters:
+        last = chapters.pop()
+        chapters[-1]['script'] = f"{chapters[-1]['script']} {last['script']}"
+    return chapters
+
 
 def convert_char_timing_to_word_timing(script: str, char_timing: dict) -> list:
     """
@@ -66,12 +120,70 @@ def convert_char_timing_to_word_timing(script: str, char_timing: dict) -> list:
     return word_timings
 
 
+def estimate_word_timings(script: str, speed: float = 1.0) -> dict:
+    """
+    Estimate word-level timing data for a script before it has been synthesized.
+
+    Words are spoken at settings.ESTIMATED_WORDS_PER_SECOND scaled by the voice
+    speed, with short pauses after commas and sentence endings.
+
+    Args:
+        script: The narration script
+        speed: Voice speed multiplier (default 1.0: TTS requests are sent
+            without voice settings, so ElevenLabs speaks at normal speed)
+
+    Returns:
+        Timing data shaped like generate_audio_with_timestamps output, with
+        'estimated' set to True. character_timings only carries the total
+        duration as its last end time.
+    """
+    seconds_per_word = 1.0 / (settings.ESTIMATED_WORDS_PER_SECOND * speed)
+
+    word_timings = []
+    current_time = 0.0
+    for word in script.split():
+        # Longer words take longer to say; scale around an average of 5 letters
+        duration = seconds_per_word * min(max(len(word.strip('.,;:!?"')) / 5.0, 0.6), 2.0)
+        word_timings.append({
+            'word': word,
+            'start_time': round(current_time, 3),
+            'end_time': round(current_time + duration, 3)
+        })
+        current_time += duration
+        if word.endswith(('.', '!', '?')):
+            current_time += 0.45 / speed
+        elif word.endswith((',', ';', ':')):
+            current_time += 0.25 / speed
+
+    total_duration = word_timings[-1]['end_time'] if word_timings else 0
+    return {
+        'word_timings': word_timings,
+        'character_timings': {
+            'characters': [],
+            'character_start_times': [],
+            'character_end_times': [total_duration]
+        },
+        'estimated': True
+    }
+
+
 class ElevenLabsService:
     """Service for generating audio explanations using Gemini and ElevenLabs."""
 
     def __init__(self):
         self.gemini_client = genai.Client(api_key=settings.GEMINI_API_KEY)
         self.elevenlabs_client = ElevenLabs(api_key=settings.ELEVENLABS_API_KEY)
+        self.script_cache = ArtifactCache(
+            'scripts',
+            Path(settings.CACHE_DIR) / 'scripts',
+            max_entries=settings.SCRIPT_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.SCRIPT_CACHE_TTL_SECONDS,
+        )
+        self.tts_cache = ArtifactCache(
+            'tts',
+            Path(settings.CACHE_DIR) / 'tts',
+            max_bytes=settings.TTS_CACHE_MAX_BYTES,
+        )
         self._ensure_directories()
 
     def _ensure_directories(self):
@@ -79,20 +191,67 @@ class ElevenLabsService:
         Path(settings.AUDIO_DIR).mkdir(exist_ok=True)
         Path(settings.SCRIPTS_DIR).mkdir(exist_ok=True)
 
-    def generate_script(self, user_prompt: str, pdf_path=None) -> str:
+    def _script_cache_key(self, user_prompt: str, pdf_path=None, long_form: bool = False) -> str:
+        """Build the script cache key from the normalized prompt, PDF contents, model, length and template version."""
+        normalized_prompt = re.sub(r'\s+', ' ', user_prompt).strip().casefold()
+        pdf_hash = hash_file(pdf_path) if pdf_path else None
+        length = f"chapters-{settings.LONG_FORM_CHAPTERS}" if long_form else 'short'
+        return make_cache_key('script', SCRIPT_PROMPT_VERSION, settings.GEMINI_MODEL, normalized_prompt, pdf_hash, length)
+
+    def generate_script(self, user_prompt: str, pdf_path=None, long_form: bool = False) -> str:
         """
         Generate an educational script using Gemini AI based on the user's question.
+
+        Scripts are cached on disk by prompt, PDF contents, model and prompt
+        template version, so repeated questions skip the Gemini round trip.
+
         Args:
             user_prompt: The user's question or topic to explain
             pdf_path: Optional path to a PDF file for additional context
+            long_form: Write a multi-chapter lesson (see split_chapters) instead of a short clip
         Returns:
-            A well-formatted educational script (optimized for 10-15 seconds)
+            A well-formatted educational script (optimized for 10-15 seconds, or
+            LONG_FORM_CHAPTERS chapters in long-form mode)
+        """
+        try:
+            cache_key = self._script_cache_key(user_prompt, pdf_path, long_form)
+        except OSError as e:
+            print(f"[ElevenLabsService WARNING] Could not hash PDF for script cache: {str(e)}")
+            cache_key = None
+
+        if cache_key:
+            entry, _ = self.script_cache.get(cache_key)
+            if entry:
+                print(f"[ElevenLabsService] Script cache hit ({cache_key[:12]})")
+                metrics.observe_stage('script_generation', 'cache_hit', 0.0)
+                return (entry / 'script.txt').read_text(encoding='utf-8')
+
+        with metrics.time_stage('script_generation'):
+            length_instructions = LONG_FORM_SCRIPT_INSTRUCTIONS if long_form else SHORT_SCRIPT_INSTRUCTIONS
+            script, used_pdf = self._request_script(user_prompt, pdf_path, length_instructions)
+
+        # A script written without the PDF it was asked about must not be cached under the PDF's key
+        if cache_key and (used_pdf or not pdf_path):
+            try:
+                self.script_cache.put(cache_key, {'script.txt': script})
+            except OSError as e:
+                print(f"[ElevenLabsService WARNING] Failed to cache script: {str(e)}")
+        return script
+
+    def _request_script(self, user_prompt: str, pdf_path=None,
+                        length_instructions: str = SHORT_SCRIPT_INSTRUCTIONS) -> tuple[str, bool]:
+        """
+        Ask Gemini for a narration script.
+
+        Returns:
+            Tuple of (script, used_pdf); used_pdf is False when the PDF could not be processed
         """
         try:
             print(f"[ElevenLabsService] Generating script for prompt: {user_prompt[:50]}...")
             
             # Prepare contents for Gemini
             contents = []
+            used_pdf = False
             
             # If PDF is provided, upload it using the official Files API
             if pdf_path:
@@ -106,28 +265,29 @@ class ElevenLabsService:
                     if file_size_mb > 50:
                         raise Exception(f"PDF file is too large ({file_size_mb:.2f} MB). Maximum recommended size is 50 MB.")
                     
-                    # Upload PDF using the official SDK method
-                    uploaded_file = self.gemini_client.files.upload(file=str(pdf_path))
+                    with metrics.time_stage('pdf_processing'):
+                        # Upload PDF using the official SDK method
+                        uploaded_file = self.gemini_client.files.upload(file=str(pdf_path))
                     
-                    print(f"[ElevenLabsService] PDF uploaded successfully")
-                    print(f"[ElevenLabsService] File name: {uploaded_file.name}")
-                    print(f"[ElevenLabsService] File URI: {uploaded_file.uri}")
-                    print(f"[ElevenLabsService] File state: {uploaded_file.state.name if hasattr(uploaded_file, 'state') else 'unknown'}")
+                        print(f"[ElevenLabsService] PDF uploaded successfully")
+                        print(f"[ElevenLabsService] File name: {uploaded_file.name}")
+                        print(f"[ElevenLabsService] File URI: {uploaded_file.uri}")
+                        print(f"[ElevenLabsService] File state: {uploaded_file.state.name if hasattr(uploaded_file, 'state') else 'unknown'}")
                     
-                    # Wait for file to be processed if needed
-                    max_wait = 30
-                    wait_interval = 2
-                    elapsed = 0
+                        # Wait for file to be processed if needed
+                        max_wait = 30
+                        wait_interval = 2
+                        elapsed = 0
                     
-                    while hasattr(uploaded_file, 'state') and uploaded_file.state.name == 'PROCESSING' and elapsed < max_wait:
-                        print(f"[ElevenLabsService] Waiting for file to be processed... ({elapsed}s)")
-                        time.sleep(wait_interval)
-                        # Refresh file state
-                        uploaded_file = self.gemini_client.files.get(name=uploaded_file.name)
-                        elapsed += wait_interval
+                        while hasattr(uploaded_file, 'state') and uploaded_file.state.name == 'PROCESSING' and elapsed < max_wait:
+                            print(f"[ElevenLabsService] Waiting for file to be processed... ({elapsed}s)")
+                            time.sleep(wait_interval)
+                            # Refresh file state
+                            uploaded_file = self.gemini_client.files.get(name=uploaded_file.name)
+                            elapsed += wait_interval
                     
-                    if hasattr(uploaded_file, 'state') and uploaded_file.state.name == 'FAILED':
-                        raise Exception(f"File processing failed: {uploaded_file.state}")
+                        if hasattr(uploaded_file, 'state') and uploaded_file.state.name == 'FAILED':
+                            raise Exception(f"File processing failed: {uploaded_file.state}")
                     
                     print(f"[ElevenLabsService] File ready for use (state: {uploaded_file.state.name if hasattr(uploaded_file, 'state') else 'ACTIVE'})")
                     print(f"[ElevenLabsService] Note: Uploaded files expire after 48 hours")
@@ -144,14 +304,13 @@ class ElevenLabsService:
                     Keep the explanation engaging and easy to follow. Structure your script to naturally 
                     break into segments that can be visualized (e.g., introduction, key concepts, examples, conclusion).
                     
-                    Target length: 10-15 seconds of spoken content (about 30-45 words).
-                    
-                    Return ONLY the script text, nothing else. Do not include timestamps or labels.
+                    {length_instructions}
                     """
                     
                     # Add the uploaded file to contents (this is how the official SDK works)
                     contents.append(uploaded_file)
                     contents.append(full_prompt)
+                    used_pdf = True
                 except Exception as pdf_error:
                     print(f"[ElevenLabsService WARNING] Failed to process PDF: {str(pdf_error)}")
                     print("[ElevenLabsService] Continuing without PDF context")
@@ -166,9 +325,7 @@ class ElevenLabsService:
                     Keep the explanation engaging and easy to follow. Structure your script to naturally 
                     break into segments that can be visualized (e.g., introduction, key concepts, examples, conclusion).
                     
-                    Target length: 10-15 seconds of spoken content (about 30-45 words).
-                    
-                    Return ONLY the script text, nothing else. Do not include timestamps or labels.
+                    {length_instructions}
                     """
                     contents.append(full_prompt)
             else:
@@ -183,9 +340,7 @@ class ElevenLabsService:
                 Keep the explanation engaging and easy to follow. Structure your script to naturally 
                 break into segments that can be visualized (e.g., introduction, key concepts, examples, conclusion).
                 
-                Target length: 10-15 seconds of spoken content (about 30-45 words).
-                
-                Return ONLY the script text, nothing else. Do not include timestamps or labels.
+                {length_instructions}
                 """
                 contents.append(full_prompt)
 
@@ -196,7 +351,7 @@ class ElevenLabsService:
 
             script = response.text.strip()
             print(f"[ElevenLabsService] Script generated successfully ({len(script)} chars)")
-            return script
+            return script, used_pdf
             
         except Exception as e:
             error_msg = f"Failed to generate script: {type(e).__name__}: {str(e)}"
@@ -205,98 +360,129 @@ class ElevenLabsService:
             traceback.print_exc()
             raise Exception(error_msg)
 
-    def generate_audio_with_timestamps(self, script: str) -> tuple[str, str, dict]:
+    def _tts_cache_key(self, script: str) -> str:
+        """Build the TTS cache key from the exact text and every parameter sent with the TTS request."""
+        return make_cache_key(
+            'tts',
+            script,
+            settings.ELEVENLABS_VOICE_ID,
+            settings.ELEVENLABS_MODEL,
+            settings.ELEVENLABS_OUTPUT_FORMAT,
+        )
+
+    def generate_audio_with_timestamps(self, script: str, file_id: str = None) -> tuple[str, str, dict]:
         """
         Generate audio file from script using ElevenLabs text-to-speech with timing data.
 
         Args:
             script: The text script to convert to audio
+            file_id: Optional id used to name the audio and script files (default: a new video id)
 
         Returns:
             Tuple of (audio_file_path, script_file_path, timing_data)
             timing_data contains character-level timing information
         """
-        try:
-            print(f"[ElevenLabsService] Generating audio with timestamps for script ({len(script)} chars)...")
+        with metrics.time_stage('tts') as timer:
+            try:
+                print(f"[ElevenLabsService] Generating audio with timestamps for script ({len(script)} chars)...")
             
-            # Generate timestamp for unique filenames
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            audio_filename = f"audio_{timestamp}.mp3"
-            script_filename = f"script_{timestamp}.txt"
-
-            audio_path = Path(settings.AUDIO_DIR) / audio_filename
-            script_path = Path(settings.SCRIPTS_DIR) / script_filename
-
-            # Save the script to a text file
-            with open(script_path, 'w', encoding='utf-8') as f:
-                f.write(script)
-            print(f"[ElevenLabsService] Script saved to {script_path}")
-
-            # Generate audio with timestamps using ElevenLabs
-            print(f"[ElevenLabsService] Calling ElevenLabs API for audio generation...")
-            response = self.elevenlabs_client.text_to_speech.convert_with_timestamps(
-                voice_id=settings.ELEVENLABS_VOICE_ID,
-                model_id=settings.ELEVENLABS_MODEL,
-                text=script,
-                output_format="mp3_44100_128"
-            )
-            print(f"[ElevenLabsService] Received response from ElevenLabs API")
-            print(f"[ElevenLabsService] Response type: {type(response)}")
-
-            # Save the audio file from base64 (response is an object, not a dict)
-            # Note: attribute is audio_base_64 with underscore, not audio_base64
-            audio_bytes = base64.b64decode(response.audio_base_64)
-            with open(audio_path, 'wb') as f:
-                f.write(audio_bytes)
-            print(f"[ElevenLabsService] Audio saved to {audio_path}")
-
-            # Extract timing data (response.alignment is an object)
-            char_timing_data = {
-                'characters': response.alignment.characters,
-                'character_start_times': response.alignment.character_start_times_seconds,
-                'character_end_times': response.alignment.character_end_times_seconds
-            }
+                # Name files after the job id when given, otherwise after a fresh collision-free id
+                file_id = file_id or manim_service.generate_video_id()
+                audio_filename = f"audio_{file_id}.mp3"
+                script_filename = f"script_{file_id}.txt"
+
+                audio_path = Path(settings.AUDIO_DIR) / audio_filename
+                script_path = Path(settings.SCRIPTS_DIR) / script_filename
+
+                # Save the script to a text file
+                with open(script_path, 'w', encoding='utf-8') as f:
+                    f.write(script)
+                print(f"[ElevenLabsService] Script saved to {script_path}")
+
+                # Reuse previously synthesized audio for identical text and voice configuration
+                cache_key = self._tts_cache_key(script)
+                entry, _ = self.tts_cache.get(cache_key)
+                if entry:
+                    timer.outcome = 'cache_hit'
+                    link_or_copy(entry / 'audio.mp3', audio_path)
+                    with open(entry / 'timing.json', 'r', encoding='utf-8') as f:
+                        timing_data = json.load(f)
+                    print(f"[ElevenLabsService] TTS cache hit ({cache_key[:12]}), audio linked to {audio_path}")
+                    return str(audio_path), str(script_path), timing_data
+
+                # Generate audio with timestamps using ElevenLabs
+                print(f"[ElevenLabsService] Calling ElevenLabs API for audio generation...")
+                response = self.elevenlabs_client.text_to_speech.convert_with_timestamps(
+                    voice_id=settings.ELEVENLABS_VOICE_ID,
+                    model_id=settings.ELEVENLABS_MODEL,
+                    text=script,
+                    output_format=settings.ELEVENLABS_OUTPUT_FORMAT
+                )
+                print(f"[ElevenLabsService] Received response from ElevenLabs API")
+                print(f"[ElevenLabsService] Response type: {type(response)}")
+
+                # Save the audio file from base64 (response is an object, not a dict)
+                # Note: attribute is audio_base_64 with underscore, not audio_base64
+                audio_bytes = base64.b64decode(response.audio_base_64)
+                with open(audio_path, 'wb') as f:
+                    f.write(audio_bytes)
+                print(f"[ElevenLabsService] Audio saved to {audio_path}")
+
+                # Extract timing data (response.alignment is an object)
+                char_timing_data = {
+                    'characters': response.alignment.characters,
+                    'character_start_times': response.alignment.character_start_times_seconds,
+                    'character_end_times': response.alignment.character_end_times_seconds
+                }
             
-            # Convert character-level timing to word-level timing
-            word_timings = convert_char_timing_to_word_timing(script, char_timing_data)
+                # Convert character-level timing to word-level timing
+                word_timings = convert_char_timing_to_word_timing(script, char_timing_data)
             
-            # Create comprehensive timing data with both formats
-            timing_data = {
-                'word_timings': word_timings,
-                'character_timings': char_timing_data  # Keep for reference if needed
-            }
+                # Create comprehensive timing data with both formats
+                timing_data = {
+                    'word_timings': word_timings,
+                    'character_timings': char_timing_data  # Keep for reference if needed
+                }
             
-            total_duration = char_timing_data['character_end_times'][-1] if char_timing_data['character_end_times'] else 0
-            print(f"[ElevenLabsService] Audio duration: {total_duration:.2f} seconds")
-            print(f"[ElevenLabsService] Generated word-level timing for {len(word_timings)} words")
+                total_duration = char_timing_data['character_end_times'][-1] if char_timing_data['character_end_times'] else 0
+                print(f"[ElevenLabsService] Audio duration: {total_duration:.2f} seconds")
+                print(f"[ElevenLabsService] Generated word-level timing for {len(word_timings)} words")
             
-            # Print formatted word timings for debugging
-            print("\n[ElevenLabsService] Word-level timing breakdown:")
-            print("-" * 70)
-            for i, wt in enumerate(word_timings[:10]):  # Show first 10 words
-                print(f"  {wt['start_time']:6.2f}s - {wt['end_time']:6.2f}s : \"{wt['word']}\"")
-            if len(word_timings) > 10:
-                print(f"  ... and {len(word_timings) - 10} more words")
-            print("-" * 70 + "\n")
+                # Print formatted word timings for debugging
+                print("\n[ElevenLabsService] Word-level timing breakdown:")
+                print("-" * 70)
+                for i, wt in enumerate(word_timings[:10]):  # Show first 10 words
+                    print(f"  {wt['start_time']:6.2f}s - {wt['end_time']:6.2f}s : \"{wt['word']}\"")
+                if len(word_timings) > 10:
+                    print(f"  ... and {len(word_timings) - 10} more words")
+                print("-" * 70 + "\n")
+
+                try:
+                    self.tts_cache.put(cache_key, {
+                        'audio.mp3': audio_path,
+                        'timing.json': json.dumps(timing_data),
+                    })
+                except OSError as e:
+                    print(f"[ElevenLabsService WARNING] Failed to cache audio: {str(e)}")
             
-            return str(audio_path), str(script_path), timing_data
+                return str(audio_path), str(script_path), timing_data
             
-        except AttributeError as e:
-            error_msg = f"Failed to extract timing data from ElevenLabs response - missing attribute: {str(e)}"
-            print(f"[ElevenLabsService ERROR] {error_msg}")
-            if 'response' in locals():
-                print(f"Response object attributes: {dir(response)}")
-            else:
-                print("No response received")
-            import traceback
-            traceback.print_exc()
-            raise Exception(error_msg)
-        except Exception as e:
-            error_msg = f"Failed to generate audio with timestamps: {type(e).__name__}: {str(e)}"
-            print(f"[ElevenLabsService ERROR] {error_msg}")
-            import traceback
-            traceback.print_exc()
-            raise Exception(error_msg)
+            except AttributeError as e:
+                error_msg = f"Failed to extract timing data from ElevenLabs response - missing attribute: {str(e)}"
+                print(f"[ElevenLabsService ERROR] {error_msg}")
+                if 'response' in locals():
+                    print(f"Response object attributes: {dir(response)}")
+                else:
+                    print("No response received")
+                import traceback
+                traceback.print_exc()
+                raise Exception(error_msg)
+            except Exception as e:
+                error_msg = f"Failed to generate audio with timestamps: {type(e).__name__}: {str(e)}"
+                print(f"[ElevenLabsService ERROR] {error_msg}")
+                import traceback
+                traceback.print_exc()
+                raise Exception(error_msg)
 
 
 # Create singleton instance
@@ -1,6 +1,11 @@
 from google import genai
 from settings import settings
-from prompts import generate_manim_prompt, generate_manim_from_script_prompt
+from prompts import (
+    generate_manim_prompt, generate_manim_from_script_prompt, generate_manim_repair_prompt, generate_quiz_prompt
+)
+from metrics_service import metrics
+import json
+import re
 import time
 
 class GeminiService:
@@ -30,46 +35,104 @@ class GeminiService:
     
     def generate_manim_code_from_script(self, user_prompt: str, script: str, timing_data: dict) -> str:
         """Generate Manim code synchronized with audio script and timing data."""
-        try:
-            print(f"[GeminiService] Generating Manim code from script...")
-            print(f"[GeminiService] Script: {script[:100]}...")
+        with metrics.time_stage('code_generation'):
+            try:
+                print(f"[GeminiService] Generating Manim code from script...")
+                print(f"[GeminiService] Script: {script[:100]}...")
             
-            # Extract total duration from timing data
-            char_timings = timing_data.get('character_timings', {})
-            total_duration = char_timings.get('character_end_times', [10])[-1] if char_timings.get('character_end_times') else 10
-            word_timings = timing_data.get('word_timings', [])
+                # Extract total duration from timing data
+                char_timings = timing_data.get('character_timings', {})
+                total_duration = char_timings.get('character_end_times', [10])[-1] if char_timings.get('character_end_times') else 10
+                word_timings = timing_data.get('word_timings', [])
             
-            print(f"[GeminiService] Target duration: {total_duration:.2f} seconds")
-            print(f"[GeminiService] Word timings: {len(word_timings)} words")
+                print(f"[GeminiService] Target duration: {total_duration:.2f} seconds")
+                print(f"[GeminiService] Word timings: {len(word_timings)} words")
             
             
-            full_prompt = generate_manim_from_script_prompt(user_prompt, script, timing_data)
+                full_prompt = generate_manim_from_script_prompt(user_prompt, script, timing_data)
             
-            print(f"[GeminiService] Calling Gemini API for code generation...")
-            start_time = time.time()
+                print(f"[GeminiService] Calling Gemini API for code generation...")
+                start_time = time.time()
             
-            # Enable code execution tool for better code generation
-            response = self.client.models.generate_content(
-                model=settings.GEMINI_MODEL, 
-                contents=full_prompt,
-            )
+                # Enable code execution tool for better code generation
+                response = self.client.models.generate_content(
+                    model=settings.GEMINI_MODEL, 
+                    contents=full_prompt,
+                )
             
-            end_time = time.time()
-            duration = end_time - start_time
-            print(f"[GeminiService] Received response from Gemini API (took {duration:.2f} seconds)")
-            # Extract the generated code from the response
-            generated_code = response.text.strip().replace("```python", "").replace("```", "").strip()
+                end_time = time.time()
+                duration = end_time - start_time
+                print(f"[GeminiService] Received response from Gemini API (took {duration:.2f} seconds)")
+                # Extract the generated code from the response
+                generated_code = response.text.strip().replace("```python", "").replace("```", "").strip()
             
-            print(f"[GeminiService] Generated {len(generated_code)} chars of Manim code")
+                print(f"[GeminiService] Generated {len(generated_code)} chars of Manim code")
             
-            return generated_code
+                return generated_code
             
-        except Exception as e:
-            error_msg = f"Gemini service failed to generate Manim code: {type(e).__name__}: {str(e)}"
-            print(f"[GeminiService ERROR] {error_msg}")
-            import traceback
-            traceback.print_exc()
-            raise Exception(error_msg)
+            except Exception as e:
+                error_msg = f"Gemini service failed to generate Manim code: {type(e).__name__}: {str(e)}"
+                print(f"[GeminiService ERROR] {error_msg}")
+                import traceback
+                traceback.print_exc()
+                raise Exception(error_msg)
+
+    def repair_manim_code(self, failing_code: str, error_class: str, error: str, log: str,
+                          script: str, timing_data: dict) -> str:
+        """Ask Gemini for a minimal fix to Manim code that failed to render."""
+        with metrics.time_stage('code_repair'):
+            try:
+                print(f"[GeminiService] Repairing Manim code ({error_class}: {error[:100]})...")
+                full_prompt = generate_manim_repair_prompt(failing_code, error_class, error, log, script, timing_data)
+
+                start_time = time.time()
+                response = self.client.models.generate_content(
+                    model=settings.GEMINI_MODEL,
+                    contents=full_prompt,
+                )
+                print(f"[GeminiService] Received repaired code (took {time.time() - start_time:.2f} seconds)")
+
+                return response.text.strip().replace("```python", "").replace("```", "").strip()
+
+            except Exception as e:
+                error_msg = f"Gemini service failed to repair Manim code: {type(e).__name__}: {str(e)}"
+                print(f"[GeminiService ERROR] {error_msg}")
+                raise Exception(error_msg)
+
+    def generate_quiz(self, prompt: str, narration_script: str = None) -> list:
+        """
+        Generate practice questions for a topic, grounded in the lesson narration when given.
+
+        Returns:
+            List of question dictionaries (step-by-step, multiple-choice, fill-in-blank)
+
+        Raises:
+            ValueError: The model did not return valid quiz JSON
+        """
+        with metrics.time_stage('quiz_generation'):
+            print(f"[GeminiService] Generating quiz for: {prompt[:50]}...")
+            start_time = time.time()
+            response = self.client.models.generate_content(
+                model=settings.QUIZ_MODEL,
+                contents=generate_quiz_prompt(prompt, narration_script),
+            )
+
+            quiz_text = response.text.strip()
+            # Remove markdown code blocks if present
+            if quiz_text.startswith('```'):
+                quiz_text = re.sub(r'^```(?:json)?\n', '', quiz_text)
+                quiz_text = re.sub(r'\n```$', '', quiz_text)
+                quiz_text = quiz_text.strip()
+
+            try:
+                questions = json.loads(quiz_text).get('questions', [])
+            except (ValueError, AttributeError) as e:
+                print(f"[GeminiService ERROR] Quiz response is not valid JSON: {quiz_text[:500]}")
+                raise ValueError(f"Failed to parse quiz data: {str(e)}")
+
+            print(f"[GeminiService] Generated {len(questions)} quiz questions "
+                  f"(took {time.time() - start_time:.2f} seconds)")
+            return questions
 
 
 gemini_service = GeminiService()
@@ -0,0 +1,215 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from settings import settings
+from manim_service import manim_service
+from metrics_service import metrics
+import math
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+# Frame size of each Manim quality preset, used for the source rendition's RESOLUTION attribute
+QUALITY_RESOLUTIONS = {
+    'ql': (854, 480),
+    'qm': (1280, 720),
+    'qh': (1920, 1080),
+    'qp': (2560, 1440),
+    'qk': (3840, 2160),
+}
+
+
+def parse_renditions(spec: str) -> list:
+    """
+    Parse HLS_RENDITIONS ("360:500k,240:250k") into rendition dicts.
+
+    Returns:
+        List of dictionaries with 'name', 'height' and 'bitrate'
+    """
+    renditions = []
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        height, _, bitrate = item.strip().partition(':')
+        renditions.append({'name': f"{int(height)}p", 'height': int(height), 'bitrate': bitrate or '500k'})
+    return renditions
+
+
+class HlsService:
+    """Packages final videos as fMP4 HLS in the background.
+
+    Each video gets a 'src' rendition that stream-copies the muxed MP4 into
+    segments (no quality loss, no encode), plus optional lower renditions from
+    HLS_RENDITIONS encoded with keyframes on segment boundaries. A master
+    playlist ties them together. Packages are built in a temporary directory
+    and published with an atomic rename, so clients never see a partial one.
+    A video whose packaging failed is not retried until HLS_RETRY_SECONDS
+    have passed, so player requests cannot keep re-running a failing ffmpeg job.
+    """
+
+    MASTER_PLAYLIST = 'master.m3u8'
+
+    def __init__(self):
+        self.hls_dir = manim_service.base_dir / settings.HLS_DIR
+        self.renditions = parse_renditions(settings.HLS_RENDITIONS)
+        self.executor = ThreadPoolExecutor(max_workers=settings.HLS_WORKERS, thread_name_prefix="hls")
+        self._pending = set()
+        self._failures = {}  # video_id -> (monotonic time of the failure, error)
+        self._lock = threading.Lock()
+        self.hls_dir.mkdir(exist_ok=True)
+        metrics.register_gauge('hls_packaging_jobs', 'Videos waiting for or undergoing HLS packaging',
+                               lambda: len(self._pending))
+
+    def package_dir(self, video_id: str) -> Path:
+        return self.hls_dir / video_id
+
+    def master_url(self, video_id: str) -> str:
+        return f"/api/hls/{video_id}/{self.MASTER_PLAYLIST}"
+
+    def status(self, video_id: str) -> str:
+        """Return 'ready', 'pending', 'failed' (within the retry backoff), or None when not packaged."""
+        if (self.package_dir(video_id) / self.MASTER_PLAYLIST).exists():
+            return 'ready'
+        with self._lock:
+            if video_id in self._pending:
+                return 'pending'
+        return 'failed' if self.failure(video_id) else None
+
+    def failure(self, video_id: str):
+        """
+        The last packaging failure of a video while it is still in its retry backoff.
+
+        Returns:
+            Dictionary with 'error' and 'retry_after' (seconds), or None
+        """
+        with self._lock:
+            failed = self._failures.get(video_id)
+            if failed is None:
+                return None
+            retry_after = settings.HLS_RETRY_SECONDS - (time.monotonic() - failed[0])
+            if retry_after <= 0:
+                del self._failures[video_id]
+                return None
+            return {'error': failed[1], 'retry_after': math.ceil(retry_after)}
+
+    def schedule(self, video_id: str, video_path) -> bool:
+        """
+        Queue a final video for packaging unless it is already packaged or queued.
+
+        Returns:
+            True if the video is ready or will be, False when HLS is disabled or
+            packaging failed recently
+        """
+        if not settings.HLS_ENABLED:
+            return False
+        status = self.status(video_id)
+        if status:
+            return status != 'failed'
+        with self._lock:
+            if video_id in self._pending:
+                return True
+            self._pending.add(video_id)
+        self.executor.submit(self._package_job, video_id, Path(video_path))
+        return True
+
+    def _package_job(self, video_id: str, video_path: Path):
+        try:
+            self.package(video_id, video_path)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            print(f"[HlsService] Packaging {video_id} failed, not retrying for "
+                  f"{settings.HLS_RETRY_SECONDS}s: {error}")
+        with self._lock:
+            if error:
+                self._failures[video_id] = (time.monotonic(), error)
+            else:
+                self._failures.pop(video_id, None)
+            self._pending.discard(video_id)
+
+    def _ffmpeg_command(self, video_path: Path, output_dir: Path, rendition: dict = None) -> list:
+        cmd = [manim_service._find_ffmpeg(), "-y", "-i", str(video_path), "-map", "0:v:0", "-map", "0:a:0?"]
+        if rendition:
+            # Force a keyframe at every segment boundary so every rendition splits at the same times
+            cmd += [
+                "-vf", f"scale=-2:{rendition['height']}",
+                "-c:v", "libx264", "-preset", "veryfast",
+                "-b:v", rendition['bitrate'], "-maxrate", rendition['bitrate'],
+                "-bufsize", rendition['bitrate'],
+                "-force_key_frames", f"expr:gte(t,n_forced*{settings.HLS_SEGMENT_SECONDS})",
+                "-c:a", "copy",
+            ]
+        else:
+            cmd += ["-c", "copy"]
+        cmd += [
+            "-f", "hls",
+            "-hls_time", str(settings.HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", str(output_dir / "seg_%04d.m4s"),
+            str(output_dir / "index.m3u8"),
+        ]
+        return cmd
+
+    def _peak_bandwidth(self, rendition_dir: Path) -> int:
+        """Peak segment bitrate in bits per second, read back from the media playlist."""
+        peak = 0
+        duration = None
+        for line in (rendition_dir / "index.m3u8").read_text(encoding='utf-8').splitlines():
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#') and duration:
+                segment = rendition_dir / line
+                peak = max(peak, segment.stat().st_size * 8 / duration)
+                duration = None
+        init = rendition_dir / "init.mp4"
+        return int(math.ceil(peak * 1.1)) or (init.stat().st_size * 8 if init.exists() else 1)
+
+    def package(self, video_id: str, video_path: Path) -> Path:
+        """
+        Package one final video as HLS and publish it under HLS_DIR/<video_id>.
+
+        Returns:
+            Path to the master playlist
+        """
+        with metrics.time_stage('hls_packaging'):
+            staging = self.hls_dir / f".tmp-{video_id}-{uuid.uuid4().hex[:8]}"
+            staging.mkdir()
+            try:
+                source_width, source_height = QUALITY_RESOLUTIONS.get(settings.MANIM_QUALITY, (854, 480))
+                variants = []
+                for rendition in [None] + [r for r in self.renditions if r['height'] < source_height]:
+                    name = rendition['name'] if rendition else 'src'
+                    rendition_dir = staging / name
+                    rendition_dir.mkdir()
+                    result = subprocess.run(
+                        self._ffmpeg_command(video_path, rendition_dir, rendition), capture_output=True, text=True
+                    )
+                    if result.returncode != 0:
+                        raise Exception(f"ffmpeg failed for rendition {name}: {result.stderr[-2000:]}")
+
+                    height = rendition['height'] if rendition else source_height
+                    width = round(source_width * height / source_height / 2) * 2
+                    variants.append((self._peak_bandwidth(rendition_dir), width, height, name))
+
+                # Highest bandwidth first; players pick their starting variant from the top
+                lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+                for bandwidth, width, height, name in sorted(variants, reverse=True):
+                    lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height}")
+                    lines.append(f"{name}/index.m3u8")
+                (staging / self.MASTER_PLAYLIST).write_text("\n".join(lines) + "\n", encoding='utf-8')
+
+                target = self.package_dir(video_id)
+                if target.exists():
+                    shutil.rmtree(target, ignore_errors=True)
+                staging.rename(target)
+                print(f"[HlsService] Packaged {video_id} with {len(variants)} rendition(s)")
+                return target / self.MASTER_PLAYLIST
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+
+hls_service = HlsService()
@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor
+from settings import settings
+from metrics_service import metrics
+import threading
+import time
+import uuid
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while every worker and queue slot is taken."""
+
+
+class JobService:
+    """Runs long pipeline jobs on a bounded worker pool and tracks their progress.
+
+    Jobs are submitted with submit() and polled with get(). A job that cannot be
+    given a worker or a queue slot is rejected immediately with JobQueueFullError
+    instead of piling up behind the executor.
+    """
+
+    def __init__(self, max_workers: int, max_queue_depth: int, retention_seconds: int):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.retention_seconds = retention_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Notified whenever any job publishes an event
+        self._changed = threading.Condition(self._lock)
+
+    def _active_count(self) -> int:
+        """Number of jobs that are queued or running (caller holds the lock)."""
+        return sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+
+    def _prune_finished(self):
+        """Forget finished jobs older than the retention window (caller holds the lock)."""
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and job['finished_at'] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, fn, *args, **kwargs) -> str:
+        """
+        Queue fn(*args, report=..., **kwargs) on the worker pool.
+
+        The function receives a `report(stage, **data)` callback it can use to
+        publish progress events. Each event records the time since the job
+        started and since the current stage began; any data is also merged
+        into the job's 'partial' results. With report(stage, background=True,
+        **data) the event does not replace the job's stage. Its return value
+        becomes the job result.
+
+        Returns:
+            The new job id
+
+        Raises:
+            JobQueueFullError: if all workers are busy and the queue is full
+        """
+        with self._lock:
+            self._prune_finished()
+            if self._active_count() >= self.max_workers + self.max_queue_depth:
+                raise JobQueueFullError(
+                    f"Job queue is full ({self.max_workers} running, {self.max_queue_depth} queued)"
+                )
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'id': job_id,
+                'status': 'queued',
+                'stage': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'error_type': None,
+                'partial': {},
+                'events': [],
+            }
+            self._jobs[job_id] = job
+
+        stage_started = {'at': job['created_at']}
+
+        def report(stage: str, background: bool = False, **data):
+            # Background events (work running beside the main chain, like the quiz) publish their
+            # data without becoming the job's stage or restarting the current stage's clock
+            with self._lock:
+                now = time.time()
+                job['events'].append({
+                    'stage': stage,
+                    'at': now,
+                    'elapsed': now - (job['started_at'] or job['created_at']),
+                    'stage_seconds': now - stage_started['at'],
+                    'data': data,
+                })
+                if not background:
+                    job['stage'] = stage
+                    stage_started['at'] = now
+                job['partial'].update(data)
+                self._changed.notify_all()
+
+        def run():
+            with self._lock:
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+            report('started')
+            try:
+                result = fn(*args, report=report, **kwargs)
+                with self._lock:
+                    job['result'] = result
+                    job['status'] = 'succeeded' if result.get('success') else 'failed'
+            except Exception as e:
+                error_msg = f"{type(e).__name__}: {str(e)}"
+                print(f"[JobService ERROR] Job {job_id} failed: {error_msg}")
+                import traceback
+                traceback.print_exc()
+                with self._lock:
+                    job['error'] = error_msg
+                    job['error_type'] = type(e).__name__
+                    job['status'] = 'failed'
+            finally:
+                with self._lock:
+                    job['finished_at'] = time.time()
+                metrics.observe(
+                    'pipeline_job_duration_seconds', 'End-to-end duration of video jobs',
+                    job['finished_at'] - job['started_at'], status=job['status']
+                )
+                report('done', status=job['status'])
+
+        job['future'] = self.executor.submit(run)
+        print(f"[JobService] Job {job_id} queued")
+        return job_id
+
+    def counts(self) -> dict:
+        """Return the number of tracked jobs in each status."""
+        with self._lock:
+            counts = {'queued': 0, 'running': 0, 'succeeded': 0, 'failed': 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+            return counts
+
+    def get(self, job_id: str):
+        """Return a snapshot of a job's state, or None if the job is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {key: value for key, value in job.items() if key not in ('future', 'events')}
+            snapshot['partial'] = dict(job['partial'])
+            if snapshot['status'] == 'queued':
+                queued = sorted(
+                    (j['created_at'], j['id']) for j in self._jobs.values() if j['status'] == 'queued'
+                )
+                snapshot['queue_position'] = queued.index((job['created_at'], job_id)) + 1
+            return snapshot
+
+    def iter_events(self, job_id: str, after: int = -1, heartbeat: float = 15.0):
+        """
+        Yield a job's progress events as they happen, ending after 'done'.
+
+        A caller resuming after the 'done' event (a client reconnecting to a
+        finished stream) gets 'done' again, so it can close instead of waiting
+        on keep-alives forever.
+
+        Args:
+            job_id: The job to follow
+            after: Index of the last event the caller already has (-1 for all)
+            heartbeat: Seconds without events after which None is yielded
+
+        Yields:
+            (index, event) tuples, or None as a keep-alive when nothing happened
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return
+
+        next_index = after + 1
+        while True:
+            with self._lock:
+                finished = bool(job['events']) and job['events'][-1]['stage'] == 'done'
+                if next_index >= len(job['events']) and not finished:
+                    self._changed.wait(timeout=heartbeat)
+                pending = job['events'][next_index:]
+                last_index = len(job['events']) - 1
+
+            if not pending and finished:
+                yield last_index, job['events'][last_index]
+                return
+            if not pending:
+                yield None
+                continue
+
+            for event in pending:
+                yield next_index, event
+                next_index += 1
+                if event['stage'] == 'done':
+                    return
+
+    def wait(self, job_id: str, timeout=None):
+        """Block until a job finishes and return its final snapshot."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job['future'].result(timeout=timeout)
+        return self.get(job_id)
+
+
+job_service = JobService(
+    max_workers=settings.JOB_WORKERS,
+    max_queue_depth=settings.JOB_QUEUE_DEPTH,
+    retention_seconds=settings.JOB_RETENTION_SECONDS,
+)
+metrics.register_gauge(
+    'video_jobs', 'Video jobs by status (queued and running jobs are in flight)',
+    lambda: {(('status', status),): count for status, count in job_service.counts().items()}
+)
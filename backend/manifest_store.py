@@ -0,0 +1,473 @@
+from contextlib import contextmanager
+from pathlib import Path
+from settings import settings
+from manim_service import manim_service, VIDEO_ID_PATTERN
+from artifact_server import artifact_server
+import bisect
+import json
+import re
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    prompt TEXT,
+    long_form INTEGER NOT NULL DEFAULT 0,
+    final_video TEXT NOT NULL,
+    final_video_hash TEXT,
+    script_file TEXT,
+    script_text TEXT,
+    manim_code_file TEXT,
+    duration REAL,
+    chapters TEXT,
+    shared_at REAL
+);
+CREATE INDEX IF NOT EXISTS videos_shared ON videos (video_id) WHERE shared_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS video_tags (
+    tag TEXT NOT NULL,
+    video_id TEXT NOT NULL REFERENCES videos (video_id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, video_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS video_tags_video ON video_tags (video_id);
+-- Videos per tag, kept in step with video_tags so the filter bar's facets never aggregate the archive
+CREATE TABLE IF NOT EXISTS tag_counts (
+    tag TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS video_tags_counted AFTER INSERT ON video_tags BEGIN
+    INSERT INTO tag_counts (tag, count) VALUES (NEW.tag, 1) ON CONFLICT (tag) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS video_tags_uncounted AFTER DELETE ON video_tags BEGIN
+    UPDATE tag_counts SET count = count - 1 WHERE tag = OLD.tag;
+    DELETE FROM tag_counts WHERE tag = OLD.tag AND count <= 0;
+END;
+"""
+
+# Full-text index over shared videos only. Each row's rowid is its video's id in `videos`, an
+# INTEGER PRIMARY KEY (so updates are by rowid, not a scan, and VACUUM cannot renumber it);
+# _sync_search_index() repairs any drift at startup
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS video_search USING fts5 (
+    tags, prompt, script, tokenize = 'porter unicode61'
+);
+"""
+
+# bm25 column weights: a tag match outranks a prompt match, which outranks a mention in the narration
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix (search-as-you-type)."""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return ' '.join(terms)
+
+
+# Columns callers may set through record_video()
+VIDEO_FIELDS = (
+    'created_at', 'prompt', 'long_form', 'final_video', 'final_video_hash', 'script_file',
+    'script_text', 'manim_code_file', 'duration', 'chapters',
+)
+
+
+class ManifestStore:
+    """SQLite manifest of every finished video and its artifacts.
+
+    Rows are written by the pipeline when a video is finalized, so listing
+    the gallery is an indexed query instead of a scan of the output folders.
+    Video ids start with their creation timestamp, which makes the primary key
+    the sort order and the keyset pagination cursor. The database runs in WAL
+    mode, so list requests never wait on a pipeline recording a video.
+
+    It is also the community store: a video is shared when its shared_at is
+    set, and its tags live in video_tags. Every write is one short
+    transaction that takes the write lock up front, so concurrent shares of
+    different videos, or of the same one, never lose an update. Shared videos
+    are indexed for full-text search (FTS5) in the same transaction.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+        self._init_tag_counts()
+        try:
+            self._connect().executescript(SEARCH_SCHEMA)
+            self.search_enabled = True
+            self._sync_search_index()
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5; everything but search keeps working
+            print(f"[ManifestStore] Full-text search disabled: {e}")
+            self.search_enabled = False
+
+    def _init_tag_counts(self):
+        """Fill tag_counts for a database whose tags predate it (the triggers keep it current after that)."""
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM tag_counts LIMIT 1").fetchone() is None:
+                conn.execute("INSERT INTO tag_counts (tag, count) SELECT tag, COUNT(*) FROM video_tags GROUP BY tag")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; writes open their own transactions in _transaction()
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction holding the database's write lock from its first statement."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def record_video(self, video_id: str, **fields):
+        """
+        Insert or update a video's manifest row.
+
+        Args:
+            video_id: The job's video id
+            **fields: Any of VIDEO_FIELDS; 'chapters' may be a list (stored as JSON)
+        """
+        unknown = set(fields) - set(VIDEO_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown manifest fields: {', '.join(sorted(unknown))}")
+        if isinstance(fields.get('chapters'), list):
+            fields['chapters'] = json.dumps(fields['chapters'])
+        fields.setdefault('created_at', time.time())
+        columns = list(fields)
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT INTO videos (video_id, {', '.join(columns)}) "
+                f"VALUES (?, {', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (video_id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns)}",
+                [video_id] + [fields[c] for c in columns]
+            )
+            # A shared video's search entry holds its prompt and narration, so refresh it with them
+            if {'prompt', 'script_text'} & set(fields) and conn.execute(
+                    "SELECT 1 FROM videos WHERE video_id = ? AND shared_at IS NOT NULL", (video_id,)).fetchone():
+                tags = [row[0] for row in conn.execute("SELECT tag FROM video_tags WHERE video_id = ?", (video_id,))]
+                self._index_video(conn, video_id, tags)
+
+    def get_video(self, video_id: str):
+        """Return the manifest row for one video as a dict (with 'tags'), or None."""
+        row = self._connect().execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None:
+            return None
+        return self._with_tags([dict(row)])[0]
+
+    def _replace_tags(self, conn, video_id: str, tags: list):
+        conn.execute("DELETE FROM video_tags WHERE video_id = ?", (video_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO video_tags (tag, video_id) VALUES (?, ?)",
+            [(tag, video_id) for tag in tags or []]
+        )
+
+    def _index_video(self, conn, video_id: str, tags: list):
+        """(Re)index one shared video for search."""
+        if not self.search_enabled:
+            return
+        conn.execute(
+            "DELETE FROM video_search WHERE rowid = (SELECT id FROM videos WHERE video_id = ?)", (video_id,)
+        )
+        conn.execute(
+            "INSERT INTO video_search (rowid, tags, prompt, script) "
+            "SELECT id, ?, COALESCE(prompt, ''), COALESCE(script_text, '') FROM videos WHERE video_id = ?",
+            (' '.join(tags or []), video_id)
+        )
+
+    def _unindex_video(self, conn, video_id: str):
+        if self.search_enabled:
+            conn.execute(
+                "DELETE FROM video_search WHERE rowid = (SELECT id FROM videos WHERE video_id = ?)", (video_id,)
+            )
+
+    def _sync_search_index(self):
+        """Index shared videos missing from the search index and drop entries for unshared ones."""
+        with self._transaction() as conn:
+            stale = conn.execute(
+                "DELETE FROM video_search WHERE rowid NOT IN (SELECT id FROM videos WHERE shared_at IS NOT NULL)"
+            ).rowcount
+            missing = [row[0] for row in conn.execute(
+                "SELECT video_id FROM videos WHERE shared_at IS NOT NULL "
+                "AND id NOT IN (SELECT rowid FROM video_search)"
+            )]
+            for video_id in missing:
+                tags = [row[0] for row in conn.execute("SELECT tag FROM video_tags WHERE video_id = ?", (video_id,))]
+                self._index_video(conn, video_id, tags)
+        if stale or missing:
+            print(f"[ManifestStore] Search index synced: {len(missing)} added, {stale} removed")
+
+    def share(self, video_id: str, tags: list = None):
+        """
+        Share a video to the community, or replace its tags if it is already shared.
+
+        Returns:
+            'shared' or 'updated', or None if the video is not in the manifest
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT shared_at FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+            if row is None:
+                return None
+            if row['shared_at'] is None:
+                conn.execute("UPDATE videos SET shared_at = ? WHERE video_id = ?", (time.time(), video_id))
+            self._replace_tags(conn, video_id, tags)
+            self._index_video(conn, video_id, tags)
+        return 'updated' if row['shared_at'] is not None else 'shared'
+
+    def unshare(self, video_id: str) -> bool:
+        """
+        Remove a video from the community and drop its tags.
+
+        Returns:
+            True if the video was shared
+        """
+        with self._transaction() as conn:
+            removed = conn.execute(
+                "UPDATE videos SET shared_at = NULL WHERE video_id = ? AND shared_at IS NOT NULL", (video_id,)
+            ).rowcount
+            conn.execute("DELETE FROM video_tags WHERE video_id = ?", (video_id,))
+            self._unindex_video(conn, video_id)
+        return bool(removed)
+
+    def migrate_community_json(self, json_path) -> int:
+        """
+        One-time import of community_videos.json into the manifest.
+
+        Accepts both the current {video_id: {'tags': [...]}} format and the
+        legacy list of video ids. The whole file is applied in one transaction
+        and then renamed to *.migrated, so it is never imported twice.
+
+        Returns:
+            Number of shared videos imported
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+        try:
+            data = json.loads(json_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            print(f"[ManifestStore] Could not read {json_path}, leaving it in place: {e}")
+            return 0
+        if isinstance(data, list):
+            data = {video_id: {'tags': []} for video_id in data if isinstance(video_id, str)}
+        if not isinstance(data, dict):
+            print(f"[ManifestStore] Unrecognized format in {json_path}, leaving it in place")
+            return 0
+
+        imported = 0
+        now = time.time()
+        with self._transaction() as conn:
+            for video_id, entry in data.items():
+                if entry is None:
+                    entry = {}
+                if not isinstance(entry, dict):
+                    print(f"[ManifestStore] Skipping shared video {video_id}: malformed entry {entry!r}")
+                    continue
+                updated = conn.execute(
+                    "UPDATE videos SET shared_at = COALESCE(shared_at, ?) WHERE video_id = ?", (now, video_id)
+                ).rowcount
+                if not updated:
+                    print(f"[ManifestStore] Skipping shared video {video_id}: no final video on disk")
+                    continue
+                # Same normalization as share_to_community; non-string tags are dropped
+                tags = entry.get('tags')
+                tags = [tag.strip().lower() for tag in tags if isinstance(tag, str) and tag.strip()][:5] \
+                    if isinstance(tags, list) else []
+                self._replace_tags(conn, video_id, tags)
+                self._index_video(conn, video_id, tags)
+                imported += 1
+        json_path.rename(json_path.with_name(json_path.name + '.migrated'))
+        print(f"[ManifestStore] Migrated {imported} shared videos from {json_path}")
+        return imported
+
+    def _with_tags(self, rows: list) -> list:
+        """Attach each row's tags with one indexed query for the whole page."""
+        tags = {row['video_id']: [] for row in rows}
+        if tags:
+            placeholders = ', '.join('?' for _ in tags)
+            for video_id, tag in self._connect().execute(
+                f"SELECT video_id, tag FROM video_tags WHERE video_id IN ({placeholders}) ORDER BY video_id, tag",
+                list(tags)
+            ):
+                tags[video_id].append(tag)
+        for row in rows:
+            row['tags'] = tags[row['video_id']]
+        return rows
+
+    def list_shared(self, limit: int, cursor: str = None, tags: list = None) -> tuple[list, str]:
+        """
+        One page of community videos, newest first.
+
+        Args:
+            limit: Page size
+            cursor: video_id of the last row of the previous page
+            tags: Only videos with at least one of these tags
+
+        Returns:
+            Tuple of (rows as dicts with 'tags', next cursor or None on the last page)
+        """
+        query = "SELECT * FROM videos WHERE shared_at IS NOT NULL"
+        params = []
+        if cursor:
+            query += " AND video_id < ?"
+            params.append(cursor)
+        if tags:
+            query += f" AND video_id IN (SELECT video_id FROM video_tags WHERE tag IN ({', '.join('?' for _ in tags)}))"
+            params.extend(tags)
+        query += " ORDER BY video_id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = [dict(row) for row in self._connect().execute(query, params)]
+        next_cursor = rows[limit - 1]['video_id'] if len(rows) > limit else None
+        return self._with_tags(rows[:limit]), next_cursor
+
+    def search_shared(self, text: str, limit: int, offset: int = 0, tags: list = None) -> tuple[list, int]:
+        """
+        Full-text search over community videos' tags, prompts and narration, best match first.
+
+        Args:
+            text: Free-text query; every word must match, the last one as a prefix
+            limit: Page size
+            offset: Results to skip (the previous page's next offset)
+            tags: Only videos with at least one of these tags
+
+        Returns:
+            Tuple of (rows as dicts with 'tags' and 'score', next offset or None on the last page)
+        """
+        query = fts_query(text)
+        if not query or not self.search_enabled:
+            return [], None
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+        sql = (
+            f"SELECT v.*, bm25(video_search, {weights}) AS score FROM video_search "
+            f"JOIN videos v ON v.id = video_search.rowid WHERE video_search MATCH ?"
+        )
+        params = [query]
+        if tags:
+            sql += f" AND v.video_id IN (SELECT video_id FROM video_tags WHERE tag IN ({', '.join('?' for _ in tags)}))"
+            params.extend(tags)
+        sql += " ORDER BY score, v.video_id DESC LIMIT ? OFFSET ?"
+        params.extend([limit + 1, offset])
+
+        rows = [dict(row) for row in self._connect().execute(sql, params)]
+        next_offset = offset + limit if len(rows) > limit else None
+        for row in rows:
+            # bm25() is lower-is-better; flip it so clients can treat larger as more relevant
+            row['score'] = round(-row['score'], 4)
+        return self._with_tags(rows[:limit]), next_offset
+
+    def shared_tag_counts(self) -> list:
+        """Every tag in use by a community video, with how many videos carry it.
+
+        Only shared videos have tags, and tag_counts is maintained as tags are
+        added and removed, so this reads one row per tag.
+        """
+        return [
+            {'tag': tag, 'count': count}
+            for tag, count in self._connect().execute("SELECT tag, count FROM tag_counts ORDER BY tag")
+        ]
+
+    def backfill(self, final_videos_dir, script_dir, code_dir) -> int:
+        """
+        Add final videos created before the manifest existed.
+
+        Scripts are matched by video id, falling back to the unclaimed legacy
+        script closest in mtime (within 2 minutes), as the old directory scan
+        did. Only videos missing from the manifest are examined. Each video's
+        content hash is stored with it (and filled in for rows recorded without
+        one), so listings never hash an MP4.
+
+        Returns:
+            Number of videos added
+        """
+        self._backfill_hashes(final_videos_dir)
+        known = {row[0] for row in self._connect().execute("SELECT video_id FROM videos")}
+        missing = []
+        for video_path in Path(final_videos_dir).glob('*.mp4'):
+            match = re.fullmatch(rf'({VIDEO_ID_PATTERN})\.mp4', video_path.name)
+            if match and match.group(1) not in known:
+                missing.append((match.group(1), video_path))
+        if not missing:
+            return 0
+
+        script_dir = Path(script_dir)
+        claimed = {row[0] for row in self._connect().execute(
+            "SELECT script_file FROM videos WHERE script_file IS NOT NULL"
+        )}
+        legacy_scripts = sorted(
+            (script.stat().st_mtime, script.name) for script in script_dir.glob('script_*.txt')
+            if script.name not in claimed
+            and not re.fullmatch(rf'script_{VIDEO_ID_PATTERN}\.txt', script.name)
+        )
+        legacy_mtimes = [mtime for mtime, _ in legacy_scripts]
+
+        for video_id, video_path in sorted(missing):
+            created_at = video_path.stat().st_mtime
+            script_file = f'script_{video_id}.txt'
+            if not (script_dir / script_file).exists():
+                script_file = None
+                index = bisect.bisect_left(legacy_mtimes, created_at)
+                candidates = [i for i in (index - 1, index) if 0 <= i < len(legacy_scripts)]
+                if candidates:
+                    closest = min(candidates, key=lambda i: abs(legacy_mtimes[i] - created_at))
+                    if abs(legacy_mtimes[closest] - created_at) < 120:
+                        script_file = legacy_scripts[closest][1]
+                        del legacy_scripts[closest], legacy_mtimes[closest]
+
+            script_text = None
+            if script_file:
+                try:
+                    script_text = (script_dir / script_file).read_text(encoding='utf-8')
+                except (OSError, UnicodeDecodeError):
+                    script_file = None
+
+            code_file = f'{video_id}.py'
+            self.record_video(
+                video_id,
+                created_at=created_at,
+                final_video=video_path.name,
+                final_video_hash=artifact_server.content_hash(video_path),
+                script_file=script_file,
+                script_text=script_text,
+                manim_code_file=code_file if (Path(code_dir) / code_file).exists() else None,
+            )
+
+        print(f"[ManifestStore] Backfilled {len(missing)} videos from {final_videos_dir}")
+        return len(missing)
+
+    def _backfill_hashes(self, final_videos_dir):
+        """Store the content hash of videos recorded without one."""
+        rows = self._connect().execute(
+            "SELECT video_id, final_video FROM videos WHERE final_video_hash IS NULL"
+        ).fetchall()
+        hashed = 0
+        for video_id, final_video in rows:
+            try:
+                digest = artifact_server.content_hash(Path(final_videos_dir) / final_video)
+            except OSError:
+                continue
+            with self._transaction() as conn:
+                conn.execute("UPDATE videos SET final_video_hash = ? WHERE video_id = ?", (digest, video_id))
+            hashed += 1
+        if hashed:
+            print(f"[ManifestStore] Stored content hashes for {hashed} videos")
+
+
+manifest_store = ManifestStore(manim_service.base_dir / settings.MANIFEST_DB)
@@ -1,8 +1,53 @@
 import subprocess
 import os
+import importlib.metadata
 from pathlib import Path
 from datetime import datetime
 from settings import settings
+from cache_service import ArtifactCache, make_cache_key, hash_file, link_or_copy
+from render_scheduler import RenderScheduler
+from manim_worker import WarmRenderWorker
+from metrics_service import metrics
+from manim_timing import normalize_scene_timing, plan_animation_segments
+from manim_validator import validate_manim_code, format_diagnostics, preload_manim_namespace
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+
+# Matches ids from generate_video_id() as well as legacy second-resolution ids
+VIDEO_ID_PATTERN = r'\d{8}_\d{6}(?:_[0-9a-f]{6})?'
+
+# Failures the repair loop cannot fix by changing the scene code
+UNREPAIRABLE_ERROR_CLASSES = {'missing_output', 'service_error'}
+
+# Characters of validator or Manim output kept with a failed render
+RENDER_LOG_TAIL_CHARS = 4000
+
+
+def classify_render_error(error: str, log: str = '') -> str:
+    """
+    Map a failed render's output to a short error class.
+
+    Returns:
+        'latex_missing', 'timeout', 'worker_crash', the snake_cased name of
+        the last Python exception in the traceback (e.g. 'name_error'), or 'unknown'
+    """
+    output = f"{log}\n{error}"
+    lowered = output.lower()
+    if ('latex' in lowered or 'dvisvgm' in lowered) and (
+            'not found' in lowered or 'no such file' in lowered or 'filenotfounderror' in lowered):
+        return 'latex_missing'
+    # Only the renderers' own messages count, not whatever the scene printed
+    if re.match(r'Render exceeded \d+s timeout', error):
+        return 'timeout'
+    if error.startswith('Manim worker exited unexpectedly'):
+        return 'worker_crash'
+    exceptions = re.findall(r'^\s*(?:[\w.]+\.)?(\w+(?:Error|Exception)):', output, flags=re.MULTILINE)
+    if exceptions:
+        return re.sub(r'(?<!^)(?=[A-Z])', '_', exceptions[-1]).lower()
+    return 'unknown'
 
 
 class ManimService:
@@ -14,6 +59,30 @@ class ManimService:
         self.video_dir = self.base_dir / settings.OUTPUT_DIR
         self.code_dir = self.base_dir / settings.CODE_DIR
         self.final_videos_dir = self.base_dir / settings.FINAL_VIDEOS_DIR
+        self.workspace_root = self.base_dir / settings.RENDER_WORKSPACE_DIR
+        self.render_cache = ArtifactCache(
+            'renders',
+            self.base_dir / settings.CACHE_DIR / 'renders',
+            max_bytes=settings.RENDER_CACHE_MAX_BYTES,
+        )
+        self.mux_audio_cache = ArtifactCache(
+            'mux_audio',
+            self.base_dir / settings.CACHE_DIR / 'mux_audio',
+            max_bytes=settings.MUX_AUDIO_CACHE_MAX_BYTES,
+        )
+        self.manim_version = self._detect_manim_version()
+        # Each scheduler slot thread keeps its own warm Manim worker here
+        self._slot_state = threading.local()
+        self.render_scheduler = RenderScheduler(settings.RENDER_WORKERS, self._run_render_job)
+        metrics.register_gauge(
+            'render_queue_jobs', 'Renders waiting for or holding a render slot',
+            lambda: {
+                (('state', 'queued'),): self.render_scheduler.stats()['queued'],
+                (('state', 'running'),): self.render_scheduler.stats()['running'],
+            }
+        )
+        # Load the Manim namespace for the validator off the request path
+        preload_manim_namespace()
         self._ensure_directories()
     
     def _ensure_directories(self):
@@ -21,109 +90,345 @@ class ManimService:
         self.video_dir.mkdir(exist_ok=True)
         self.code_dir.mkdir(exist_ok=True)
         self.final_videos_dir.mkdir(exist_ok=True)
+        self.workspace_root.mkdir(exist_ok=True)
     
-    def _generate_filename(self) -> str:
-        """Generate a timestamp-based filename."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return timestamp
-    
-    def _fix_negative_waits(self, manim_code: str) -> str:
-        """Fix negative wait times in generated Manim code."""
-        import re
+    def _detect_manim_version(self) -> str:
+        """Return the installed Manim version, used to invalidate cached renders on upgrade."""
+        try:
+            return importlib.metadata.version('manim')
+        except importlib.metadata.PackageNotFoundError:
+            return 'unknown'
 
-        # Pattern to match self.wait() calls with calculations
-        # Matches: self.wait(X - Y) where X - Y might be negative
-        def replace_wait(match):
-            wait_content = match.group(1)
-            # If it contains a subtraction, wrap it in max(0.1, ...)
-            if '-' in wait_content and 'max(' not in wait_content:
-                return f"self.wait(max(0.1, {wait_content}))"
-            return match.group(0)
+    def _render_cache_key(self, manim_code: str) -> str:
+        """Build the render cache key from the normalized source and render configuration."""
+        normalized_code = "\n".join(line.rstrip() for line in manim_code.strip().splitlines())
+        return make_cache_key(
+            'render',
+            normalized_code,
+            settings.MANIM_QUALITY,
+            settings.MANIM_FORMAT,
+            self.manim_version,
+        )
 
-        # Fix wait calls with calculations
-        fixed_code = re.sub(r'self\.wait\(([^)]+)\)', replace_wait, manim_code)
+    def generate_video_id(self) -> str:
+        """Generate a collision-free, time-sortable id (e.g. "20251018_195826_a1b2c3")."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"{timestamp}_{uuid.uuid4().hex[:6]}"
+
+    def _generate_filename(self) -> str:
+        """Generate a unique filename for a render."""
+        return self.generate_video_id()
 
-        return fixed_code
+    def _create_workspace(self, filename: str) -> Path:
+        """Create a private media directory for one render job."""
+        return Path(tempfile.mkdtemp(prefix=f"{filename}-", dir=self.workspace_root))
 
-    def _save_script(self, manim_code: str, filename: str) -> Path:
-        """Save Manim code to a file."""
-        # Fix any negative wait times before saving
-        fixed_code = self._fix_negative_waits(manim_code)
+    def _cleanup_workspace(self, workspace: Path):
+        """Remove a render workspace, renaming it aside first so the removal is atomic."""
+        trash = workspace.with_name(f".trash-{workspace.name}")
+        try:
+            workspace.rename(trash)
+        except OSError as e:
+            print(f"[ManimService] Warning: Could not clean up workspace {workspace.name}: {e}")
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+    
+    def _save_script(self, manim_code: str, filename: str, target_duration: float = None) -> Path:
+        """Save Manim code to a file after normalizing its timeline."""
+        # Clamp invalid durations and fit the scene to the narration length before saving
+        fixed_code, timing_report = normalize_scene_timing(manim_code, target_duration)
+        if timing_report['scale']:
+            print(f"[ManimService] Scene timeline {timing_report['original_duration']:.2f}s scaled "
+                  f"x{timing_report['scale']:.3f} to {timing_report['final_duration']:.2f}s")
+        elif target_duration:
+            print("[ManimService] Scene timeline is not statically known; durations clamped only")
 
         script_path = self.code_dir / f"{filename}.py"
         with open(script_path, 'w', encoding='utf-8') as f:
             f.write(fixed_code)
         return script_path
     
-    def _render_video(self, script_path: Path) -> bool:
-        """Run Manim to render the video."""
+    def _render_video(self, script_path: Path, media_dir: Path, animation_range: tuple = None) -> dict:
+        """Run Manim to render the video (or one range of its animations) into the job's own media directory."""
         try:
             cmd = [
                 "manim",
                 f"-{settings.MANIM_QUALITY}",
                 f"--format={settings.MANIM_FORMAT}",
-                f"--media_dir={self.video_dir}",
+                f"--media_dir={media_dir}",
                 str(script_path),
                 settings.SCENE_CLASS_NAME
             ]
+            if animation_range:
+                cmd[-2:-2] = ["-n", f"{animation_range[0]},{animation_range[1]}"]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=settings.MANIM_RENDER_TIMEOUT)
             
             if result.returncode != 0:
                 print(f"Manim render failed with return code {result.returncode}")
                 print(f"STDOUT: {result.stdout}")
                 print(f"STDERR: {result.stderr}")
+                self._report_latex_error(result.stderr + result.stdout)
+                return {'ok': False, 'error': f"manim exited with code {result.returncode}",
+                        'log': result.stderr + result.stdout}
                 
-                # Check for LaTeX-related errors
-                error_output = result.stderr + result.stdout
-                if "latex" in error_output.lower() or "dvisvgm" in error_output.lower():
-                    print("\n" + "="*80)
-                    print("LATEX ERROR DETECTED!")
-                    print("="*80)
-                    print("LaTeX is not installed on your system.")
-                    print("The generated code is trying to use MathTex, Tex, or Matrix objects.")
-                    print("\nTo fix this:")
-                    print("1. Install LaTeX (see LATEX_SETUP.md in backend folder)")
-                    print("2. OR ask for simpler animations without mathematical notation")
-                    print("="*80 + "\n")
-                
-                return False
-                
-            return True
+            return {'ok': True}
             
+        except subprocess.TimeoutExpired:
+            print(f"Manim render timed out after {settings.MANIM_RENDER_TIMEOUT}s")
+            return {'ok': False, 'error': f"Render exceeded {settings.MANIM_RENDER_TIMEOUT}s timeout", 'log': ''}
         except Exception as e:
             print(f"Manim render error: {str(e)}")
-            return False
+            return {'ok': False, 'error': f"{type(e).__name__}: {str(e)}", 'log': ''}
+
+    def _render_video_warm(self, script_path: Path, media_dir: Path, animation_range: tuple = None) -> dict:
+        """Render the video on this render slot's warm worker process."""
+        worker = getattr(self._slot_state, 'worker', None)
+        if worker is None:
+            worker = WarmRenderWorker(
+                max_jobs=settings.MANIM_WORKER_MAX_JOBS,
+                max_rss_mb=settings.MANIM_WORKER_MAX_RSS_MB,
+                timeout=settings.MANIM_RENDER_TIMEOUT,
+                cwd=str(self.base_dir),
+            )
+            self._slot_state.worker = worker
+
+        result = worker.render({
+            'source': script_path.read_text(encoding='utf-8'),
+            'script_path': str(script_path),
+            'media_dir': str(media_dir),
+            'quality': settings.MANIM_QUALITY,
+            'format': settings.MANIM_FORMAT,
+            'scene_name': settings.SCENE_CLASS_NAME,
+            'animation_range': animation_range,
+        })
+        if not result['ok']:
+            print(f"Manim render failed in warm worker: {result['error']}")
+            print(result.get('log', ''))
+            self._report_latex_error(result['error'] + result.get('log', ''))
+        return result
+
+    def _report_latex_error(self, error_output: str):
+        """Print setup instructions when a render failed because LaTeX is missing."""
+        if "latex" in error_output.lower() or "dvisvgm" in error_output.lower():
+            print("\n" + "="*80)
+            print("LATEX ERROR DETECTED!")
+            print("="*80)
+            print("LaTeX is not installed on your system.")
+            print("The generated code is trying to use MathTex, Tex, or Matrix objects.")
+            print("\nTo fix this:")
+            print("1. Install LaTeX (see LATEX_SETUP.md in backend folder)")
+            print("2. OR ask for simpler animations without mathematical notation")
+            print("="*80 + "\n")
     
-    def _move_video(self, filename: str) -> Path:
-        """Find and move the generated video to the main videos folder."""
-        video_files = list(self.video_dir.glob(f"**/{settings.SCENE_CLASS_NAME}.mp4"))
-        if video_files:
+    def _find_rendered_video(self, media_dir: Path) -> Path:
+        """Return the scene's video inside a render workspace, or None."""
+        video_files = list(media_dir.glob(f"**/{settings.SCENE_CLASS_NAME}.mp4"))
+        return video_files[0] if video_files else None
+
+    def _move_video(self, filename: str, media_dir: Path) -> Path:
+        """Find the video rendered into media_dir and move it to the main videos folder."""
+        video_file = self._find_rendered_video(media_dir)
+        if video_file:
             final_video_path = self.video_dir / f"{filename}.mp4"
-            video_files[0].replace(final_video_path)
+            video_file.replace(final_video_path)
             return final_video_path
         return None
+
+    def _concat_videos(self, video_paths: list, output_path: Path, list_dir: Path) -> dict:
+        """Join videos with ffmpeg's concat demuxer, copying streams without re-encoding."""
+        list_path = list_dir / "segments.txt"
+        list_path.write_text(
+            "".join("file '{}'\n".format(str(Path(path).resolve()).replace("'", "'\\''")) for path in video_paths),
+            encoding='utf-8'
+        )
+        cmd = [
+            self._find_ffmpeg(), "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", str(list_path),
+            "-c", "copy",
+            "-movflags", "+faststart",
+            str(output_path)
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except OSError as e:
+            return {'ok': False, 'error': f"{type(e).__name__}: {str(e)}", 'log': ''}
+        if result.returncode != 0:
+            print(f"[ManimService] Segment concat failed: {result.stderr}")
+            return {'ok': False, 'error': f"ffmpeg concat exited with code {result.returncode}", 'log': result.stderr}
+        return {'ok': True}
     
-    def render_manim_video(self, manim_code: str):
-        """Render a Manim video from Python code and return paths."""
+    def _run_render_job(self, job: dict) -> dict:
+        """Render a queued job on a scheduler slot, preferring the slot's warm worker."""
+        if settings.MANIM_WARM_WORKERS:
+            try:
+                return self._render_video_warm(job['script_path'], job['media_dir'], job.get('animation_range'))
+            except (OSError, RuntimeError) as e:
+                print(f"[ManimService] Warm worker unavailable ({e}), falling back to the manim CLI")
+        return self._render_video(job['script_path'], job['media_dir'], job.get('animation_range'))
+
+    def _observe_render_job(self, label: str, job: dict, rendered: dict):
+        print(f"[ManimService] Render {label}: queued {job['queue_wait']:.2f}s, "
+              f"rendered {job['render_time']:.2f}s")
+        metrics.observe('render_queue_wait_seconds', 'Time renders spent waiting for a render slot',
+                        job['queue_wait'])
+        metrics.observe('render_execution_seconds', 'Time renders spent running on a render slot',
+                        job['render_time'], outcome='success' if rendered['ok'] else 'failure')
+
+    def _render_whole(self, filename: str, script_path: Path, priority: int) -> tuple[dict, Path]:
+        """Render the scene as one job; returns (render result, moved video path or None)."""
+        workspace = self._create_workspace(filename)
         try:
-            filename = self._generate_filename()
-            script_path = self._save_script(manim_code, filename)
-            
-            if self._render_video(script_path):
-                video_path = self._move_video(filename)
-                if video_path:
-                    return str(video_path), str(script_path)
+            job = {'script_path': script_path, 'media_dir': workspace}
+            rendered = self.render_scheduler.submit(job, priority=priority).result()
+            self._observe_render_job(filename, job, rendered)
+            video_path = self._move_video(filename, workspace) if rendered['ok'] else None
+        finally:
+            self._cleanup_workspace(workspace)
+        return rendered, video_path
+
+    def _render_segmented(self, filename: str, script_path: Path, priority: int,
+                          ranges: list) -> tuple[dict, Path]:
+        """
+        Render contiguous animation ranges as parallel jobs and join them.
+
+        Every range is queued on the render scheduler at once, so they run on
+        as many slots as are free. The partial videos are joined with ffmpeg's
+        concat demuxer using stream copy, which is what Manim itself does with
+        its per-animation partial movies, so the result should match a serial
+        render; tests/test_segmented_render.py checks that frame by frame.
+
+        Returns:
+            Tuple of (render result, video path or None)
+        """
+        workspaces = [self._create_workspace(f"{filename}-seg{index}") for index in range(len(ranges))]
+        try:
+            jobs = [
+                {'script_path': script_path, 'media_dir': workspace, 'animation_range': animation_range}
+                for workspace, animation_range in zip(workspaces, ranges)
+            ]
+            futures = [self.render_scheduler.submit(job, priority=priority) for job in jobs]
+            results = [future.result() for future in futures]
+            for index, (job, rendered) in enumerate(zip(jobs, results)):
+                self._observe_render_job(f"{filename} segment {index} {job['animation_range']}", job, rendered)
+
+            failed = next((rendered for rendered in results if not rendered['ok']), None)
+            if failed:
+                return failed, None
+            segment_videos = [self._find_rendered_video(workspace) for workspace in workspaces]
+            if not all(segment_videos):
+                return {'ok': True}, None
+
+            video_path = self.video_dir / f"{filename}.mp4"
+            joined = self._concat_videos(segment_videos, video_path, workspaces[0])
+            return joined, video_path if joined['ok'] else None
+        finally:
+            for workspace in workspaces:
+                self._cleanup_workspace(workspace)
+
+    def render(self, manim_code: str, filename: str = None, priority: int = 0,
+               target_duration: float = None) -> dict:
+        """
+        Render a Manim video from Python code, reporting why a render failed.
+
+        The render itself waits for a free slot on the render scheduler, so
+        only RENDER_WORKERS Manim processes run at once. Code that fails static
+        validation (see manim_validator) is rejected without rendering. With
+        RENDER_SEGMENTS > 1, scenes with enough animations are split into
+        ranges that render in parallel (see plan_animation_segments).
+
+        Args:
+            manim_code: Python source defining the scene
+            filename: Optional id used to name the script and video (default: a new unique id)
+            priority: Scheduler priority; lower values render first
+            target_duration: Narration length in seconds; the scene's run_times and
+                waits are rescaled to match it when the timeline is statically known
+
+        Returns:
+            Dictionary with 'video_path' (None if rendering failed), 'script_path',
+            and on failure 'error_class' (see classify_render_error), 'error'
+            and 'log' (the tail of the validator or Manim output)
+        """
+        result = {'video_path': None, 'script_path': None, 'error_class': None, 'error': None, 'log': ''}
+
+        def fail(error_class, error, log=''):
+            timer.outcome = 'failure'
+            result.update(error_class=error_class, error=error, log=log[-RENDER_LOG_TAIL_CHARS:])
+            return result
+
+        with metrics.time_stage('render') as timer:
+            try:
+                filename = filename or self._generate_filename()
+                script_path = self._save_script(manim_code, filename, target_duration)
+                result['script_path'] = str(script_path)
+
+                # Identical source renders to an identical video, so reuse a previous render
+                cache_key = self._render_cache_key(script_path.read_text(encoding='utf-8'))
+                entry, _ = self.render_cache.get(cache_key)
+                if entry:
+                    timer.outcome = 'cache_hit'
+                    video_path = link_or_copy(entry / f"video.{settings.MANIM_FORMAT}", self.video_dir / f"{filename}.mp4")
+                    print(f"[ManimService] Render cache hit ({cache_key[:12]}), skipped rendering")
+                    result['video_path'] = str(video_path)
+                    return result
+
+                # Reject code that cannot render before it takes a render slot
+                with metrics.time_stage('validation') as validation_timer:
+                    diagnostics = validate_manim_code(script_path.read_text(encoding='utf-8'))
+                    errors = [d for d in diagnostics if d['severity'] == 'error']
+                    if errors:
+                        validation_timer.outcome = 'failure'
+                if diagnostics:
+                    print(f"[ManimService] Validation of {filename}:\n{format_diagnostics(diagnostics)}")
+                if errors:
+                    print("Manim code rejected by validation - not rendering")
+                    return fail('validation', errors[0]['message'], format_diagnostics(errors))
+
+                ranges = plan_animation_segments(
+                    script_path.read_text(encoding='utf-8'),
+                    settings.RENDER_SEGMENTS, settings.RENDER_SEGMENT_MIN_ANIMATIONS
+                )
+                if ranges:
+                    print(f"[ManimService] Rendering {filename} in {len(ranges)} segments: {ranges}")
+                    rendered, video_path = self._render_segmented(filename, script_path, priority, ranges)
                 else:
-                    print("Warning: Video file not found after successful render")
-                    return None, str(script_path)
-            else:
-                print("Manim render failed - check error messages above")
-                return None, str(script_path)
+                    rendered, video_path = self._render_whole(filename, script_path, priority)
+
+                if rendered['ok']:
+                    if video_path:
+                        try:
+                            self.render_cache.put(cache_key, {f"video.{settings.MANIM_FORMAT}": video_path})
+                        except OSError as e:
+                            print(f"[ManimService] Warning: Failed to cache render: {str(e)}")
+                        result['video_path'] = str(video_path)
+                        return result
+                    else:
+                        print("Warning: Video file not found after successful render")
+                        return fail('missing_output', 'Video file not found after successful render')
+                else:
+                    print("Manim render failed - check error messages above")
+                    return fail(
+                        classify_render_error(rendered['error'], rendered.get('log', '')),
+                        rendered['error'], rendered.get('log', '')
+                    )
                 
-        except Exception as e:
-            print(f"Manim service error: {str(e)}")
-            return None, str(script_path) if 'script_path' in locals() else None
+            except Exception as e:
+                print(f"Manim service error: {str(e)}")
+                fail('service_error', f"{type(e).__name__}: {str(e)}")
+                timer.outcome = 'error'
+                return result
+
+    def render_manim_video(self, manim_code: str, filename: str = None, priority: int = 0,
+                           target_duration: float = None):
+        """
+        Render a Manim video from Python code and return paths (see render()).
+
+        Returns:
+            Tuple of (video_path, script_path); video_path is None if rendering failed
+        """
+        result = self.render(manim_code, filename, priority, target_duration)
+        return result['video_path'], result['script_path']
     
     def _find_ffmpeg(self) -> str:
         """
@@ -153,10 +458,65 @@ class ManimService:
         # If not found, return 'ffmpeg' and let it fail with a clear error
         return 'ffmpeg'
 
+    def prepare_mux_audio(self, audio_path: str) -> str:
+        """
+        Encode narration to AAC once so combine_video_audio can stream-copy it.
+
+        ElevenLabs only offers MP3, PCM and telephony formats, none of which
+        every browser plays from an MP4. The AAC (.m4a) copy is written next
+        to the MP3 and cached by the MP3's contents, so repeated narration is
+        never encoded twice.
+
+        Returns:
+            Path to the .m4a file, or the original path if encoding failed
+            (combine_video_audio then encodes during the mux)
+        """
+        audio_path = Path(audio_path)
+        if audio_path.suffix.lower() in ('.m4a', '.aac'):
+            return str(audio_path)
+
+        with metrics.time_stage('audio_encode') as timer:
+            try:
+                output_path = audio_path.with_suffix('.m4a')
+                cache_key = make_cache_key('aac', hash_file(audio_path), settings.MUX_AUDIO_BITRATE)
+                entry, _ = self.mux_audio_cache.get(cache_key)
+                if entry:
+                    timer.outcome = 'cache_hit'
+                    return str(link_or_copy(entry / 'audio.m4a', output_path))
+
+                cmd = [
+                    self._find_ffmpeg(), "-y",
+                    "-i", str(audio_path),
+                    "-map", "0:a:0",
+                    "-c:a", "aac",
+                    "-b:a", settings.MUX_AUDIO_BITRATE,
+                    str(output_path)
+                ]
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                if result.returncode != 0:
+                    print(f"[ManimService] AAC encode failed, audio will be encoded during the mux: {result.stderr}")
+                    timer.outcome = 'failure'
+                    return str(audio_path)
+
+                try:
+                    self.mux_audio_cache.put(cache_key, {'audio.m4a': output_path})
+                except OSError as e:
+                    print(f"[ManimService] Warning: Failed to cache encoded audio: {str(e)}")
+                return str(output_path)
+
+            except Exception as e:
+                print(f"[ManimService] Error encoding audio, it will be encoded during the mux: {str(e)}")
+                timer.outcome = 'error'
+                return str(audio_path)
+
     def combine_video_audio(self, video_path: str, audio_path: str, output_filename: str = None) -> str:
         """
         Combine video and audio files using ffmpeg.
 
+        AAC audio (see prepare_mux_audio) is stream-copied, so the mux is a
+        pure remux; other audio is encoded to AAC. The moov atom is moved to
+        the front so playback can start before the download finishes.
+
         Args:
             video_path: Path to the video file (without audio)
             audio_path: Path to the audio file
@@ -165,92 +525,139 @@ class ManimService:
         Returns:
             Path to the combined video file in final_videos directory
         """
-        try:
-            video_path = Path(video_path)
-            audio_path = Path(audio_path)
+        with metrics.time_stage('mux') as timer:
+            try:
+                video_path = Path(video_path)
+                audio_path = Path(audio_path)
 
-            if not video_path.exists():
-                raise FileNotFoundError(f"Video file not found: {video_path}")
-            if not audio_path.exists():
-                raise FileNotFoundError(f"Audio file not found: {audio_path}")
+                if not video_path.exists():
+                    raise FileNotFoundError(f"Video file not found: {video_path}")
+                if not audio_path.exists():
+                    raise FileNotFoundError(f"Audio file not found: {audio_path}")
 
-            # Use the video filename or custom filename
-            if output_filename is None:
-                output_filename = video_path.name
+                # Use the video filename or custom filename
+                if output_filename is None:
+                    output_filename = video_path.name
 
-            final_video_path = self.final_videos_dir / output_filename
+                final_video_path = self.final_videos_dir / output_filename
 
-            # Find ffmpeg executable
-            ffmpeg_exe = self._find_ffmpeg()
+                # Find ffmpeg executable
+                ffmpeg_exe = self._find_ffmpeg()
 
-            # Use ffmpeg to combine video and audio
-            # -i: input files
-            # -c:v copy: copy video codec (no re-encoding)
-            # -c:a aac: encode audio to aac
-            # -shortest: finish encoding when the shortest input stream ends
-            cmd = [
-                ffmpeg_exe,
-                "-y",  # Overwrite output file if it exists
-                "-i", str(video_path),
-                "-i", str(audio_path),
-                "-c:v", "copy",  # Copy video stream without re-encoding
-                "-c:a", "aac",   # Encode audio to AAC
-                "-shortest",     # End when shortest stream ends
-                str(final_video_path)
-            ]
+                # Use ffmpeg to combine video and audio
+                # -i: input files
+                # -map: video from the render, audio from the narration
+                # -c:v copy: copy video codec (no re-encoding)
+                # -c:a copy/aac: copy AAC audio, encode anything else to AAC
+                # -shortest: finish when the shortest input stream ends
+                # -movflags +faststart: put the index first for progressive playback
+                audio_codec = "copy" if audio_path.suffix.lower() in ('.m4a', '.aac') else "aac"
+                cmd = [
+                    ffmpeg_exe,
+                    "-y",  # Overwrite output file if it exists
+                    "-i", str(video_path),
+                    "-i", str(audio_path),
+                    "-map", "0:v:0",
+                    "-map", "1:a:0",
+                    "-c:v", "copy",  # Copy video stream without re-encoding
+                    "-c:a", audio_codec,
+                    "-shortest",     # End when shortest stream ends
+                    "-movflags", "+faststart",
+                    str(final_video_path)
+                ]
 
-            print(f"[ManimService] Combining video and audio...")
-            print(f"[ManimService] Using ffmpeg: {ffmpeg_exe}")
-            print(f"[ManimService] Video: {video_path.name}")
-            print(f"[ManimService] Audio: {audio_path.name}")
-            print(f"[ManimService] Output: {final_video_path.name}")
+                print(f"[ManimService] Combining video and audio...")
+                print(f"[ManimService] Using ffmpeg: {ffmpeg_exe}")
+                print(f"[ManimService] Video: {video_path.name}")
+                print(f"[ManimService] Audio: {audio_path.name}")
+                print(f"[ManimService] Output: {final_video_path.name}")
 
-            result = subprocess.run(cmd, capture_output=True, text=True)
+                result = subprocess.run(cmd, capture_output=True, text=True)
 
-            if result.returncode != 0:
-                print(f"[ManimService] FFmpeg failed with return code {result.returncode}")
-                print(f"[ManimService] STDOUT: {result.stdout}")
-                print(f"[ManimService] STDERR: {result.stderr}")
+                if result.returncode != 0:
+                    print(f"[ManimService] FFmpeg failed with return code {result.returncode}")
+                    print(f"[ManimService] STDOUT: {result.stdout}")
+                    print(f"[ManimService] STDERR: {result.stderr}")
+                    timer.outcome = 'failure'
+                    return None
+
+                print(f"[ManimService] Successfully combined video and audio: {final_video_path.name}")
+
+                # Delete the original video file from manim_videos after successful combination
+                try:
+                    if video_path.exists():
+                        video_path.unlink()
+                        print(f"[ManimService] Deleted original video: {video_path.name}")
+                except Exception as delete_error:
+                    print(f"[ManimService] Warning: Could not delete original video: {delete_error}")
+
+                return str(final_video_path)
+
+            except FileNotFoundError as e:
+                if 'ffmpeg' in str(e).lower() or 'WinError 2' in str(e):
+                    print("\n" + "="*80)
+                    print("FFMPEG NOT FOUND!")
+                    print("="*80)
+                    print("FFmpeg is required to combine video and audio but was not found on your system.")
+                    print("\nTo fix this:")
+                    print("1. Download ffmpeg from: https://ffmpeg.org/download.html")
+                    print("   For Windows: https://www.gyan.dev/ffmpeg/builds/")
+                    print("2. Extract the downloaded archive")
+                    print("3. Add the 'bin' folder to your system PATH")
+                    print("   OR place ffmpeg.exe in one of these locations:")
+                    print("   - C:\\ffmpeg\\bin\\ffmpeg.exe")
+                    print("   - C:\\Program Files\\ffmpeg\\bin\\ffmpeg.exe")
+                    print("4. Restart your terminal/IDE")
+                    print("="*80 + "\n")
+                print(f"[ManimService] Error: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                timer.outcome = 'error'
+                return None
+            except Exception as e:
+                print(f"[ManimService] Error combining video and audio: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                timer.outcome = 'error'
                 return None
+    
+    def concat_videos(self, video_paths: list, output_filename: str) -> str:
+        """
+        Join finished videos (with audio) end to end without re-encoding.
 
-            print(f"[ManimService] Successfully combined video and audio: {final_video_path.name}")
+        Args:
+            video_paths: Videos in playback order; all must share codecs and parameters
+            output_filename: Name of the joined video in the final_videos directory
 
-            # Delete the original video file from manim_videos after successful combination
+        Returns:
+            Path to the joined video, or None if ffmpeg failed
+        """
+        with metrics.time_stage('concat') as timer:
+            output_path = self.final_videos_dir / output_filename
+            list_dir = self._create_workspace(Path(output_filename).stem)
             try:
-                if video_path.exists():
-                    video_path.unlink()
-                    print(f"[ManimService] Deleted original video: {video_path.name}")
-            except Exception as delete_error:
-                print(f"[ManimService] Warning: Could not delete original video: {delete_error}")
-
-            return str(final_video_path)
-
-        except FileNotFoundError as e:
-            if 'ffmpeg' in str(e).lower() or 'WinError 2' in str(e):
-                print("\n" + "="*80)
-                print("FFMPEG NOT FOUND!")
-                print("="*80)
-                print("FFmpeg is required to combine video and audio but was not found on your system.")
-                print("\nTo fix this:")
-                print("1. Download ffmpeg from: https://ffmpeg.org/download.html")
-                print("   For Windows: https://www.gyan.dev/ffmpeg/builds/")
-                print("2. Extract the downloaded archive")
-                print("3. Add the 'bin' folder to your system PATH")
-                print("   OR place ffmpeg.exe in one of these locations:")
-                print("   - C:\\ffmpeg\\bin\\ffmpeg.exe")
-                print("   - C:\\Program Files\\ffmpeg\\bin\\ffmpeg.exe")
-                print("4. Restart your terminal/IDE")
-                print("="*80 + "\n")
-            print(f"[ManimService] Error: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None
-        except Exception as e:
-            print(f"[ManimService] Error combining video and audio: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None
-    
+                joined = self._concat_videos(video_paths, output_path, list_dir)
+            finally:
+                self._cleanup_workspace(list_dir)
+            if not joined['ok']:
+                timer.outcome = 'failure'
+                return None
+            print(f"[ManimService] Joined {len(video_paths)} videos into {output_path.name}")
+            return str(output_path)
+
+    def probe_duration(self, media_path) -> float:
+        """Read a media file's container duration in seconds from ffmpeg's input banner (no ffprobe needed)."""
+        result = subprocess.run([self._find_ffmpeg(), "-i", str(media_path)], capture_output=True, text=True)
+        match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+        if not match:
+            raise Exception(f"Could not read the duration of {Path(media_path).name}")
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def get_video_path(self, filename: str) -> Path:
+        """Get the full path to a rendered video file (without audio)."""
+        return self.video_dir / filename
+
     def get_script_path(self, filename: str) -> Path:
         """Get the full path to a script file."""
         return self.code_dir / filename
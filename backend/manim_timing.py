@@ -0,0 +1,386 @@
+from settings import settings
+import ast
+
+# Manim's default duration for self.play(...) and self.wait() without arguments
+DEFAULT_RUN_TIME = 1.0
+
+
+def _is_self_call(node, method: str) -> bool:
+    """True if node is a call of the form self.<method>(...)."""
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == method
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == 'self'
+    )
+
+
+def _scale_expr(expr, factor: float):
+    """Return expr multiplied by factor, folding numeric literals."""
+    if isinstance(expr, ast.Constant) and isinstance(expr.value, (int, float)) and not isinstance(expr.value, bool):
+        return ast.Constant(value=round(expr.value * factor, 3))
+    return ast.BinOp(left=expr, op=ast.Mult(), right=ast.Constant(value=round(factor, 4)))
+
+
+class _TimingScaler(ast.NodeTransformer):
+    """Multiplies every play run_time and wait duration by a constant factor."""
+
+    def __init__(self, factor: float):
+        self.factor = factor
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if _is_self_call(node, 'wait'):
+            if node.args:
+                node.args[0] = _scale_expr(node.args[0], self.factor)
+            else:
+                duration = next((kw for kw in node.keywords if kw.arg == 'duration'), None)
+                if duration:
+                    duration.value = _scale_expr(duration.value, self.factor)
+                else:
+                    node.args.append(ast.Constant(value=round(DEFAULT_RUN_TIME * self.factor, 3)))
+        elif _is_self_call(node, 'play'):
+            run_time = next((kw for kw in node.keywords if kw.arg == 'run_time'), None)
+            if run_time:
+                run_time.value = _scale_expr(run_time.value, self.factor)
+            else:
+                # Animations may carry their own run_time; otherwise Manim plays for 1 second
+                inner = [
+                    kw for arg in node.args for child in ast.walk(arg)
+                    if isinstance(child, ast.Call) for kw in child.keywords if kw.arg == 'run_time'
+                ]
+                for kw in inner:
+                    kw.value = _scale_expr(kw.value, self.factor)
+                if not inner:
+                    node.keywords.append(ast.keyword(
+                        arg='run_time', value=ast.Constant(value=round(DEFAULT_RUN_TIME * self.factor, 3))
+                    ))
+        return node
+
+
+# Shortest wait or run_time the normalizer lets through; Manim rejects non-positive durations
+MIN_DURATION = 0.1
+
+_SAFE_FUNCTIONS = {'max': max, 'min': min, 'abs': abs, 'round': round}
+
+
+def _const_eval(expr, env: dict):
+    """Evaluate a numeric expression built from literals, known names and max/min/abs/round.
+
+    Returns:
+        The value as a float, or None if the expression is not statically known
+    """
+    if isinstance(expr, ast.Constant) and isinstance(expr.value, (int, float)) and not isinstance(expr.value, bool):
+        return float(expr.value)
+    if isinstance(expr, ast.Name):
+        return env.get(expr.id)
+    if isinstance(expr, ast.UnaryOp) and isinstance(expr.op, (ast.USub, ast.UAdd)):
+        value = _const_eval(expr.operand, env)
+        if value is None:
+            return None
+        return -value if isinstance(expr.op, ast.USub) else value
+    if isinstance(expr, ast.BinOp) and isinstance(expr.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        left, right = _const_eval(expr.left, env), _const_eval(expr.right, env)
+        if left is None or right is None:
+            return None
+        if isinstance(expr.op, ast.Add):
+            return left + right
+        if isinstance(expr.op, ast.Sub):
+            return left - right
+        if isinstance(expr.op, ast.Mult):
+            return left * right
+        return left / right if right else None
+    if (isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name)
+            and expr.func.id in _SAFE_FUNCTIONS and expr.args and not expr.keywords):
+        args = [_const_eval(arg, env) for arg in expr.args]
+        if any(arg is None for arg in args):
+            return None
+        try:
+            return float(_SAFE_FUNCTIONS[expr.func.id](*args))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _contains_timeline_call(node) -> bool:
+    return any(_is_self_call(child, 'play') or _is_self_call(child, 'wait') for child in ast.walk(node))
+
+
+def _find_scene(tree, scene_name: str):
+    """Return the ClassDef of the scene, or None."""
+    return next(
+        (node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == scene_name),
+        None
+    )
+
+
+def _call_duration(call, env: dict):
+    """Static duration of a self.play or self.wait call (None if not statically known)."""
+    if _is_self_call(call, 'wait'):
+        if call.args:
+            return _const_eval(call.args[0], env)
+        duration = next((kw for kw in call.keywords if kw.arg == 'duration'), None)
+        return _const_eval(duration.value, env) if duration else DEFAULT_RUN_TIME
+
+    run_time = next((kw for kw in call.keywords if kw.arg == 'run_time'), None)
+    if run_time:
+        return _const_eval(run_time.value, env)
+    inner = [
+        kw.value for arg in call.args for child in ast.walk(arg)
+        if isinstance(child, ast.Call) for kw in child.keywords if kw.arg == 'run_time'
+    ]
+    if not inner:
+        return DEFAULT_RUN_TIME
+    values = [_const_eval(value, env) for value in inner]
+    return None if any(value is None for value in values) else max(values)
+
+
+class _Timeline:
+    """Straight-line walk of construct() that collects play/wait calls in order."""
+
+    def __init__(self, helper_methods: set):
+        self.helper_methods = helper_methods
+        self.events = []
+        self.dynamic = False
+        self.env = {}
+
+    def walk(self, statements):
+        for stmt in statements:
+            self._statement(stmt)
+
+    def _statement(self, stmt):
+        if isinstance(stmt, ast.Assign):
+            value = _const_eval(stmt.value, self.env)
+            for target in stmt.targets:
+                if isinstance(target, ast.Name):
+                    if value is None:
+                        self.env.pop(target.id, None)
+                    else:
+                        self.env[target.id] = value
+        elif isinstance(stmt, ast.For) and _contains_timeline_call(stmt):
+            count = self._range_count(stmt.iter)
+            if count is None or stmt.orelse:
+                self.dynamic = True
+                return
+            for _ in range(count):
+                self.walk(stmt.body)
+            return
+        elif isinstance(stmt, ast.With):
+            self.walk(stmt.body)
+            return
+        elif isinstance(stmt, (ast.If, ast.While, ast.Try, ast.FunctionDef)) and _contains_timeline_call(stmt):
+            self.dynamic = True
+            return
+
+        for child in ast.walk(stmt):
+            if _is_self_call(child, 'play') or _is_self_call(child, 'wait'):
+                self.events.append({
+                    'kind': child.func.attr,
+                    'line': child.lineno,
+                    'duration': _call_duration(child, self.env),
+                })
+            elif isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute) \
+                    and child.func.attr in self.helper_methods:
+                self.dynamic = True
+
+    def _range_count(self, node):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'range'):
+            return None
+        bounds = [_const_eval(arg, self.env) for arg in node.args]
+        if not bounds or len(bounds) > 2 or any(bound is None for bound in bounds):
+            return None
+        start, stop = (0.0, bounds[0]) if len(bounds) == 1 else bounds
+        return max(int(stop - start), 0)
+
+
+def analyze_scene_timeline(manim_code: str, scene_name: str = None) -> dict:
+    """
+    Statically compute a scene's timeline from its construct() method.
+
+    Args:
+        manim_code: Python source of the generated scene
+        scene_name: Scene class to analyze (default: settings.SCENE_CLASS_NAME)
+
+    Returns:
+        Dictionary with 'events' (play/wait calls in execution order, each with
+        'kind', 'line' and 'duration'), 'total_duration' (None when any duration
+        or the control flow is not statically known) and 'static' (False when
+        loops, branches or helper methods hide the order of calls)
+    """
+    result = {'events': [], 'total_duration': None, 'static': False}
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return result
+
+    scene = _find_scene(tree, scene_name or settings.SCENE_CLASS_NAME)
+    construct = scene and next(
+        (node for node in scene.body if isinstance(node, ast.FunctionDef) and node.name == 'construct'),
+        None
+    )
+    if construct is None:
+        return result
+
+    helper_methods = {
+        node.name for node in scene.body
+        if isinstance(node, ast.FunctionDef) and node.name != 'construct' and _contains_timeline_call(node)
+    }
+    timeline = _Timeline(helper_methods)
+    timeline.walk(construct.body)
+
+    result['events'] = timeline.events
+    result['static'] = not timeline.dynamic
+    if result['static'] and all(event['duration'] is not None for event in timeline.events):
+        result['total_duration'] = sum(event['duration'] for event in timeline.events)
+    return result
+
+
+class _DurationClamper(ast.NodeTransformer):
+    """Keeps every wait duration and play run_time at or above MIN_DURATION."""
+
+    def _clamp(self, expr):
+        if isinstance(expr, ast.Constant) and isinstance(expr.value, (int, float)):
+            return ast.Constant(value=max(MIN_DURATION, expr.value))
+        if (isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name) and expr.func.id == 'max'
+                and any(_const_eval(arg, {}) is not None and _const_eval(arg, {}) >= MIN_DURATION for arg in expr.args)):
+            return expr
+        return ast.Call(func=ast.Name(id='max', ctx=ast.Load()), args=[ast.Constant(value=MIN_DURATION), expr], keywords=[])
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if _is_self_call(node, 'wait') and node.args:
+            node.args[0] = self._clamp(node.args[0])
+        for kw in node.keywords:
+            if kw.arg in ('run_time', 'duration') and (
+                    _is_self_call(node, 'play') or _is_self_call(node, 'wait') or isinstance(node.func, ast.Name)):
+                kw.value = self._clamp(kw.value)
+        return node
+
+
+def normalize_scene_timing(manim_code: str, target_duration: float = None) -> tuple[str, dict]:
+    """
+    Clamp invalid durations and fit the scene's timeline to the narration.
+
+    Every self.wait duration and run_time is kept at or above MIN_DURATION
+    (replacing the old regex that only patched self.wait(a - b)). When
+    target_duration is given and the timeline is statically known, all
+    run_times and waits are rescaled proportionally so the scene ends when
+    the audio does, instead of ffmpeg's -shortest cutting either stream.
+
+    Args:
+        manim_code: Python source of the generated scene
+        target_duration: Audio duration in seconds to fit the scene to
+
+    Returns:
+        Tuple of (normalized_code, report); report holds 'original_duration',
+        'final_duration' and 'scale' (None where not applicable)
+    """
+    report = {'original_duration': None, 'final_duration': None, 'scale': None}
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return manim_code, report
+
+    tree = ast.fix_missing_locations(_DurationClamper().visit(tree))
+    clamped_code = ast.unparse(tree)
+    timeline = analyze_scene_timeline(clamped_code)
+    report['original_duration'] = report['final_duration'] = timeline['total_duration']
+
+    if target_duration and target_duration > 0 and timeline['total_duration']:
+        factor = target_duration / timeline['total_duration']
+        report['scale'] = factor
+        clamped_code = rescale_scene_timing(clamped_code, factor)
+        report['final_duration'] = analyze_scene_timeline(clamped_code)['total_duration']
+
+    return clamped_code, report
+
+
+def rescale_scene_timing(manim_code: str, factor: float) -> str:
+    """
+    Stretch or compress a scene's timeline by a constant factor.
+
+    Every self.play run_time and self.wait duration is multiplied by factor,
+    so animations keep their relative placement while the scene's total length
+    follows the new audio. Code that does not parse is returned unchanged.
+
+    Args:
+        manim_code: Python source of the generated scene
+        factor: Ratio of the real narration duration to the one the code was written for
+
+    Returns:
+        The rescaled source
+    """
+    if factor <= 0 or abs(factor - 1.0) < 0.01:
+        return manim_code
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return manim_code
+    tree = ast.fix_missing_locations(_TimingScaler(factor).visit(tree))
+    return ast.unparse(tree)
+
+
+def fit_speculative_timing(manim_code: str, audio_duration: float, estimated_duration: float) -> tuple[str, float]:
+    """
+    Fit code written against estimated timings to the real narration length.
+
+    A statically known timeline is left alone, because normalize_scene_timing()
+    fits it to the audio exactly when the scene is saved. Any other timeline
+    (loops over data, branches, helper methods) is rescaled by the ratio of
+    the real to the estimated narration length, the only estimate available.
+
+    Args:
+        manim_code: Python source generated from estimated timings
+        audio_duration: Real narration length in seconds
+        estimated_duration: Narration length the code was written for
+
+    Returns:
+        Tuple of (code, factor); factor is None when the code was left for the normalizer
+    """
+    if analyze_scene_timeline(manim_code)['total_duration'] or not audio_duration:
+        return manim_code, None
+    factor = audio_duration / max(estimated_duration, 0.1)
+    return rescale_scene_timing(manim_code, factor), factor
+
+
+# Calls that advance mobjects by each frame's dt. A skipped animation applies its whole
+# run_time as a single dt step, so scenes using these cannot be split without changing frames.
+_DT_UPDATER_CALLS = {'add_updater', 'always_rotate', 'always_shift', 'TracedPath', 'turn_animation_into_updater',
+                     'cycle_animation'}
+
+
+def plan_animation_segments(manim_code: str, segments: int, min_animations: int) -> list:
+    """
+    Split a scene's animations into contiguous ranges that can render independently.
+
+    Manim numbers every self.play and self.wait call in execution order, and
+    `manim -n start,end` renders only that inclusive range. A range renders the
+    same frames as in a full render because the skipped animations before it
+    still run (just without writing frames).
+
+    Args:
+        manim_code: Python source of the generated scene
+        segments: Maximum number of ranges
+        min_animations: Minimum number of animations per range
+
+    Returns:
+        List of (start, end) inclusive animation index ranges, or an empty list
+        when the scene should render in one piece (dynamic timeline, dt-based
+        updaters, or too few animations)
+    """
+    timeline = analyze_scene_timeline(manim_code)
+    if not timeline['static']:
+        return []
+    tree = ast.parse(manim_code)
+    for node in ast.walk(tree):
+        name = getattr(node, 'attr', None) or getattr(node, 'id', None)
+        if isinstance(node, (ast.Attribute, ast.Name)) and name in _DT_UPDATER_CALLS:
+            return []
+
+    count = len(timeline['events'])
+    segments = min(segments, count // max(min_animations, 1))
+    if segments < 2:
+        return []
+    bounds = [round(i * count / segments) for i in range(segments + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(segments)]
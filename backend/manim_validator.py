@@ -0,0 +1,194 @@
+from settings import settings
+import ast
+import builtins
+import importlib.util
+import json
+import shutil
+import subprocess
+import sys
+import threading
+
+# Mobjects that shell out to LaTeX (and dvisvgm) when constructed
+LATEX_MOBJECTS = {
+    'MathTex', 'Tex', 'SingleStringMathTex', 'Title', 'BulletedList',
+    'Matrix', 'DecimalMatrix', 'IntegerMatrix', 'DecimalNumber', 'Integer', 'Variable',
+}
+
+# None until loaded; _UNAVAILABLE once loading failed, so a broken install is not retried per validation
+_manim_names = None
+_manim_names_lock = threading.Lock()
+_UNAVAILABLE = frozenset()
+_preload_thread = None
+_preload_lock = threading.Lock()
+
+
+def _load_manim_names():
+    """Import Manim in a child process and return its exported names, or _UNAVAILABLE."""
+    if importlib.util.find_spec('manim') is None:
+        print("[ManimValidator] Manim is not installed; skipping undefined-name checks")
+        return _UNAVAILABLE
+    cmd = [
+        sys.executable, "-c",
+        "import json, manim; "
+        "print(json.dumps(getattr(manim, '__all__', None) or [n for n in dir(manim) if not n.startswith('_')]))"
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        if result.returncode != 0:
+            raise RuntimeError(f"import failed with return code {result.returncode}: {result.stderr[-500:]}")
+        return set(json.loads(result.stdout.strip().splitlines()[-1]))
+    except (OSError, ValueError, IndexError, RuntimeError, subprocess.TimeoutExpired) as e:
+        print(f"[ManimValidator] Could not load the Manim namespace: {e}")
+        return _UNAVAILABLE
+
+
+def manim_namespace(wait: bool = True):
+    """
+    Names exported by `from manim import *`.
+
+    Manim is imported once in a child process, so the server never pays for
+    (or is destabilized by) importing it; the result, or the failure to get
+    it, is memoized.
+
+    Args:
+        wait: Load the namespace if needed. With False, return None straight
+            away while it is still loading (starting the load if nobody has)
+
+    Returns:
+        Set of names, or None when Manim is unavailable or not loaded yet
+    """
+    global _manim_names
+    if _manim_names is None:
+        if not wait:
+            preload_manim_namespace()
+            return None
+        with _manim_names_lock:
+            if _manim_names is None:
+                _manim_names = _load_manim_names()
+    return None if _manim_names is _UNAVAILABLE else _manim_names
+
+
+def preload_manim_namespace():
+    """Load the Manim namespace on a background thread (once)."""
+    global _preload_thread
+    with _preload_lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(target=manim_namespace, name="manim-namespace", daemon=True)
+            _preload_thread.start()
+
+
+def latex_available() -> bool:
+    """True when the LaTeX toolchain Manim needs for Tex/MathTex is on PATH."""
+    return bool(shutil.which('latex') and shutil.which('dvisvgm'))
+
+
+def _diagnostic(severity: str, code: str, message: str, node=None) -> dict:
+    return {
+        'severity': severity,
+        'code': code,
+        'message': message,
+        'line': getattr(node, 'lineno', None),
+        'col': getattr(node, 'col_offset', None),
+    }
+
+
+def _bound_names(tree) -> set:
+    """Every name the module binds anywhere (one flat scope, so lookups never false-positive)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias) and node.name != '*':
+            names.add((node.asname or node.name).split('.')[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+    return names
+
+
+def _star_imports(tree) -> list:
+    return [
+        node.module for node in ast.walk(tree)
+        if isinstance(node, ast.ImportFrom) and any(alias.name == '*' for alias in node.names)
+    ]
+
+
+def validate_manim_code(manim_code: str, scene_name: str = None) -> list:
+    """
+    Statically check generated Manim code before it is rendered.
+
+    Checks, in order: the code parses, the scene class and its construct()
+    method exist, every name it reads is defined (against the Manim namespace,
+    skipped while it is loading or when Manim or a non-Manim star import makes
+    that unknowable), and no LaTeX-backed mobject is used when LaTeX is not
+    installed.
+
+    Args:
+        manim_code: Python source of the generated scene
+        scene_name: Scene class that must exist (default: settings.SCENE_CLASS_NAME)
+
+    Returns:
+        List of diagnostics, each a dict with 'severity' ('error' or 'warning'),
+        'code', 'message', 'line' and 'col'; the code can be rendered when no
+        diagnostic has severity 'error'
+    """
+    scene_name = scene_name or settings.SCENE_CLASS_NAME
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError as e:
+        return [{
+            'severity': 'error',
+            'code': 'syntax-error',
+            'message': f"SyntaxError: {e.msg}",
+            'line': e.lineno,
+            'col': e.offset,
+        }]
+
+    diagnostics = []
+    scene = next(
+        (node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == scene_name),
+        None
+    )
+    if scene is None:
+        diagnostics.append(_diagnostic('error', 'missing-scene', f"No top-level class named {scene_name}"))
+    elif not any(isinstance(node, ast.FunctionDef) and node.name == 'construct' for node in scene.body):
+        diagnostics.append(_diagnostic('error', 'missing-construct', f"{scene_name} has no construct() method", scene))
+
+    star_modules = _star_imports(tree)
+    known = None
+    if all(module == 'manim' for module in star_modules):
+        # Never wait on the background load; the check is skipped until it finishes
+        manim_names = manim_namespace(wait=False) if star_modules else set()
+        if manim_names is not None:
+            known = _bound_names(tree) | set(dir(builtins)) | manim_names | {'__name__', '__file__'}
+    if known is not None:
+        reported = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) \
+                    and node.id not in known and node.id not in reported:
+                reported.add(node.id)
+                diagnostics.append(_diagnostic('error', 'undefined-name', f"Undefined name '{node.id}'", node))
+
+    if not latex_available():
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in LATEX_MOBJECTS:
+                diagnostics.append(_diagnostic(
+                    'error', 'latex-unavailable',
+                    f"{node.func.id} requires LaTeX, which is not installed; use Text instead", node
+                ))
+
+    return diagnostics
+
+
+def format_diagnostics(diagnostics: list) -> str:
+    """Render diagnostics one per line, e.g. 'line 12: error undefined-name: ...'."""
+    return "\n".join(
+        f"line {d['line'] or '?'}: {d['severity']} {d['code']}: {d['message']}" for d in diagnostics
+    )
@@ -0,0 +1,214 @@
+"""Long-lived Manim render worker.
+
+The worker runs as `python manim_worker.py <max_jobs> <max_rss_mb>`, imports
+Manim once, and then renders scenes from source it receives as JSON lines on
+stdin. Each result goes back as one JSON line on the original stdout. Anything
+Manim, ffmpeg or the scene itself prints goes to stderr, so it cannot corrupt
+the protocol.
+
+This module is also imported by the server for WarmRenderWorker, so keep its
+top-level imports light and never import Manim outside the worker process.
+"""
+from pathlib import Path
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+# Manim CLI quality flags mapped to the config names used by tempconfig
+QUALITY_NAMES = {
+    'ql': 'low_quality',
+    'qm': 'medium_quality',
+    'qh': 'high_quality',
+    'qp': 'production_quality',
+    'qk': 'fourk_quality',
+}
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB (0 when it cannot be measured)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+def _render_job(job: dict) -> dict:
+    """Render one scene in a fresh namespace (runs inside the worker process)."""
+    from manim import tempconfig
+
+    script_path = job['script_path']
+    overrides = {
+        'media_dir': job['media_dir'],
+        'quality': QUALITY_NAMES.get(job['quality'], 'low_quality'),
+        'format': job['format'],
+        'input_file': script_path,
+        'scene_names': [job['scene_name']],
+        'output_file': job['scene_name'],
+        'write_to_movie': True,
+    }
+    if job.get('animation_range'):
+        # Same inclusive range as the CLI's -n start,end
+        overrides['from_animation_number'], overrides['upto_animation_number'] = job['animation_range']
+    try:
+        with tempconfig(overrides):
+            namespace = {'__name__': '__manim_job__', '__file__': script_path}
+            exec(compile(job['source'], script_path, 'exec'), namespace)
+            scene = namespace[job['scene_name']]()
+            scene.render()
+            video_path = scene.renderer.file_writer.movie_file_path
+        return {'ok': True, 'video_path': str(video_path) if video_path else None}
+    except BaseException as e:
+        if isinstance(e, (KeyboardInterrupt, SystemExit)):
+            raise
+        return {'ok': False, 'error': f"{type(e).__name__}: {str(e)}", 'log': traceback.format_exc()}
+
+
+def main():
+    max_jobs = int(sys.argv[1])
+    max_rss_mb = float(sys.argv[2])
+
+    # Keep the real stdout for results and send every other write to stderr
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    import manim  # noqa: F401 -- pay the import cost once per worker
+
+    protocol.write(json.dumps({'ready': True}) + '\n')
+    protocol.flush()
+
+    jobs_done = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        result = _render_job(json.loads(line))
+        jobs_done += 1
+        result['recycle'] = jobs_done >= max_jobs or bool(max_rss_mb and _rss_mb() > max_rss_mb)
+        protocol.write(json.dumps(result) + '\n')
+        protocol.flush()
+        if result['recycle']:
+            break
+
+
+class WarmRenderWorker:
+    """Parent-side handle for one warm worker process.
+
+    The process is started lazily, reused across renders, and replaced after
+    it asks to be recycled, crashes, or exceeds the render timeout.
+    """
+
+    def __init__(self, max_jobs: int, max_rss_mb: float, timeout: float, cwd=None):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.cwd = cwd
+        self._process = None
+        self._lines = None
+
+    def _start(self):
+        """Launch a worker and wait until it has finished importing Manim."""
+        self._process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), str(self.max_jobs), str(self.max_rss_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=self.cwd,
+            text=True,
+            encoding='utf-8',
+        )
+        self._lines = queue.Queue()
+        reader = threading.Thread(target=self._read_lines, args=(self._process, self._lines), daemon=True)
+        reader.start()
+
+        started_at = time.monotonic()
+        try:
+            message = self._next_message(self.timeout)
+        except queue.Empty:
+            message = None
+        if not message or not message.get('ready'):
+            self.stop()
+            raise RuntimeError("Manim worker failed to start")
+        print(f"[ManimWorker] Worker {self._process.pid} ready in {time.monotonic() - started_at:.2f}s")
+
+    @staticmethod
+    def _read_lines(process, lines):
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _next_message(self, timeout):
+        """Next message from the worker, or None once it has exited; raises queue.Empty on timeout."""
+        line = self._lines.get(timeout=timeout)
+        return json.loads(line) if line else None
+
+    def render(self, job: dict) -> dict:
+        """
+        Render a job on the warm worker.
+
+        Args:
+            job: Dictionary with 'source', 'script_path', 'media_dir', 'quality',
+                'format', 'scene_name' and optionally 'animation_range' as an
+                inclusive (start, end) pair of animation numbers
+
+        Returns:
+            Dictionary with 'ok' and either 'video_path' or 'error' and 'log'
+        """
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+
+        try:
+            self._process.stdin.write(json.dumps(job) + '\n')
+            self._process.stdin.flush()
+        except OSError:
+            # The worker exited between jobs; start a fresh one and resend
+            self.stop()
+            self._start()
+            self._process.stdin.write(json.dumps(job) + '\n')
+            self._process.stdin.flush()
+
+        try:
+            result = self._next_message(self.timeout)
+        except queue.Empty:
+            self.stop(kill=True)
+            return {'ok': False, 'error': f"Render exceeded {self.timeout:.0f}s timeout", 'log': ''}
+        if result is None:
+            process = self._process
+            self.stop()
+            return {'ok': False, 'error': f"Manim worker exited unexpectedly (code {process.returncode})", 'log': ''}
+
+        if result.get('recycle'):
+            print(f"[ManimWorker] Recycling worker {self._process.pid}")
+            self.stop()
+        return result
+
+    def stop(self, kill: bool = False):
+        """Shut the worker process down; kill=True skips the graceful exit for a hung worker."""
+        if self._process is None:
+            return
+        if kill:
+            self._process.kill()
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+
+if __name__ == '__main__':
+    main()
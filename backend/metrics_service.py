@@ -0,0 +1,164 @@
+import threading
+import time
+
+# Histogram buckets in seconds, spanning cache hits through multi-minute renders
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels.items():
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class StageTimer:
+    """Context manager that times one pipeline stage and records its outcome.
+
+    The outcome defaults to 'success' and becomes 'error' when the block
+    raises. Code that signals failure by return value can set `outcome`
+    (e.g. 'failure' or 'cache_hit') before the block exits.
+    """
+
+    def __init__(self, metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.outcome = 'success'
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.outcome = 'error'
+        self.metrics.observe_stage(self.stage, self.outcome, time.monotonic() - self.started_at)
+        return False
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}    # name -> {label tuple: value}
+        self._histograms = {}  # name -> {label tuple: [bucket counts, sum, count]}
+        self._gauges = {}      # name -> callable returning {label tuple: value}
+
+    def _declare(self, name: str, metric_type: str, help_text: str):
+        self._help.setdefault(name, help_text)
+        self._types.setdefault(name, metric_type)
+
+    def inc(self, name: str, help_text: str, amount: float = 1, **labels):
+        """Increment a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._declare(name, 'counter', help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, help_text: str, value: float, **labels):
+        """Record one observation in a histogram."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._declare(name, 'histogram', help_text)
+            series = self._histograms.setdefault(name, {})
+            state = series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def register_gauge(self, name: str, help_text: str, collect):
+        """
+        Register a gauge whose value is read at scrape time.
+
+        Args:
+            collect: Callable returning a number, or a dict mapping label dicts
+                (as tuples of (key, value) pairs) to numbers
+        """
+        with self._lock:
+            self._declare(name, 'gauge', help_text)
+            self._gauges[name] = collect
+
+    def time_stage(self, stage: str) -> StageTimer:
+        """Time a pipeline stage: `with metrics.time_stage('tts') as timer: ...`."""
+        return StageTimer(self, stage)
+
+    def observe_stage(self, stage: str, outcome: str, seconds: float):
+        """Record a finished pipeline stage in the shared stage histogram and counter."""
+        self.observe(
+            'pipeline_stage_duration_seconds',
+            'Duration of each video pipeline stage',
+            seconds, stage=stage, outcome=outcome
+        )
+        self.inc(
+            'pipeline_stage_total',
+            'Number of pipeline stage executions by outcome',
+            stage=stage, outcome=outcome
+        )
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(state[0]), state[1], state[2]) for key, state in series.items()}
+                for name, series in self._histograms.items()
+            }
+            gauges = dict(self._gauges)
+            help_texts = dict(self._help)
+            types = dict(self._types)
+
+        lines = []
+
+        def header(name):
+            lines.append(f"# HELP {name} {help_texts[name]}")
+            lines.append(f"# TYPE {name} {types[name]}")
+
+        for name in sorted(counters):
+            header(name)
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(dict(key))} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name)
+            for key, (bucket_counts, total, count) in sorted(histograms[name].items()):
+                labels = dict(key)
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts + [count]):
+                    bucket_labels = _format_labels({**labels, 'le': _format_value(float(bound))})
+                    lines.append(f"{name}_bucket{bucket_labels} {bucket_count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name in sorted(gauges):
+            try:
+                value = gauges[name]()
+            except Exception as e:
+                print(f"[Metrics] Gauge {name} failed: {e}")
+                continue
+            header(name)
+            if isinstance(value, dict):
+                for key, series_value in sorted(value.items()):
+                    lines.append(f"{name}{_format_labels(dict(key))} {_format_value(series_value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
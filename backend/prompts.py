@@ -248,3 +248,149 @@ VALIDATION INSTRUCTIONS:
 Now generate audio-synchronized Manim code for this visualization of the narration script.
 Use the word-level timing data to precisely align animations with the spoken narration.
 """
+
+
+# Extra guidance for error classes whose fix is not obvious from the traceback alone
+REPAIR_HINTS = {
+    'latex_missing': "LaTeX is not installed. Replace every MathTex, Tex, Matrix, DecimalNumber, Integer, "
+                     "Title and BulletedList with Text() or plain VMobjects.",
+    'validation': "The code was rejected by static checks before rendering; fix each listed problem.",
+    'timeout': "The render took too long. Reduce the number of mobjects and animations or simplify "
+               "expensive updaters and graphs while keeping the same total duration.",
+    'worker_crash': "The render process died without a Python error, usually from running out of memory. "
+                    "Use fewer and simpler mobjects, lower point counts on graphs and surfaces, and remove "
+                    "mobjects once they are no longer shown.",
+    'name_error': "A name is not defined in Manim Community Edition. Use only names from `from manim import *` "
+                  "or define them yourself (e.g. use MAROON instead of BROWN).",
+    'attribute_error': "A method or attribute does not exist on that Manim object in Manim Community Edition.",
+}
+
+
+def generate_manim_repair_prompt(failing_code: str, error_class: str, error: str, log: str,
+                                 script: str, timing_data: dict) -> str:
+    """
+    Generate a prompt asking for a minimal fix to Manim code that failed to render.
+
+    Args:
+        failing_code: The exact code that was rendered
+        error_class: Short failure class (see manim_service.classify_render_error)
+        error: One-line error message
+        log: Tail of the traceback or validator output
+        script: The narration script the animation must stay synchronized with
+        timing_data: Dictionary containing 'word_timings' and 'character_timings'
+    """
+    char_timings = timing_data.get('character_timings', {})
+    total_duration = char_timings.get('character_end_times', [10])[-1] if char_timings.get('character_end_times') else 10
+    hint = REPAIR_HINTS.get(error_class, "")
+
+    return f"""You are an expert at debugging Manim Community Edition code.
+
+The following Manim code failed to render. Fix it with the SMALLEST possible change.
+
+ERROR CLASS: {error_class}
+ERROR: {error}
+{hint}
+
+ERROR OUTPUT (tail):
+{log}
+
+FAILING CODE (line numbers in the error output refer to this code):
+```python
+{failing_code}
+```
+
+The animation narrates this script and must stay synchronized with it:
+"{script}"
+
+REQUIREMENTS:
+1. Keep the class name {settings.SCENE_CLASS_NAME}, the construct() method and `from manim import *`
+2. Change only what is needed to fix the error; keep every other animation, run_time and wait() as is
+3. **Total animation time must stay {total_duration:.2f} seconds**
+4. **DO NOT use MathTex, Tex, or any LaTeX-based objects** - use Text() instead
+5. **NEVER use negative wait times**
+6. Return ONLY the complete corrected Python code, no explanations or markdown
+"""
+
+
+def generate_quiz_prompt(prompt: str, narration_script: str = None) -> str:
+    """
+    Generate a prompt for a practice quiz on a topic.
+
+    Args:
+        prompt: The user's original question or topic
+        narration_script: Narration of the lesson video; when given, the quiz
+            covers what the video actually taught
+    """
+    grounding = ""
+    if narration_script:
+        grounding = f"""
+The learner has just watched a short lesson video with this narration. Base every question on what the
+narration covers, using its examples, numbers and terminology where possible:
+"{narration_script}"
+"""
+
+    return f"""Generate a quiz with 4-5 questions about the following topic: {prompt}
+{grounding}
+Requirements:
+1. Include a mix of question types:
+   - At least 1 step-by-step problem (for procedural topics like math/science)
+   - 1-2 multiple choice questions
+   - 1 fill-in-blank question
+
+2. For step-by-step questions:
+   - Break down the problem into 2-4 sequential stages
+   - Each stage should have:
+     * Clear prompt asking what to do
+     * Single correct answer
+     * Helpful hint
+     * Brief explanation
+
+3. For multiple choice questions:
+   - Provide 4 options
+   - Only one correct answer
+   - Include explanation
+
+4. For fill-in-blank questions:
+   - Can have multiple acceptable answers (synonyms)
+   - Include explanation
+
+5. Return ONLY valid JSON in this exact format (no markdown, no code blocks):
+{{
+  "questions": [
+    {{
+      "id": 1,
+      "type": "step-by-step",
+      "question_text": "Solve for x: 2x + 5 = 13",
+      "stages": [
+        {{
+          "stage_number": 1,
+          "prompt": "Subtract 5 from both sides. What is the result?",
+          "correct_answer": "2x = 8",
+          "hint": "Remember: what you do to one side, do to the other",
+          "explanation": "13 - 5 = 8, so we get 2x = 8"
+        }}
+      ]
+    }},
+    {{
+      "id": 2,
+      "type": "multiple-choice",
+      "question_text": "Which property was used in the first step?",
+      "options": ["Addition", "Subtraction", "Multiplication", "Division"],
+      "correct_answer": "Subtraction",
+      "explanation": "We subtracted 5 from both sides"
+    }},
+    {{
+      "id": 3,
+      "type": "fill-in-blank",
+      "question_text": "The equation 2x + 5 = 13 is called a _____ equation.",
+      "correct_answers": ["linear", "first-degree"],
+      "case_sensitive": false,
+      "explanation": "This is a linear equation because x has a degree of 1"
+    }}
+  ]
+}}
+
+Topic: {prompt}
+Difficulty: intermediate
+
+Remember: Return ONLY the JSON object, no other text or formatting."""
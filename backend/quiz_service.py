@@ -0,0 +1,311 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from settings import settings
+from manim_service import manim_service
+from gemini_service import gemini_service
+import json
+import os
+import re
+import threading
+
+
+class QuizAnswerError(Exception):
+    """Raised when an answer refers to a question or stage the quiz does not have."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def normalize_answer(answer: str) -> str:
+    """Collapse whitespace and lowercase, the matching rule for case-insensitive answers."""
+    return re.sub(r'\s+', ' ', answer.strip().lower())
+
+
+def compile_quiz(quiz_data: dict) -> dict:
+    """
+    Index a stored quiz for answer checking.
+
+    Questions are keyed by id and step-by-step stages by stage number, and
+    every accepted answer is normalized once here instead of on every check.
+    Questions without a usable id and stages without a stage number are
+    skipped, so one malformed item never breaks checks for the rest.
+
+    Returns:
+        Dictionary with 'quiz_id' and 'questions' ({id: {'type', 'explanation',
+        'answers', 'case_sensitive', 'stages', 'malformed_stages'}})
+    """
+    questions = {}
+    for question in quiz_data.get('questions', []):
+        if not isinstance(question, dict) or not isinstance(question.get('id'), (int, str)):
+            continue
+        question_type = question.get('type')
+        compiled = {
+            'type': question_type,
+            'explanation': question.get('explanation', ''),
+            'answers': frozenset(),
+            'case_sensitive': False,
+            'stages': {},
+            'malformed_stages': False,
+        }
+        if question_type == 'step-by-step':
+            stages = question.get('stages')
+            stages = stages if isinstance(stages, list) else []
+            for stage in stages:
+                if not isinstance(stage, dict) or not isinstance(stage.get('stage_number'), (int, str)):
+                    compiled['malformed_stages'] = True
+                    continue
+                compiled['stages'][stage['stage_number']] = {
+                    'answers': frozenset([normalize_answer(stage.get('correct_answer', ''))]),
+                    'explanation': stage.get('explanation', ''),
+                }
+        elif question_type == 'multiple-choice':
+            compiled['answers'] = frozenset([normalize_answer(question.get('correct_answer', ''))])
+        elif question_type == 'fill-in-blank':
+            compiled['case_sensitive'] = bool(question.get('case_sensitive', False))
+            if compiled['case_sensitive']:
+                compiled['answers'] = frozenset(answer.strip() for answer in question.get('correct_answers', []))
+            else:
+                compiled['answers'] = frozenset(normalize_answer(answer) for answer in question.get('correct_answers', []))
+        # The first question with an id wins, as the old linear scan did
+        questions.setdefault(question.get('id'), compiled)
+    return {'quiz_id': quiz_data.get('quiz_id'), 'questions': questions}
+
+
+def check_answer(quiz: dict, question_id, stage_number, user_answer: str) -> dict:
+    """
+    Check one answer against a compiled quiz.
+
+    Args:
+        quiz: Quiz from compile_quiz()
+        question_id: Question id as stored in the quiz
+        stage_number: Stage of a step-by-step question (ignored for other types)
+        user_answer: The submitted answer
+
+    Returns:
+        Dictionary with 'correct' and 'explanation'
+
+    Raises:
+        QuizAnswerError: The question or stage does not exist (or was malformed), or
+            stage_number is missing
+    """
+    question = quiz['questions'].get(question_id) if isinstance(question_id, (int, str)) else None
+    if question is None:
+        raise QuizAnswerError('Question not found', status=404)
+
+    if question['type'] == 'step-by-step':
+        if stage_number is None:
+            raise QuizAnswerError('stage_number required for step-by-step questions')
+        stage = question['stages'].get(stage_number) if isinstance(stage_number, (int, str)) else None
+        if stage is None and question['malformed_stages']:
+            raise QuizAnswerError('Stage cannot be checked: the question has malformed stages')
+        if stage is None:
+            raise QuizAnswerError('Stage not found', status=404)
+        return {'correct': normalize_answer(user_answer) in stage['answers'], 'explanation': stage['explanation']}
+
+    if question['type'] == 'fill-in-blank' and question['case_sensitive']:
+        correct = user_answer.strip() in question['answers']
+    else:
+        # Unknown question types have no accepted answers, so they are never correct
+        correct = normalize_answer(user_answer) in question['answers']
+    return {'correct': correct, 'explanation': question['explanation']}
+
+
+def grade_answers(quiz: dict, answers: list) -> dict:
+    """
+    Grade a whole submission with the same matching rules as check_answer().
+
+    A step-by-step question scores only when every one of its stages is
+    answered correctly; unanswered questions and stages count as incorrect.
+    If an item is answered more than once, the last answer counts.
+
+    Args:
+        quiz: Quiz from compile_quiz()
+        answers: List of {'question_id', 'stage_number' (step-by-step only), 'user_answer'}
+
+    Returns:
+        Dictionary with 'results' (one per submitted answer, in order: 'correct'
+        and 'explanation', or 'error'), 'questions' (per question: 'correct' and,
+        for step-by-step, 'stages' by number) and 'score' ('correct', 'total', 'percent')
+    """
+    results = []
+    graded = {}  # (question_id, stage_number or None) -> correct
+    for answer in answers:
+        answer = answer if isinstance(answer, dict) else {}
+        question_id = answer.get('question_id')
+        stage_number = answer.get('stage_number')
+        result = {'question_id': question_id}
+        if stage_number is not None:
+            result['stage_number'] = stage_number
+        user_answer = answer.get('user_answer')
+        if not isinstance(user_answer, str) or not user_answer.strip():
+            result['error'] = 'Missing answer'
+        else:
+            try:
+                result.update(check_answer(quiz, question_id, stage_number, user_answer))
+                question = quiz['questions'][question_id]
+                key = (question_id, stage_number if question['type'] == 'step-by-step' else None)
+                graded[key] = result['correct']
+            except QuizAnswerError as e:
+                result['error'] = str(e)
+        results.append(result)
+
+    questions = []
+    for question_id, question in quiz['questions'].items():
+        if question['type'] == 'step-by-step':
+            stages = {number: graded.get((question_id, number), False) for number in question['stages']}
+            questions.append({
+                'question_id': question_id,
+                'correct': bool(stages) and all(stages.values()),
+                'stages': [{'stage_number': number, 'correct': correct} for number, correct in stages.items()],
+            })
+        else:
+            questions.append({'question_id': question_id, 'correct': graded.get((question_id, None), False)})
+
+    correct = sum(1 for question in questions if question['correct'])
+    total = len(questions)
+    return {
+        'results': results,
+        'questions': questions,
+        'score': {'correct': correct, 'total': total, 'percent': round(100 * correct / total, 1) if total else 0.0},
+    }
+
+
+class QuizService:
+    """Stores quizzes as JSON under quiz_data/ and keeps the compiled ones in a bounded LRU.
+
+    Answer checks are dictionary lookups on the compiled quiz; the file is
+    only read the first time a quiz is checked after it leaves the cache.
+    A video's quiz is stored under its video id, so it is generated once
+    (normally by the pipeline, alongside the render) and then served as is.
+    """
+
+    def __init__(self, max_quizzes: int):
+        self.quiz_dir = manim_service.base_dir / settings.QUIZ_DIR
+        self.max_quizzes = max_quizzes
+        self._cache = OrderedDict()  # quiz_id -> compiled quiz
+        self._lock = threading.Lock()
+        self._generating = {}  # video_id -> [lock, waiters], so a video's quiz is generated once
+
+    def quiz_path(self, quiz_id: str) -> Path:
+        return self.quiz_dir / f'quiz_{quiz_id}.json'
+
+    def _remember(self, quiz_id: str, compiled: dict):
+        with self._lock:
+            self._cache[quiz_id] = compiled
+            self._cache.move_to_end(quiz_id)
+            while len(self._cache) > self.max_quizzes:
+                self._cache.popitem(last=False)
+
+    def save_quiz(self, quiz_id: str, quiz_record: dict) -> Path:
+        """Write a quiz (atomically) and cache its compiled form."""
+        self.quiz_dir.mkdir(exist_ok=True)
+        quiz_file = self.quiz_path(quiz_id)
+        temp_file = quiz_file.with_name(f'.tmp-{quiz_file.name}')
+        with open(temp_file, 'w') as f:
+            json.dump(quiz_record, f, indent=2)
+        os.replace(temp_file, quiz_file)
+        self._remember(quiz_id, dict(compile_quiz(quiz_record), record=quiz_record))
+        return quiz_file
+
+    def discard_quiz(self, quiz_id: str):
+        """Delete a stored quiz and drop it from the cache (no-op if it does not exist)."""
+        with self._lock:
+            self._cache.pop(quiz_id, None)
+        self.quiz_path(quiz_id).unlink(missing_ok=True)
+
+    def get_compiled(self, quiz_id: str):
+        """Return the compiled quiz, loading it from disk on a cache miss, or None if it does not exist."""
+        quiz_id = str(quiz_id)
+        if not re.fullmatch(r'[\w-]+', quiz_id):
+            return None
+        with self._lock:
+            compiled = self._cache.get(quiz_id)
+            if compiled is not None:
+                self._cache.move_to_end(quiz_id)
+                return compiled
+
+        quiz_file = self.quiz_path(quiz_id)
+        if not quiz_file.is_file():
+            return None
+        with open(quiz_file, 'r') as f:
+            quiz_record = json.load(f)
+        compiled = dict(compile_quiz(quiz_record), record=quiz_record)
+        self._remember(quiz_id, compiled)
+        return compiled
+
+    def get_quiz(self, quiz_id: str):
+        """Return a stored quiz as saved (with 'quiz_id' and 'questions'), or None."""
+        compiled = self.get_compiled(quiz_id)
+        return compiled['record'] if compiled else None
+
+    def get_video_quiz(self, video_id: str):
+        """
+        Return the quiz stored for a video, or None.
+
+        Prompt-only quizzes made before they had their own id prefix were named
+        like legacy video ids, so a stored quiz only counts if it records this video.
+        """
+        quiz_record = self.get_quiz(video_id)
+        if quiz_record is not None and quiz_record.get('video_id') != video_id:
+            return None
+        return quiz_record
+
+    @contextmanager
+    def _generation_lock(self, video_id: str):
+        with self._lock:
+            entry = self._generating.setdefault(video_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._generating[video_id]
+
+    def video_quiz(self, video_id: str, prompt: str, narration_script: str = None,
+                   cancelled: threading.Event = None) -> tuple[dict, bool]:
+        """
+        Return the quiz for a video, generating and storing it on first request.
+
+        Concurrent requests for the same video wait for a single generation.
+
+        Args:
+            video_id: Video the quiz belongs to (also its quiz id)
+            prompt: The user's original question or topic
+            narration_script: The video's narration, which the questions are grounded in
+            cancelled: Once set, the model is not called and a quiz it already
+                returned is not stored (e.g. the video failed)
+
+        Returns:
+            Tuple of (quiz record, True if it was generated by this call); the
+            record is None when generation was cancelled
+        """
+        with self._generation_lock(video_id):
+            quiz_record = self.get_video_quiz(video_id)
+            if quiz_record is not None:
+                return quiz_record, False
+            if cancelled is not None and cancelled.is_set():
+                return None, False
+
+            questions = gemini_service.generate_quiz(prompt, narration_script)
+            if cancelled is not None and cancelled.is_set():
+                print(f"[QuizService] Discarded quiz for video {video_id}: generation was cancelled")
+                return None, False
+            quiz_record = {
+                'quiz_id': video_id,
+                'video_id': video_id,
+                'prompt': prompt,
+                'questions': questions,
+                'created_at': datetime.now().strftime('%Y%m%d_%H%M%S'),
+            }
+            self.save_quiz(video_id, quiz_record)
+            print(f"[QuizService] Stored {len(questions)}-question quiz for video {video_id}")
+            return quiz_record, True
+
+
+quiz_service = QuizService(settings.QUIZ_CACHE_SIZE)
@@ -0,0 +1,105 @@
+from concurrent.futures import Future
+import itertools
+import queue
+import threading
+import time
+
+
+class RenderScheduler:
+    """Runs render jobs on a fixed number of render slots fed from a priority queue.
+
+    Each slot is a dispatcher thread that runs one render (one Manim process)
+    at a time, so a burst of requests queues up instead of forking an
+    unbounded number of renderers. Jobs with a lower priority value run
+    first; jobs with equal priority run in submission order.
+    """
+
+    def __init__(self, workers: int, run_job):
+        """
+        Args:
+            workers: Number of renders allowed to run at once
+            run_job: Callable executed on a slot as run_job(payload); its return
+                value resolves the job's future
+        """
+        self.workers = workers
+        self._run_job = run_job
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._render_time_total = 0.0
+        self._render_time_max = 0.0
+
+        for slot in range(workers):
+            thread = threading.Thread(target=self._dispatch, name=f"render-slot-{slot}", daemon=True)
+            thread.start()
+
+    def submit(self, payload: dict, priority: int = 0) -> Future:
+        """
+        Queue a render job.
+
+        The scheduler records 'queue_wait' and 'render_time' (seconds) on the
+        payload once the job has run.
+
+        Returns:
+            A Future resolving to the return value of run_job(payload)
+        """
+        future = Future()
+        self._queue.put((priority, next(self._sequence), time.monotonic(), payload, future))
+        return future
+
+    def _dispatch(self):
+        """Slot loop: take the next job off the queue and run it."""
+        while True:
+            priority, _, queued_at, payload, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started_at = time.monotonic()
+            queue_wait = started_at - queued_at
+            with self._lock:
+                self._running += 1
+            succeeded = False
+            try:
+                result = self._run_job(payload)
+                succeeded = True
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                render_time = time.monotonic() - started_at
+                payload['queue_wait'] = queue_wait
+                payload['render_time'] = render_time
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    if not succeeded:
+                        self._failed += 1
+                    self._queue_wait_total += queue_wait
+                    self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+                    self._render_time_total += render_time
+                    self._render_time_max = max(self._render_time_max, render_time)
+
+            if succeeded:
+                future.set_result(result)
+            print(f"[RenderScheduler] Job finished (priority {priority}): "
+                  f"waited {queue_wait:.2f}s, rendered in {render_time:.2f}s")
+
+    def stats(self) -> dict:
+        """Return queue depth, slot usage and queue-wait vs render-time totals."""
+        with self._lock:
+            completed = self._completed
+            return {
+                'workers': self.workers,
+                'queued': self._queue.qsize(),
+                'running': self._running,
+                'completed': completed,
+                'failed': self._failed,
+                'queue_wait_avg': self._queue_wait_total / completed if completed else 0.0,
+                'queue_wait_max': self._queue_wait_max,
+                'render_time_avg': self._render_time_total / completed if completed else 0.0,
+                'render_time_max': self._render_time_max,
+            }
@@ -14,18 +14,40 @@ class Settings:
     
     # Model Configs
     GEMINI_MODEL = "gemini-2.5-pro"
+    QUIZ_MODEL = "gemini-2.0-flash-exp"
     ELEVENLABS_MODEL = "eleven_turbo_v2_5"
+    ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_128"
+    MUX_AUDIO_BITRATE = "128k"  # AAC bitrate of the narration track muxed into final videos
     
     # ElevenLabs Voice Settings
     ELEVENLABS_STABILITY = 0.5      # 0.0-1.0: Voice stability
     ELEVENLABS_SIMILARITY = 0.75    # 0.0-1.0: Voice similarity
     ELEVENLABS_STYLE = 0.0          # 0.0-1.0: Style exaggeration
     ELEVENLABS_SPEED = 1.15          # 0.7-1.2: Speaking speed (1.0 = normal)
+    ESTIMATED_WORDS_PER_SECOND = 2.6  # Speaking rate at speed 1.0, used to estimate timings before TTS
+
+    # Start Manim code generation from estimated timings while TTS runs
+    SPECULATIVE_CODEGEN = os.getenv("SPECULATIVE_CODEGEN", "true").lower() == "true"
+
+    # Long-form Mode
+    LONG_FORM_CHAPTERS = int(os.getenv("LONG_FORM_CHAPTERS", "4"))          # Chapters requested from Gemini
+    LONG_FORM_MAX_CHAPTERS = int(os.getenv("LONG_FORM_MAX_CHAPTERS", "8"))  # Extra chapters are merged
+    CHAPTER_WORKERS = int(os.getenv("CHAPTER_WORKERS", "4"))                # Chapters produced at once
 
     # Manim Configuration
     MANIM_QUALITY = "ql"  # Low quality for faster rendering
     MANIM_FORMAT = "mp4"
     SCENE_CLASS_NAME = "GeneratedScene"
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))  # Manim processes at once
+    MANIM_WARM_WORKERS = os.getenv("MANIM_WARM_WORKERS", "true").lower() == "true"  # Reuse Manim processes
+    MANIM_WORKER_MAX_JOBS = int(os.getenv("MANIM_WORKER_MAX_JOBS", "25"))          # Recycle after N renders
+    MANIM_WORKER_MAX_RSS_MB = int(os.getenv("MANIM_WORKER_MAX_RSS_MB", "1500"))    # Recycle above this memory
+    MANIM_RENDER_TIMEOUT = int(os.getenv("MANIM_RENDER_TIMEOUT", "600"))           # Seconds before a render is killed
+    # Max parallel ranges per scene. Experimental: keep at 1 (off) until tests/test_segmented_render.py
+    # passes against the installed Manim and ffmpeg
+    RENDER_SEGMENTS = int(os.getenv("RENDER_SEGMENTS", "1"))
+    RENDER_SEGMENT_MIN_ANIMATIONS = int(os.getenv("RENDER_SEGMENT_MIN_ANIMATIONS", "4"))  # Animations per range
+    RENDER_REPAIR_ATTEMPTS = int(os.getenv("RENDER_REPAIR_ATTEMPTS", "2"))         # Gemini fixes after a failed render
     
     # File Paths
     OUTPUT_DIR = "manim_videos"
@@ -33,7 +55,53 @@ class Settings:
     SCRIPTS_DIR = "elevenlabs_scripts"
     AUDIO_DIR = "elevenlabs_audio"
     FINAL_VIDEOS_DIR = "final_videos"
+    CACHE_DIR = "cache"
+    RENDER_WORKSPACE_DIR = "render_workspaces"
+
+    # Cache Configuration
+    SCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("SCRIPT_CACHE_MAX_ENTRIES", "2000"))
+    SCRIPT_CACHE_TTL_SECONDS = int(os.getenv("SCRIPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+    MUX_AUDIO_CACHE_MAX_BYTES = int(os.getenv("MUX_AUDIO_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+    RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
     
+    # Job Queue Configuration
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))                # Pipelines running at once
+    JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", "8"))        # Jobs allowed to wait for a worker
+    JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))  # Keep finished jobs pollable
+
+    # HLS Packaging (runs in the background after the final mux)
+    HLS_ENABLED = os.getenv("HLS_ENABLED", "false").lower() == "true"
+    HLS_DIR = "hls"
+    HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+    HLS_RENDITIONS = os.getenv("HLS_RENDITIONS", "")  # Extra renditions below the source, e.g. "360:500k,240:250k"
+    HLS_WORKERS = int(os.getenv("HLS_WORKERS", "1"))  # Videos packaged at once
+    HLS_RETRY_SECONDS = int(os.getenv("HLS_RETRY_SECONDS", "3600"))  # Wait before re-packaging a failed video
+
+    # Gallery Previews (poster frame and thumbnail sprite, extracted when a video is finalized or shared)
+    THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "1"))    # Videos processed at once
+    POSTER_FORMAT = os.getenv("POSTER_FORMAT", "jpg")               # "jpg" or "webp" (needs ffmpeg with libwebp)
+    POSTER_WIDTH = int(os.getenv("POSTER_WIDTH", "640"))
+    POSTER_POSITION = float(os.getenv("POSTER_POSITION", "0.5"))    # Fraction of the video to take the poster from
+    SPRITE_TILE_WIDTH = int(os.getenv("SPRITE_TILE_WIDTH", "160"))
+    SPRITE_INTERVAL_SECONDS = float(os.getenv("SPRITE_INTERVAL_SECONDS", "5"))
+    SPRITE_MAX_FRAMES = int(os.getenv("SPRITE_MAX_FRAMES", "50"))   # Longer videos sample frames further apart
+    SPRITE_COLUMNS = int(os.getenv("SPRITE_COLUMNS", "10"))
+
+    # Video Manifest (SQLite index of finished videos behind /api/videos)
+    MANIFEST_DB = os.getenv("MANIFEST_DB", "manifest.db")
+    VIDEO_PAGE_SIZE = int(os.getenv("VIDEO_PAGE_SIZE", "24"))   # Gallery videos per page
+    VIDEO_PAGE_MAX = int(os.getenv("VIDEO_PAGE_MAX", "100"))    # Largest page a client may request
+
+    # Quizzes
+    QUIZ_DIR = "quiz_data"
+    QUIZ_CACHE_SIZE = int(os.getenv("QUIZ_CACHE_SIZE", "256"))  # Compiled quizzes kept in memory for answer checks
+    QUIZ_BATCH_MAX_ANSWERS = 200                                 # Answers accepted by one batch validation request
+
+    # Artifact Serving
+    ARTIFACT_SENDFILE_MODE = os.getenv("ARTIFACT_SENDFILE_MODE", "")  # "", "x-accel" (nginx) or "x-sendfile"
+    ARTIFACT_ACCEL_PREFIX = os.getenv("ARTIFACT_ACCEL_PREFIX", "/protected-artifacts")  # nginx internal location
+
     # Server Configuration
     PORT = 5000
     DEBUG = False
@@ -0,0 +1,38 @@
+import os
+
+from cache_service import ArtifactCache
+
+
+def _entry_bytes(tmp_path, key):
+    # meta.json's timestamp varies in length, so leave a few bytes of slack
+    return sum(f.stat().st_size for f in (tmp_path / key).iterdir()) + 8
+
+
+def test_lru_entry_is_evicted_past_max_entries(tmp_path):
+    cache = ArtifactCache('test', tmp_path, max_entries=2)
+    cache.put('a', {'f': 'x'})
+    cache.put('b', {'f': 'x'})
+    os.utime(tmp_path / 'a', (1, 1))
+    cache.put('c', {'f': 'x'})
+    assert cache.get('a') == (None, None)
+    assert cache.get('b')[0] is not None and cache.get('c')[0] is not None
+
+
+def test_replacing_an_entry_keeps_the_totals_exact(tmp_path):
+    cache = ArtifactCache('test', tmp_path)
+    cache.put('a', {'f': '12345'})
+    cache.max_bytes = 2 * _entry_bytes(tmp_path, 'a')
+    for _ in range(5):
+        cache.put('a', {'f': '12345'})
+    cache.put('b', {'f': '12345'})
+    assert cache.get('a')[0] is not None and cache.get('b')[0] is not None
+
+
+def test_totals_are_counted_from_disk_on_startup(tmp_path):
+    ArtifactCache('test', tmp_path).put('a', {'f': '12345'})
+    size = _entry_bytes(tmp_path, 'a')
+    cache = ArtifactCache('test', tmp_path, max_bytes=size + size // 2)
+    os.utime(tmp_path / 'a', (1, 1))
+    cache.put('b', {'f': '12345'})
+    assert cache.get('a') == (None, None)
+    assert cache.get('b')[0] is not None
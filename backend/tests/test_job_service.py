@@ -0,0 +1,31 @@
+import itertools
+
+from job_service import JobService
+
+
+def _finished_job(service):
+    job_id = service.submit(lambda report: report('script_ready', script_text='x') or {'success': True})
+    service.wait(job_id, timeout=5)
+    return job_id
+
+
+def test_events_stream_ends_after_done():
+    service = JobService(max_workers=1, max_queue_depth=4, retention_seconds=60)
+    job_id = _finished_job(service)
+    stages = [event['stage'] for _, event in service.iter_events(job_id)]
+    assert stages == ['started', 'script_ready', 'done']
+
+
+def test_resuming_after_done_repeats_done_and_ends():
+    service = JobService(max_workers=1, max_queue_depth=4, retention_seconds=60)
+    job_id = _finished_job(service)
+    # A reconnecting EventSource sends the 'done' event's id as Last-Event-ID
+    items = list(itertools.islice(service.iter_events(job_id, after=2, heartbeat=0.01), 5))
+    assert len(items) == 1
+    assert items[0][0] == 2 and items[0][1]['stage'] == 'done'
+
+
+def test_resuming_mid_stream_yields_the_remaining_events():
+    service = JobService(max_workers=1, max_queue_depth=4, retention_seconds=60)
+    job_id = _finished_job(service)
+    assert [index for index, _ in service.iter_events(job_id, after=0)] == [1, 2]
@@ -0,0 +1,70 @@
+import pytest
+
+from manifest_store import ManifestStore, fts_query
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ManifestStore(tmp_path / 'manifest.db')
+
+
+def _add(store, suffix, prompt='', script_text='', tags=None, shared=True):
+    video_id = f'20990101_00000{suffix}_aaaaaa'
+    store.record_video(video_id, created_at=float(suffix), final_video=f'{video_id}.mp4',
+                       prompt=prompt, script_text=script_text)
+    if shared:
+        store.share(video_id, tags)
+    return video_id
+
+
+def test_list_shared_pages_newest_first_with_a_cursor(store):
+    ids = [_add(store, n) for n in range(1, 6)]
+    _add(store, 6, shared=False)
+
+    rows, cursor = store.list_shared(2)
+    assert [row['video_id'] for row in rows] == [ids[4], ids[3]] and cursor == ids[3]
+    rows, cursor = store.list_shared(2, cursor=cursor)
+    assert [row['video_id'] for row in rows] == [ids[2], ids[1]] and cursor == ids[1]
+    rows, cursor = store.list_shared(2, cursor=cursor)
+    assert [row['video_id'] for row in rows] == [ids[0]] and cursor is None
+
+
+def test_list_shared_filters_by_any_tag(store):
+    a = _add(store, 1, tags=['math'])
+    _add(store, 2, tags=['biology'])
+    c = _add(store, 3, tags=['physics', 'math'])
+    rows, cursor = store.list_shared(10, tags=['math'])
+    assert [row['video_id'] for row in rows] == [c, a] and cursor is None
+    assert rows[0]['tags'] == ['math', 'physics']
+
+
+def test_fts_query_quotes_words_and_prefixes_the_last():
+    assert fts_query('Newton\'s "laws" of mo') == '"newton" "s" "laws" "of" "mo"*'
+    assert fts_query('  --  ') == ''
+
+
+def test_search_ranks_tags_above_prompt_above_narration(store):
+    if not store.search_enabled:
+        pytest.skip('SQLite without FTS5')
+    narration = _add(store, 1, script_text='a quick word on photosynthesis')
+    prompt = _add(store, 2, prompt='photosynthesis in leaves')
+    tagged = _add(store, 3, tags=['photosynthesis'])
+    _add(store, 4, prompt='photosynthesis unshared', shared=False)
+
+    rows, next_offset = store.search_shared('photosynth', 10)
+    assert [row['video_id'] for row in rows] == [tagged, prompt, narration] and next_offset is None
+    rows, next_offset = store.search_shared('photosynth', 2)
+    assert next_offset == 2
+    rows, _ = store.search_shared('photosynth', 2, offset=next_offset)
+    assert [row['video_id'] for row in rows] == [narration]
+
+
+def test_search_follows_unshare_and_text_updates(store):
+    if not store.search_enabled:
+        pytest.skip('SQLite without FTS5')
+    video_id = _add(store, 1, prompt='orbital mechanics')
+    store.record_video(video_id, final_video=f'{video_id}.mp4', prompt='tidal forces')
+    assert store.search_shared('orbital', 10) == ([], None)
+    assert [row['video_id'] for row in store.search_shared('tidal', 10)[0]] == [video_id]
+    store.unshare(video_id)
+    assert store.search_shared('tidal', 10) == ([], None)
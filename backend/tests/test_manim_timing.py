@@ -0,0 +1,93 @@
+from manim_timing import analyze_scene_timeline, fit_speculative_timing, normalize_scene_timing, plan_animation_segments
+
+STATIC_SCENE = '''
+from manim import *
+
+class GeneratedScene(Scene):
+    def construct(self):
+        title = Text("Hello")
+        self.play(Write(title), run_time=2)
+        self.wait(1)
+        for _ in range(2):
+            self.play(title.animate.shift(UP), run_time=0.5)
+        self.wait()
+'''
+
+DYNAMIC_SCENE = '''
+from manim import *
+
+class GeneratedScene(Scene):
+    def construct(self):
+        items = [Text("a"), Text("b"), Text("c")]
+        for item in items:
+            self.play(FadeIn(item), run_time=1)
+        self.wait(2)
+'''
+
+
+def test_static_timeline_total():
+    timeline = analyze_scene_timeline(STATIC_SCENE)
+    assert timeline['static']
+    assert timeline['total_duration'] == 5.0
+    assert len(timeline['events']) == 5
+
+
+def test_static_timeline_is_fitted_to_target():
+    code, report = normalize_scene_timing(STATIC_SCENE, target_duration=10.0)
+    assert report['scale'] == 2.0
+    assert report['final_duration'] == 10.0
+    assert analyze_scene_timeline(code)['total_duration'] == 10.0
+
+
+def test_dynamic_timeline_is_not_fitted_by_normalizer():
+    timeline = analyze_scene_timeline(DYNAMIC_SCENE)
+    assert not timeline['static']
+    assert timeline['total_duration'] is None
+    _, report = normalize_scene_timing(DYNAMIC_SCENE, target_duration=10.0)
+    assert report['scale'] is None
+
+
+def test_negative_waits_are_clamped():
+    code, report = normalize_scene_timing(STATIC_SCENE.replace('self.wait(1)', 'self.wait(1 - 3)'))
+    assert 'self.wait(max(0.1, 1 - 3))' in code
+    assert report['original_duration'] == 4.1
+
+
+def test_speculative_static_timeline_left_for_normalizer():
+    code, factor = fit_speculative_timing(STATIC_SCENE, audio_duration=10.0, estimated_duration=5.0)
+    assert factor is None
+    assert code == STATIC_SCENE
+
+
+def test_speculative_dynamic_timeline_rescaled_by_ratio():
+    code, factor = fit_speculative_timing(DYNAMIC_SCENE, audio_duration=15.0, estimated_duration=10.0)
+    assert factor == 1.5
+    assert 'run_time=1.5' in code
+    assert 'self.wait(3.0)' in code
+
+
+def _scene_with_animations(count, extra=''):
+    body = ''.join(f"        self.play(FadeIn(Text('{n}')), run_time=1)\n" for n in range(count))
+    return f"from manim import *\n\nclass GeneratedScene(Scene):\n    def construct(self):\n{extra}{body}"
+
+
+def test_segments_are_contiguous_and_cover_every_animation():
+    ranges = plan_animation_segments(_scene_with_animations(11), segments=3, min_animations=2)
+    assert ranges == [(0, 3), (4, 6), (7, 10)]
+
+
+def test_segment_count_is_capped_by_min_animations():
+    assert plan_animation_segments(STATIC_SCENE, segments=4, min_animations=2) == [(0, 1), (2, 4)]
+    assert plan_animation_segments(STATIC_SCENE, segments=2, min_animations=3) == []
+    assert plan_animation_segments(STATIC_SCENE, segments=1, min_animations=1) == []
+
+
+def test_scenes_with_dt_updaters_render_whole():
+    extra = "        dot = Dot()\n        dot.add_updater(lambda m, dt: m.shift(dt * RIGHT))\n"
+    assert plan_animation_segments(_scene_with_animations(8, extra), segments=2, min_animations=2) == []
+    assert plan_animation_segments(_scene_with_animations(8), segments=2, min_animations=2) == [(0, 3), (4, 7)]
+
+
+def test_non_static_timelines_render_whole():
+    assert not analyze_scene_timeline(DYNAMIC_SCENE)['static']
+    assert plan_animation_segments(DYNAMIC_SCENE, segments=2, min_animations=1) == []
@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip('google.genai')
+from quiz_service import QuizAnswerError, check_answer, compile_quiz, grade_answers, normalize_answer
+
+QUIZ = compile_quiz({
+    'quiz_id': 'q',
+    'questions': [
+        {'id': 1, 'type': 'multiple-choice', 'correct_answer': 'Four', 'explanation': 'sum'},
+        {'id': 2, 'type': 'fill-in-blank', 'correct_answers': ['H2O'], 'case_sensitive': True},
+        {'id': 3, 'type': 'step-by-step', 'stages': [
+            {'stage_number': 1, 'correct_answer': '2x = 8'},
+            {'stage_number': 2, 'correct_answer': 'x = 4'},
+        ]},
+    ],
+})
+
+
+def test_normalize_answer_collapses_whitespace_and_case():
+    assert normalize_answer('  2X   =\t8 ') == '2x = 8'
+
+
+def test_check_answer_applies_each_question_types_rule():
+    assert check_answer(QUIZ, 1, None, ' four ')['correct']
+    assert not check_answer(QUIZ, 2, None, 'h2o')['correct']
+    assert check_answer(QUIZ, 3, 2, 'X  = 4')['correct']
+    with pytest.raises(QuizAnswerError):
+        check_answer(QUIZ, 3, None, 'x = 4')
+    with pytest.raises(QuizAnswerError) as missing:
+        check_answer(QUIZ, 9, None, 'x')
+    assert missing.value.status == 404
+
+
+def test_grade_answers_scores_step_by_step_only_when_every_stage_is_right():
+    graded = grade_answers(QUIZ, [
+        {'question_id': 1, 'user_answer': 'three'},
+        {'question_id': 1, 'user_answer': 'four'},
+        {'question_id': 2, 'user_answer': 'H2O'},
+        {'question_id': 3, 'stage_number': 1, 'user_answer': '2x = 8'},
+        {'question_id': 9, 'user_answer': 'x'},
+        {'question_id': 2},
+    ])
+    assert graded['score'] == {'correct': 2, 'total': 3, 'percent': 66.7}
+    assert [q['correct'] for q in graded['questions']] == [True, True, False]
+    assert graded['questions'][2]['stages'] == [
+        {'stage_number': 1, 'correct': True}, {'stage_number': 2, 'correct': False}
+    ]
+    assert [r.get('error') for r in graded['results'][4:]] == ['Question not found', 'Missing answer']
+
+
+def test_malformed_stages_are_skipped_and_answered_with_a_client_error():
+    quiz = compile_quiz({'questions': [
+        {'id': 1, 'type': 'step-by-step', 'stages': [{'correct_answer': 'x'}, {'stage_number': 2, 'correct_answer': 'y'}]},
+        {'type': 'multiple-choice', 'correct_answer': 'a'},
+        'not a question',
+    ]})
+    assert list(quiz['questions']) == [1]
+    assert check_answer(quiz, 1, 2, 'y')['correct']
+    with pytest.raises(QuizAnswerError) as malformed:
+        check_answer(quiz, 1, 1, 'x')
+    assert malformed.value.status == 400
+
+
+def test_video_quizzes_ignore_prompt_quizzes_stored_under_the_same_id(tmp_path, monkeypatch):
+    from quiz_service import QuizService
+    service = QuizService(4)
+    monkeypatch.setattr(service, 'quiz_dir', tmp_path)
+    service.save_quiz('20250101_120000', {'quiz_id': '20250101_120000', 'video_id': None, 'questions': []})
+    assert service.get_video_quiz('20250101_120000') is None
+    service.save_quiz('20250101_120001', {'quiz_id': '20250101_120001', 'video_id': '20250101_120001', 'questions': []})
+    assert service.get_video_quiz('20250101_120001')['video_id'] == '20250101_120001'
@@ -0,0 +1,14 @@
+from manim_service import classify_render_error
+
+
+def test_timeout_is_classified_from_the_renderer_message():
+    assert classify_render_error('Render exceeded 600s timeout') == 'timeout'
+
+
+def test_worker_crash_is_not_a_timeout():
+    assert classify_render_error('Manim worker exited unexpectedly (code -9)') == 'worker_crash'
+
+
+def test_scene_output_mentioning_timeout_is_ignored():
+    log = 'Waiting for timeout...\nTraceback (most recent call last):\nNameError: name \'BROWN\' is not defined'
+    assert classify_render_error('manim exited with code 1', log) == 'name_error'
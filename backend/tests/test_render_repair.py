@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip('google.genai')
+pytest.importorskip('elevenlabs')
+import video_pipeline
+from video_pipeline import video_pipeline as pipeline
+
+TIMING = {'character_timings': {'character_end_times': [5.0]}}
+
+
+def _failed(error_class, tmp_path):
+    script = tmp_path / 'scene.py'
+    script.write_text('broken', encoding='utf-8')
+    return {'video_path': None, 'script_path': str(script), 'error_class': error_class,
+            'error': 'boom', 'log': 'Traceback'}
+
+
+@pytest.fixture
+def services(monkeypatch):
+    calls = {'renders': [], 'repairs': [], 'reports': []}
+
+    def repair(code, error_class, error, log, narration, timing):
+        calls['repairs'].append(error_class)
+        return f'fixed {len(calls["repairs"])}'
+
+    monkeypatch.setattr(video_pipeline.gemini_service, 'repair_manim_code', repair)
+    monkeypatch.setattr(video_pipeline.settings, 'RENDER_REPAIR_ATTEMPTS', 2)
+    return calls
+
+
+def _run(monkeypatch, calls, results):
+    def render(code, filename=None, target_duration=None):
+        calls['renders'].append(code)
+        return results.pop(0)
+    monkeypatch.setattr(video_pipeline.manim_service, 'render', render)
+    return pipeline._render_with_repair('original', 'vid', 'narration', TIMING,
+                                        lambda stage, **data: calls['reports'].append(stage))
+
+
+def test_repaired_code_is_rendered_until_it_succeeds(monkeypatch, tmp_path, services):
+    ok = {'video_path': '/tmp/v.mp4', 'script_path': None, 'error_class': None, 'error': None, 'log': ''}
+    result, code, attempts = _run(monkeypatch, services, [_failed('name_error', tmp_path), ok])
+    assert result is ok and code == 'fixed 1'
+    assert services['renders'] == ['original', 'fixed 1']
+    assert [a['attempt'] for a in attempts] == [1, 2] and 'repair_seconds' in attempts[0]
+    assert services['reports'] == ['repair_started']
+
+
+def test_repairs_stop_after_the_configured_attempts(monkeypatch, tmp_path, services):
+    results = [_failed('name_error', tmp_path) for _ in range(5)]
+    result, code, attempts = _run(monkeypatch, services, results)
+    assert result['video_path'] is None and len(attempts) == 3
+    assert services['repairs'] == ['name_error', 'name_error'] and code == 'fixed 2'
+
+
+@pytest.mark.parametrize('error_class', sorted(video_pipeline.UNREPAIRABLE_ERROR_CLASSES))
+def test_unrepairable_errors_are_not_sent_for_repair(monkeypatch, tmp_path, services, error_class):
+    result, code, attempts = _run(monkeypatch, services, [_failed(error_class, tmp_path)])
+    assert len(attempts) == 1 and code == 'original'
+    assert services['repairs'] == [] and services['reports'] == []
+
+
+def test_a_failed_repair_ends_the_loop(monkeypatch, tmp_path, services):
+    def broken_repair(*args):
+        raise RuntimeError('quota')
+    monkeypatch.setattr(video_pipeline.gemini_service, 'repair_manim_code', broken_repair)
+    result, code, attempts = _run(monkeypatch, services, [_failed('name_error', tmp_path)])
+    assert len(attempts) == 1 and attempts[0]['repair_error'] == 'RuntimeError: quota'
+    assert code == 'original'
@@ -0,0 +1,66 @@
+import importlib.util
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('ffmpeg') is None or importlib.util.find_spec('manim') is None,
+    reason='segmented renders need ffmpeg and Manim'
+)
+
+from manim_service import manim_service
+from settings import settings
+
+SCENE = '''
+from manim import *
+
+class GeneratedScene(Scene):
+    def construct(self):
+        square = Square(color=BLUE)
+        circle = Circle(color=RED).shift(RIGHT * 2)
+        self.play(Create(square), run_time=0.5)
+        self.play(square.animate.rotate(PI / 4), run_time=0.5)
+        self.wait(0.3)
+        self.play(FadeIn(circle), run_time=0.5)
+        self.play(circle.animate.shift(LEFT * 4), run_time=0.5)
+        self.wait(0.3)
+        self.play(FadeOut(square), FadeOut(circle), run_time=0.5)
+'''
+
+
+def _frame_hashes(path):
+    """Decoded-frame md5s, so two videos compare equal only if every frame is identical."""
+    output = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', str(path), '-map', '0:v', '-f', 'framemd5', '-'],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return [line.rsplit(',', 1)[-1].strip() for line in output.splitlines() if line and not line.startswith('#')]
+
+
+def _render(monkeypatch, segments):
+    monkeypatch.setattr(settings, 'RENDER_SEGMENTS', segments)
+    result = manim_service.render(SCENE)
+    assert result['video_path'], result['error']
+    return Path(result['video_path']), Path(result['script_path'])
+
+
+@pytest.mark.parametrize('warm_workers', [True, False])
+def test_segmented_render_is_frame_identical_to_a_whole_render(monkeypatch, warm_workers):
+    monkeypatch.setattr(settings, 'MANIM_WARM_WORKERS', warm_workers)
+    monkeypatch.setattr(settings, 'RENDER_SEGMENT_MIN_ANIMATIONS', 2)
+    # Both renders use the same source, so the render cache would hand the first video back
+    monkeypatch.setattr(manim_service.render_cache, 'get', lambda key: (None, None))
+    monkeypatch.setattr(manim_service.render_cache, 'put', lambda *args, **kwargs: None)
+
+    artifacts = []
+    try:
+        whole = _render(monkeypatch, 1)
+        artifacts.extend(whole)
+        segmented = _render(monkeypatch, 3)
+        artifacts.extend(segmented)
+        assert _frame_hashes(segmented[0]) == _frame_hashes(whole[0])
+    finally:
+        for path in artifacts:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from settings import settings
+from manim_service import manim_service
+from artifact_server import artifact_server
+from metrics_service import metrics
+import json
+import math
+import os
+import subprocess
+import threading
+
+
+class ThumbnailService:
+    """Extracts poster frames and thumbnail sprite sheets for final videos in the background.
+
+    Outputs sit next to the video in final_videos/ as <id>_poster.<ext>,
+    <id>_sprite.jpg and <id>_sprite.json (tile layout for scrubbing
+    previews). Each file is written under a temporary name and renamed into
+    place, so a listing never points at a half-written image.
+    """
+
+    def __init__(self):
+        self.output_dir = manim_service.final_videos_dir
+        self.executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+        self._pending = set()
+        self._lock = threading.Lock()
+        metrics.register_gauge('thumbnail_jobs', 'Videos waiting for or undergoing poster/sprite extraction',
+                               lambda: len(self._pending))
+
+    def poster_path(self, video_id: str) -> Path:
+        return self.output_dir / f"{video_id}_poster.{settings.POSTER_FORMAT}"
+
+    def sprite_path(self, video_id: str) -> Path:
+        return self.output_dir / f"{video_id}_sprite.jpg"
+
+    def sprite_info_path(self, video_id: str) -> Path:
+        return self.output_dir / f"{video_id}_sprite.json"
+
+    def schedule(self, video_id: str, video_path) -> bool:
+        """Queue poster and sprite extraction unless they exist or are already queued."""
+        if self.poster_path(video_id).exists() and self.sprite_info_path(video_id).exists():
+            return False
+        with self._lock:
+            if video_id in self._pending:
+                return False
+            self._pending.add(video_id)
+        self.executor.submit(self._generate_job, video_id, Path(video_path))
+        return True
+
+    def _generate_job(self, video_id: str, video_path: Path):
+        try:
+            self.generate(video_id, video_path)
+        except Exception as e:
+            print(f"[ThumbnailService] Thumbnails for {video_id} failed: {type(e).__name__}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(video_id)
+
+    def _run_ffmpeg(self, args: list, output_path: Path):
+        """Run ffmpeg into a temporary file, then move it into place."""
+        temp_path = output_path.with_name(f".tmp-{output_path.name}")
+        result = subprocess.run(
+            [manim_service._find_ffmpeg(), "-y", "-loglevel", "error"] + args + [str(temp_path)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            temp_path.unlink(missing_ok=True)
+            raise Exception(f"ffmpeg failed writing {output_path.name}: {result.stderr[-2000:]}")
+        os.replace(temp_path, output_path)
+
+    def generate(self, video_id: str, video_path: Path):
+        """Extract the poster frame and sprite sheet for one video."""
+        with metrics.time_stage('thumbnails'):
+            duration = manim_service.probe_duration(video_path)
+
+            # Manim scenes usually open on an empty frame and often fade out, so
+            # take the poster from the body of the video
+            poster_time = duration * settings.POSTER_POSITION
+            self._run_ffmpeg(
+                ["-ss", f"{poster_time:.3f}", "-i", str(video_path), "-frames:v", "1",
+                 "-vf", f"scale={settings.POSTER_WIDTH}:-2", "-q:v", "3"],
+                self.poster_path(video_id)
+            )
+
+            count = max(1, min(settings.SPRITE_MAX_FRAMES, math.ceil(duration / settings.SPRITE_INTERVAL_SECONDS)))
+            columns = min(count, settings.SPRITE_COLUMNS)
+            rows = math.ceil(count / columns)
+            interval = duration / count
+            self._run_ffmpeg(
+                ["-i", str(video_path), "-frames:v", "1", "-q:v", "5",
+                 "-vf", f"fps=1/{interval:.3f},scale={settings.SPRITE_TILE_WIDTH}:-2,tile={columns}x{rows}"],
+                self.sprite_path(video_id)
+            )
+
+            # Every Manim quality preset is 16:9
+            info_path = self.sprite_info_path(video_id)
+            temp_info = info_path.with_name(f".tmp-{info_path.name}")
+            temp_info.write_text(json.dumps({
+                'columns': columns,
+                'rows': rows,
+                'count': count,
+                'interval': round(interval, 3),
+                'tile_width': settings.SPRITE_TILE_WIDTH,
+                'tile_height': round(settings.SPRITE_TILE_WIDTH * 9 / 16 / 2) * 2,
+            }), encoding='utf-8')
+            os.replace(temp_info, info_path)
+            print(f"[ThumbnailService] Generated poster and {count}-frame sprite for {video_id}")
+
+    def urls(self, video_id: str) -> dict:
+        """
+        Preview URLs for the gallery, for whichever outputs exist.
+
+        Returns:
+            Dictionary with 'poster_url' and 'sprite' ({'url', 'columns', 'rows',
+            'count', 'interval', 'tile_width', 'tile_height'}) when available
+        """
+        entry = {}
+        poster_path = self.poster_path(video_id)
+        if poster_path.exists():
+            entry['poster_url'] = artifact_server.versioned_url(f'/api/final-video/{poster_path.name}', poster_path)
+        sprite_path = self.sprite_path(video_id)
+        info_path = self.sprite_info_path(video_id)
+        if sprite_path.exists() and info_path.exists():
+            try:
+                sprite = json.loads(info_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                return entry
+            sprite['url'] = artifact_server.versioned_url(f'/api/final-video/{sprite_path.name}', sprite_path)
+            entry['sprite'] = sprite
+        return entry
+
+
+thumbnail_service = ThumbnailService()
@@ -0,0 +1,480 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from gemini_service import gemini_service
+from elevenlabs_service import eleven_labs_service, estimate_word_timings, split_chapters
+from manim_service import manim_service, UNREPAIRABLE_ERROR_CLASSES
+from manim_timing import fit_speculative_timing
+from metrics_service import metrics
+from artifact_server import artifact_server
+from hls_service import hls_service
+from thumbnail_service import thumbnail_service
+from manifest_store import manifest_store
+from quiz_service import quiz_service
+from settings import settings
+import threading
+import time
+
+
+def _audio_duration(timing_data: dict) -> float:
+    """Total narration length from timing data (0 if unknown)."""
+    end_times = timing_data.get('character_timings', {}).get('character_end_times') or [0]
+    return end_times[-1]
+
+
+class VideoPipeline:
+    """Runs the script -> TTS -> code-gen -> render -> mux chain for one prompt."""
+
+    def __init__(self):
+        # TTS runs here while speculative code generation runs on the job's (or chapter's) own
+        # thread, so one slot per running job plus one per running chapter is enough
+        self.tts_executor = ThreadPoolExecutor(
+            max_workers=settings.JOB_WORKERS + settings.CHAPTER_WORKERS, thread_name_prefix="pipeline-tts"
+        )
+        # Long-form chapters run their TTS -> code-gen -> render -> mux chains here
+        self.chapter_executor = ThreadPoolExecutor(
+            max_workers=settings.CHAPTER_WORKERS, thread_name_prefix="pipeline-chapter"
+        )
+        # One quiz per running job, generated from the script while the video is produced
+        self.quiz_executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="pipeline-quiz")
+
+    def _record_manifest(self, video_id: str, final_video_path, **fields):
+        """Add a finished video to the manifest; a failure here never fails the job."""
+        try:
+            manifest_store.record_video(
+                video_id,
+                final_video=Path(final_video_path).name,
+                final_video_hash=artifact_server.content_hash(final_video_path),
+                **fields
+            )
+        except Exception as e:
+            print(f"[Pipeline] Warning: Could not record {video_id} in the manifest: {type(e).__name__}: {str(e)}")
+
+    def _render_with_repair(self, manim_code: str, video_id: str, narration_script: str,
+                            timing_data: dict, report) -> tuple[dict, str, list]:
+        """
+        Render the scene, asking Gemini to fix the code after each failed render.
+
+        The narration, audio and timings are reused across attempts; only the
+        scene code changes. At most RENDER_REPAIR_ATTEMPTS repairs are made.
+
+        Returns:
+            Tuple of (render_result, final_manim_code, attempts); each attempt records
+            'attempt', 'render_seconds', 'error_class' and, when a repair followed,
+            'repair_seconds' (or 'repair_error')
+        """
+        attempts = []
+        while True:
+            started_at = time.monotonic()
+            result = manim_service.render(manim_code, filename=video_id, target_duration=_audio_duration(timing_data))
+            attempt = {
+                'attempt': len(attempts) + 1,
+                'render_seconds': round(time.monotonic() - started_at, 3),
+                'error_class': result['error_class'],
+            }
+            attempts.append(attempt)
+
+            if len(attempts) > 1:
+                metrics.inc(
+                    'render_repairs_total', 'Automatic code repairs by the error they targeted and their result',
+                    error_class=attempts[-2]['error_class'], result='fixed' if result['video_path'] else 'failed'
+                )
+            if result['video_path'] or len(attempts) > settings.RENDER_REPAIR_ATTEMPTS \
+                    or result['error_class'] in UNREPAIRABLE_ERROR_CLASSES:
+                return result, manim_code, attempts
+
+            print(f"[Pipeline] Render attempt {attempt['attempt']} failed ({result['error_class']}), "
+                  f"requesting a repair...")
+            report('repair_started', attempt=attempt['attempt'], error_class=result['error_class'])
+            started_at = time.monotonic()
+            try:
+                failing_code = Path(result['script_path']).read_text(encoding='utf-8')
+                manim_code = gemini_service.repair_manim_code(
+                    failing_code, result['error_class'], result['error'], result['log'],
+                    narration_script, timing_data
+                )
+            except Exception as e:
+                attempt['repair_error'] = f"{type(e).__name__}: {str(e)}"
+                return result, manim_code, attempts
+            finally:
+                attempt['repair_seconds'] = round(time.monotonic() - started_at, 3)
+
+    def _produce_video(self, prompt: str, narration_script: str, video_id: str, report) -> dict:
+        """
+        Turn one narration script into a muxed video (steps 2-5 of run()).
+
+        Returns:
+            Dictionary with 'success' and, depending on how far it got,
+            'audio_error', 'video_error' or 'combine_error', 'audio_duration',
+            'script_path', 'manim_code', 'manim_code_path', 'render_attempts'
+            and 'final_video_path'
+        """
+        outcome = {'success': False}
+
+        def generate_audio():
+            result = eleven_labs_service.generate_audio_with_timestamps(narration_script, file_id=video_id)
+            report(
+                'audio_ready',
+                audio_url=f'/api/elevenlabs-audio/{Path(result[0]).name}',
+                audio_duration=_audio_duration(result[2])
+            )
+            # Encode the narration for the MP4 container now, off the critical path, so the
+            # final mux is a pure stream copy
+            audio_path, script_path, timing_data = result
+            return manim_service.prepare_mux_audio(audio_path), script_path, timing_data
+
+        # Step 2: Generate audio with timing data
+        print("[Pipeline] Step 2: Generating audio with timing data...")
+        audio_future = self.tts_executor.submit(generate_audio)
+
+        # Step 3: Generate Manim code, speculatively from estimated timings if enabled
+        code_error = None
+        manim_code = None
+        if settings.SPECULATIVE_CODEGEN:
+            estimated_timing = estimate_word_timings(narration_script)
+            print(f"[Pipeline] Step 3: Generating Manim code from estimated timings "
+                  f"({_audio_duration(estimated_timing):.2f}s) while audio is generated...")
+            try:
+                manim_code = gemini_service.generate_manim_code_from_script(prompt, narration_script, estimated_timing)
+            except Exception as e:
+                code_error = f"{type(e).__name__}: {str(e)}"
+
+        try:
+            audio_path, script_path, timing_data = audio_future.result()
+        except Exception as e:
+            outcome['audio_error'] = f"{type(e).__name__}: {str(e)}"
+            outcome['video_error'] = f"Cannot generate video: audio generation failed - {outcome['audio_error']}"
+            return outcome
+        outcome['audio_duration'] = _audio_duration(timing_data)
+        outcome['script_path'] = script_path
+
+        if settings.SPECULATIVE_CODEGEN:
+            if manim_code:
+                # A static timeline is fitted exactly when the render normalizes it; anything
+                # else is rescaled by the ratio of real to estimated narration length here
+                manim_code, factor = fit_speculative_timing(
+                    manim_code, outcome['audio_duration'], _audio_duration(estimated_timing)
+                )
+                if factor:
+                    print(f"[Pipeline] Scene timeline is not static, rescaling speculative timings by "
+                          f"{factor:.3f} to match audio")
+        else:
+            print("[Pipeline] Step 3: Generating Manim code...")
+            try:
+                manim_code = gemini_service.generate_manim_code_from_script(prompt, narration_script, timing_data)
+            except Exception as e:
+                code_error = f"{type(e).__name__}: {str(e)}"
+
+        if code_error:
+            outcome['video_error'] = code_error
+            return outcome
+        report('code_generated')
+
+        report('render_started')
+        print("[Pipeline] Step 4: Rendering video...")
+        render_result, manim_code, attempts = self._render_with_repair(
+            manim_code, video_id, narration_script, timing_data, report
+        )
+        video_path = render_result['video_path']
+        outcome['manim_code'] = manim_code
+        outcome['manim_code_path'] = render_result['script_path']
+        outcome['render_attempts'] = attempts
+        report('render_finished', rendered=bool(video_path), attempts=len(attempts))
+        if not video_path:
+            outcome['video_error'] = f"Failed to render video ({render_result['error_class']}: {render_result['error']})"
+            return outcome
+
+        # Step 5: Combine video and audio
+        print("[Pipeline] Step 5: Combining video and audio...")
+        final_video_path = manim_service.combine_video_audio(video_path, audio_path)
+        if not final_video_path:
+            print("[Pipeline] Warning: Failed to combine video and audio")
+            outcome['combine_error'] = 'Failed to combine video and audio'
+            return outcome
+
+        outcome['final_video_path'] = final_video_path
+        outcome['success'] = True
+        return outcome
+
+    def _chapter_duration(self, outcome: dict) -> float:
+        """Length of a muxed chapter, falling back to its narration length if it cannot be read."""
+        try:
+            return manim_service.probe_duration(outcome['final_video_path'])
+        except Exception as e:
+            print(f"[Pipeline] Warning: {str(e)}; placing the chapter by its narration length")
+            return outcome['audio_duration']
+
+    def _discard_chapter_artifacts(self, chapter_id: str):
+        """Delete every file a chapter of a failed long-form video may have written."""
+        paths = [
+            Path(settings.AUDIO_DIR) / f"audio_{chapter_id}.mp3",
+            Path(settings.AUDIO_DIR) / f"audio_{chapter_id}.m4a",
+            Path(settings.SCRIPTS_DIR) / f"script_{chapter_id}.txt",
+            manim_service.get_script_path(f"{chapter_id}.py"),
+            manim_service.get_video_path(f"{chapter_id}.mp4"),
+            manim_service.get_final_video_path(f"{chapter_id}.mp4"),
+        ]
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def _run_chapters(self, prompt: str, narration_script: str, video_id: str, response: dict, report) -> dict:
+        """
+        Produce every chapter of a long-form script concurrently and stitch them.
+
+        Each chapter runs its own TTS, code-gen, render and mux on the chapter
+        pool (renders still share the render scheduler). The muxed chapters are
+        then joined without re-encoding, so the total latency is roughly that of
+        the slowest chapter. If a chapter fails, the others are cancelled or
+        waited for, and every chapter's files are deleted.
+        """
+        chapters = split_chapters(narration_script)
+        full_script = "\n\n".join(chapter['script'] for chapter in chapters)
+        response['script_text'] = full_script
+        print(f"[Pipeline] Long-form mode: {len(chapters)} chapters")
+        report('chapters_planned', chapters=[chapter['title'] for chapter in chapters])
+
+        def chapter_report(index):
+            return lambda stage, **data: report(stage, chapter=index, **data)
+
+        futures = [
+            self.chapter_executor.submit(
+                self._produce_video,
+                f"{prompt} (chapter {index + 1} of {len(chapters)}: {chapter['title']})",
+                chapter['script'],
+                f"{video_id}_c{index + 1}",
+                chapter_report(index)
+            )
+            for index, chapter in enumerate(chapters)
+        ]
+
+        outcomes = []
+        for index, future in enumerate(futures):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {'success': False, 'video_error': f"{type(e).__name__}: {str(e)}"}
+            if not outcome['success']:
+                for pending in futures:
+                    pending.cancel()
+                # Chapters already running still write files, so let them finish before cleaning up
+                wait(futures)
+                for number in range(1, len(chapters) + 1):
+                    self._discard_chapter_artifacts(f"{video_id}_c{number}")
+                error = outcome.get('combine_error') or outcome.get('video_error') or outcome.get('audio_error')
+                response['video_error'] = f"Chapter {index + 1} failed: {error}"
+                response['success'] = False
+                return response
+            outcomes.append(outcome)
+
+        # Chapters are placed by their muxed length, which can differ from the narration's
+        # (the mux stops at the shorter stream and not every scene is fitted exactly)
+        durations = [self._chapter_duration(outcome) for outcome in outcomes]
+
+        print("[Pipeline] Stitching chapters...")
+        chapter_videos = [outcome['final_video_path'] for outcome in outcomes]
+        final_video_path = manim_service.concat_videos(chapter_videos, f"{video_id}.mp4")
+        for path in chapter_videos:
+            Path(path).unlink(missing_ok=True)
+        if not final_video_path:
+            response['combine_error'] = 'Failed to join chapter videos'
+            response['success'] = False
+            return response
+
+        script_path = Path(settings.SCRIPTS_DIR) / f"script_{video_id}.txt"
+        script_path.write_text(full_script, encoding='utf-8')
+
+        response['chapters'] = []
+        offset = 0.0
+        for chapter, outcome, duration in zip(chapters, outcomes, durations):
+            response['chapters'].append({
+                'title': chapter['title'],
+                'start_time': round(offset, 3),
+                'duration': round(duration, 3),
+                'script_text': chapter['script'],
+                'manim_code_url': f"/api/manim-code/{Path(outcome['manim_code_path']).name}",
+                'render_attempts': outcome['render_attempts'],
+            })
+            offset += duration
+
+        final_video_filename = Path(final_video_path).name
+        response['final_video_url'] = artifact_server.versioned_url(
+            f'/api/final-video/{final_video_filename}', final_video_path
+        )
+        response['script_url'] = f'/api/elevenlabs-script/{script_path.name}'
+        response['video_id'] = video_id
+        if hls_service.schedule(video_id, final_video_path):
+            response['hls_url'] = hls_service.master_url(video_id)
+        thumbnail_service.schedule(video_id, final_video_path)
+        self._record_manifest(
+            video_id, final_video_path,
+            prompt=prompt,
+            long_form=True,
+            script_file=script_path.name,
+            script_text=full_script,
+            duration=round(offset, 3),
+            chapters=[
+                {key: chapter[key] for key in ('title', 'start_time', 'duration', 'manim_code_url')}
+                for chapter in response['chapters']
+            ],
+        )
+
+        report('mux_done', final_video_url=response['final_video_url'], video_id=video_id)
+        print(f"[Pipeline] Final long-form video created: {final_video_filename}")
+        return response
+
+    def _run_single(self, prompt: str, narration_script: str, video_id: str, response: dict, report) -> dict:
+        """Produce a single-scene video (steps 2-5 of run()) and fill in the response."""
+        outcome = self._produce_video(prompt, narration_script, video_id, report)
+        for key in ('audio_error', 'video_error', 'combine_error', 'render_attempts'):
+            if key in outcome:
+                response[key] = outcome[key]
+        if not outcome['success']:
+            response['success'] = False
+            return response
+
+        final_video_filename = Path(outcome['final_video_path']).name
+        response['final_video_url'] = artifact_server.versioned_url(
+            f'/api/final-video/{final_video_filename}', outcome['final_video_path']
+        )
+        response['script_url'] = f"/api/elevenlabs-script/{Path(outcome['script_path']).name}"
+        response['manim_code_url'] = f"/api/manim-code/{Path(outcome['manim_code_path']).name}"
+        response['manim_code'] = outcome['manim_code']
+        response['video_id'] = video_id
+        if hls_service.schedule(video_id, outcome['final_video_path']):
+            response['hls_url'] = hls_service.master_url(video_id)
+        thumbnail_service.schedule(video_id, outcome['final_video_path'])
+        self._record_manifest(
+            video_id, outcome['final_video_path'],
+            prompt=prompt,
+            script_file=Path(outcome['script_path']).name,
+            script_text=narration_script,
+            manim_code_file=Path(outcome['manim_code_path']).name,
+            duration=round(outcome['audio_duration'], 3),
+        )
+
+        report('mux_done', final_video_url=response['final_video_url'], video_id=video_id)
+        print(f"[Pipeline] Final video created: {final_video_filename}")
+        return response
+
+    def _generate_quiz(self, prompt: str, narration_script: str, video_id: str, cancelled) -> dict:
+        """Generate and store the video's quiz from its narration (None if it was cancelled)."""
+        quiz_record, _ = quiz_service.video_quiz(video_id, prompt, narration_script, cancelled=cancelled)
+        if quiz_record is None:
+            return None
+        return {'quiz_id': quiz_record['quiz_id'], 'questions': quiz_record['questions']}
+
+    def _attach_quiz(self, response: dict, video_id: str, quiz_future, cancelled, report):
+        """
+        Add the quiz (or why it is missing) to a finished job's response; a failed quiz never fails the job.
+
+        The quiz is only published once the video exists, so a client is never
+        shown a quiz that is then deleted. When no video was produced the quiz
+        is abandoned instead: it is not waited for, and it is neither generated
+        (if still queued) nor kept.
+        """
+        if not response.get('success'):
+            self._abandon_quiz(video_id, quiz_future, cancelled)
+            return
+        try:
+            response['quiz'] = quiz_future.result()
+        except Exception as e:
+            response['quiz_error'] = f"{type(e).__name__}: {str(e)}"
+            print(f"[Pipeline] Warning: Quiz generation failed: {response['quiz_error']}")
+            return
+        # Background, so the job's last stage stays mux_done
+        report('quiz_ready', background=True, quiz=response['quiz'])
+
+    def _abandon_quiz(self, video_id: str, quiz_future, cancelled):
+        """Stop a failed video's quiz: skip or discard the generation, and delete it if it was already stored."""
+        cancelled.set()
+        if quiz_future.cancel():
+            return
+        # Runs on the quiz thread once generation ends (at once if it already has)
+        quiz_future.add_done_callback(lambda future: quiz_service.discard_quiz(video_id))
+
+    def run(self, prompt: str, pdf_path=None, report=None, long_form: bool = False) -> dict:
+        """
+        Generate a Manim video with synchronized narration.
+
+        Flow:
+        1. Generate narration script from user prompt (with optional PDF)
+        2. Generate audio with character-level timing data
+        3. Use script + timing to generate synchronized Manim code. With
+           SPECULATIVE_CODEGEN this starts from estimated timings in parallel
+           with step 2
+        4. Render video, fitting the scene's timeline to the real audio length;
+           failed renders are sent back to Gemini for a fix up to RENDER_REPAIR_ATTEMPTS times
+        5. Combine video and audio
+
+        A practice quiz grounded in the script is generated alongside steps
+        2-5 and stored under the video id. It is published (quiz_ready) only
+        once the video has been produced; a failed video's quiz is discarded.
+
+        In long-form mode the script is written as chapters and steps 2-5 run
+        for every chapter concurrently before the chapter videos are joined.
+
+        Args:
+            prompt: The user's question or topic
+            pdf_path: Optional Path to an uploaded PDF for additional context
+            report: Optional callback receiving progress events as report(stage, **data);
+                stages are script_ready, chapters_planned (long form), audio_ready,
+                code_generated, render_started, repair_started, render_finished,
+                quiz_ready (a background event, see JobService.submit) and mux_done;
+                chapter events carry a 'chapter' index
+            long_form: Generate a multi-chapter lesson instead of a 10-15 second clip
+
+        Returns:
+            Response dictionary; 'success' is True only when a final video was produced.
+            Long-form responses list 'chapters' with their titles and start offsets.
+            When a video was produced, 'quiz' ({'quiz_id', 'questions'}) or
+            'quiz_error' is included; a failed video gets no quiz
+        """
+        report = report or (lambda stage, **data: None)
+
+        try:
+            print(f"\n{'='*60}")
+            print(f"[Pipeline] Starting video generation for prompt: {prompt[:50]}...")
+            if pdf_path:
+                print(f"[Pipeline] With PDF file: {pdf_path.name}")
+            print(f"{'='*60}\n")
+
+            # Step 1: Generate narration script first (with PDF if provided)
+            print("[Pipeline] Step 1: Generating narration script...")
+            narration_script = eleven_labs_service.generate_script(prompt, pdf_path=pdf_path, long_form=long_form)
+            print(f"[Pipeline] Script generated: {narration_script[:100]}...\n")
+            report('script_ready', script_text=narration_script)
+
+            # One id names every artifact of this job, so concurrent jobs never collide
+            video_id = manim_service.generate_video_id()
+            response = {
+                'success': True,
+                'script_text': narration_script
+            }
+
+            # The quiz only needs the script, so it is written while the video is produced
+            quiz_cancelled = threading.Event()
+            quiz_future = self.quiz_executor.submit(
+                self._generate_quiz, prompt, narration_script, video_id, quiz_cancelled
+            )
+
+            try:
+                if long_form:
+                    response = self._run_chapters(prompt, narration_script, video_id, response, report)
+                else:
+                    response = self._run_single(prompt, narration_script, video_id, response, report)
+            except Exception:
+                self._abandon_quiz(video_id, quiz_future, quiz_cancelled)
+                raise
+            self._attach_quiz(response, video_id, quiz_future, quiz_cancelled, report)
+            return response
+
+        finally:
+            # Clean up temporary PDF file if it exists
+            if pdf_path and pdf_path.exists():
+                try:
+                    pdf_path.unlink()
+                    print(f"[Pipeline] Cleaned up temporary PDF: {pdf_path}")
+                except Exception as e:
+                    print(f"[Pipeline] Failed to clean up PDF: {str(e)}")
+
+
+video_pipeline = VideoPipeline()
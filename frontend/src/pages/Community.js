@@ -10,12 +10,15 @@ function Community() {
   const [expandedCode, setExpandedCode] = useState({});
   const [selectedTags, setSelectedTags] = useState([]);
   const [availableTags, setAvailableTags] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const videoRefs = useRef({});
   const audioRefs = useRef({});
 
+  // The server filters by tag, so refetch from the first page whenever the selection changes
   useEffect(() => {
     fetchVideos();
-  }, []);
+  }, [selectedTags]);
 
   // Sync audio with video for a specific video ID
   useEffect(() => {
@@ -57,26 +60,33 @@ function Community() {
     };
   }, [filteredVideos]);
 
+  const buildVideosUrl = (cursor) => {
+    const params = new URLSearchParams();
+    selectedTags.forEach(tag => params.append('tag', tag));
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const query = params.toString();
+    return `${API_BASE_URL}/api/videos${query ? `?${query}` : ''}`;
+  };
+
   const fetchVideos = async () => {
     try {
       setLoading(true);
       setError('');
 
-      const response = await fetch(`${API_BASE_URL}/api/videos`);
+      const response = await fetch(buildVideosUrl(null));
       const data = await response.json();
 
       if (data.success) {
         setVideos(data.videos);
         setFilteredVideos(data.videos);
+        setNextCursor(data.next_cursor || null);
 
-        // Extract all unique tags from videos
-        const tags = new Set();
-        data.videos.forEach(video => {
-          if (video.tags && Array.isArray(video.tags)) {
-            video.tags.forEach(tag => tags.add(tag));
-          }
-        });
-        setAvailableTags(Array.from(tags).sort());
+        // The first page carries every tag in use across the community
+        if (data.tags) {
+          setAvailableTags(data.tags.map(entry => entry.tag));
+        }
       } else {
         setError(data.error || 'Failed to load videos');
       }
@@ -88,19 +98,25 @@ function Community() {
     }
   };
 
-  // Filter videos when selected tags change
-  useEffect(() => {
-    if (selectedTags.length === 0) {
-      setFilteredVideos(videos);
-    } else {
-      const filtered = videos.filter(video => {
-        if (!video.tags || video.tags.length === 0) return false;
-        // Video must have at least one of the selected tags
-        return selectedTags.some(tag => video.tags.includes(tag));
-      });
-      setFilteredVideos(filtered);
+  const loadMoreVideos = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await fetch(buildVideosUrl(nextCursor));
+      const data = await response.json();
+
+      if (data.success) {
+        const combined = [...videos, ...data.videos];
+        setVideos(combined);
+        setFilteredVideos(combined);
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (err) {
+      console.error('Error loading more videos:', err);
+    } finally {
+      setLoadingMore(false);
     }
-  }, [selectedTags, videos]);
+  };
 
   const toggleTag = (tag) => {
     setSelectedTags(prev => {
@@ -185,7 +201,7 @@ function Community() {
         </div>
       )}
 
-      {!loading && !error && videos.length === 0 && (
+      {!loading && !error && videos.length === 0 && selectedTags.length === 0 && (
         <div className="empty-state">
           <p>No videos generated yet.</p>
           <p>Go to the home page to create your first animation!</p>
@@ -216,13 +232,13 @@ function Community() {
           </div>
           {selectedTags.length > 0 && (
             <p className="filter-results">
-              Showing {filteredVideos.length} of {videos.length} videos
+              Showing {filteredVideos.length} matching videos{nextCursor ? ' so far' : ''}
             </p>
           )}
         </div>
       )}
 
-      {!loading && !error && filteredVideos.length === 0 && videos.length > 0 && (
+      {!loading && !error && filteredVideos.length === 0 && selectedTags.length > 0 && (
         <div className="empty-state">
           <p>No videos match the selected tags.</p>
           <button onClick={clearFilters} className="clear-filters-btn">
@@ -316,6 +332,14 @@ function Community() {
           </div>
         ))}
       </div>
+
+      {!loading && !error && nextCursor && (
+        <div className="load-more-container">
+          <button onClick={loadMoreVideos} className="retry-button" disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load More'}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
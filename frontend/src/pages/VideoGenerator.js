@@ -6,6 +6,8 @@ import QuizContainer from '../components/Quiz/QuizContainer';
 import ConstellationLoading from '../components/ConstellationLoading';
 import './VideoGenerator.css';
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
 function VideoGenerator({ showSplash }) {
   const { currentLesson, updateLesson, clearLesson, setVideoLoading, setQuizLoading } = useLessonContext();
 
@@ -150,6 +152,34 @@ function VideoGenerator({ showSplash }) {
     }
   };
 
+  const showQuiz = (quiz) => {
+    updateLesson({
+      quizData: { questions: quiz.questions },
+      quizId: quiz.quiz_id,
+    });
+    setQuizLoading(false);
+  };
+
+  const pollVideoJob = async (statusUrl) => {
+    let quizShown = false;
+    while (true) {
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const res = await fetch(`${API_BASE_URL}${statusUrl}`);
+      const job = await res.json();
+      if (!res.ok) {
+        throw new Error(job.error || 'Lost track of video generation job');
+      }
+      // The pipeline writes the quiz while the video renders; show it as soon as it is published
+      if (!quizShown && job.partial && job.partial.quiz) {
+        showQuiz(job.partial.quiz);
+        quizShown = true;
+      }
+      if (job.status === 'succeeded' || job.status === 'failed') {
+        return job.result || { error: job.error };
+      }
+    }
+  };
+
   const handleGenerate = async () => {
     if (!prompt.trim()) {
       setError('Please enter a prompt');
@@ -170,14 +200,25 @@ function VideoGenerator({ showSplash }) {
       formData.append('pdf', pdfFile);
     }
 
-    // Start video generation
-    const videoPromise = fetch(`${API_BASE_URL}/api/generate-video`, {
+    // Start video generation: submit a job, then poll it until it finishes
+    const videoPromise = fetch(`${API_BASE_URL}/api/generate-video/jobs`, {
       method: 'POST',
       body: formData,
     })
       .then(res => res.json())
+      .then(job => {
+        if (!job.job_id) {
+          throw new Error(job.error || 'Failed to start video generation');
+        }
+        return pollVideoJob(job.status_url);
+      })
       .then(data => {
         console.log('Video API Response:', data);
+        if (data.quiz) {
+          showQuiz(data.quiz);
+        } else if (data.quiz_error) {
+          console.warn('Quiz generation failed:', data.quiz_error);
+        }
         if (data.success && data.final_video_url) {
           // Update lesson context with video data
           updateLesson({
@@ -197,36 +238,10 @@ function VideoGenerator({ showSplash }) {
       })
       .finally(() => {
         setVideoLoading(false);
-      });
-
-    // Start quiz generation
-    const quizPromise = fetch(`${API_BASE_URL}/api/generate-quiz`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ prompt: prompt }),
-    })
-      .then(res => res.json())
-      .then(data => {
-        console.log('Quiz API Response:', data);
-        if (data.success) {
-          // Update lesson context with quiz data
-          updateLesson({
-            quizData: { questions: data.questions },
-            quizId: data.quiz_id,
-          });
-        } else {
-          console.warn('Quiz generation failed:', data.error);
-        }
-      })
-      .catch(err => {
-        console.error('Quiz generation error:', err);
-      })
-      .finally(() => {
         setQuizLoading(false);
       });
 
-    // Wait for both (but they run independently)
-    await Promise.allSettled([videoPromise, quizPromise]);
+    await videoPromise;
   };
 
   // Determine if input section should be shown